@@ -0,0 +1,162 @@
+#Upload spooling and in-memory audio decoding for the stt model
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Callable, NamedTuple
+
+import numpy as np
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Whisper expects 16 kHz mono float32 samples
+SAMPLE_RATE = 16000
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_MB", "500")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+
+
+class SpooledUpload(NamedTuple):
+    path: Path
+    size: int
+    sha256: str  # digest of the raw uploaded bytes, prefixed with "raw:"
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES"""
+
+
+class AudioDecodeError(Exception):
+    """Raised when ffmpeg cannot decode an uploaded file"""
+
+
+def spool_upload(source: BinaryIO, suffix: str = "", max_bytes: int = MAX_UPLOAD_BYTES) -> SpooledUpload:
+    """Copy an upload to a temp file chunk by chunk, hashing it and enforcing the size cap.
+
+    The original (compressed) bytes are kept as-is; ffmpeg needs a seekable
+    file for containers such as m4a that put their index at the end.
+    """
+    size = 0
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        temp_path = Path(tmp.name)
+        try:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"Upload exceeds {max_bytes // (1024 * 1024)} MB")
+                digest.update(chunk)
+                tmp.write(chunk)
+        except Exception:
+            tmp.close()
+            temp_path.unlink(missing_ok=True)
+            raise
+    logger.debug(f"Spooled {size} bytes to {temp_path}")
+    return SpooledUpload(temp_path, size, "raw:" + digest.hexdigest())
+
+
+def decode_audio(path: Path, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Decode any ffmpeg-readable file straight to mono float32 PCM, without an intermediate WAV"""
+    if shutil.which(FFMPEG_BINARY) is None:
+        raise AudioDecodeError(f"{FFMPEG_BINARY} is not installed")
+    cmd = [
+        FFMPEG_BINARY, "-nostdin", "-loglevel", "error", "-threads", "0",
+        "-i", str(path),
+        "-f", "f32le", "-acodec", "pcm_f32le", "-ac", "1", "-ar", str(sample_rate),
+        "-",
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise AudioDecodeError(proc.stderr.decode(errors="replace").strip() or "ffmpeg failed")
+    return np.frombuffer(proc.stdout, dtype=np.float32)
+
+
+class PcmStreamDecoder:
+    """Raw little-endian PCM (16 kHz mono) arriving in arbitrary chunks, passed on as float32 samples"""
+
+    def __init__(self, dtype: str, on_samples: Callable[[np.ndarray], None]):
+        self.dtype = np.dtype(dtype)
+        self.on_samples = on_samples
+        self._rest = b""
+
+    async def feed(self, data: bytes):
+        data = self._rest + data
+        usable = len(data) - len(data) % self.dtype.itemsize
+        self._rest = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype=self.dtype)
+        if self.dtype.kind == "i":
+            samples = samples.astype(np.float32) / 32768.0
+        if len(samples):
+            self.on_samples(samples.astype(np.float32, copy=False))
+
+    async def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class FfmpegStreamDecoder:
+    """
+    Any ffmpeg-readable stream (e.g. WebM/Opus chunks from MediaRecorder) piped
+    through one long-running ffmpeg process and passed on as float32 samples
+    as soon as ffmpeg produces them.
+    """
+
+    def __init__(self, on_samples: Callable[[np.ndarray], None], sample_rate: int = SAMPLE_RATE):
+        self.on_samples = on_samples
+        self.sample_rate = sample_rate
+        self._process = None
+        self._reader = None
+
+    async def start(self):
+        if shutil.which(FFMPEG_BINARY) is None:
+            raise AudioDecodeError(f"{FFMPEG_BINARY} is not installed")
+        self._process = await asyncio.create_subprocess_exec(
+            FFMPEG_BINARY, "-loglevel", "error", "-i", "pipe:0",
+            "-f", "f32le", "-acodec", "pcm_f32le", "-ac", "1", "-ar", str(self.sample_rate), "pipe:1",
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+        )
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        pcm = PcmStreamDecoder("<f4", self.on_samples)
+        while True:
+            chunk = await self._process.stdout.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return
+            await pcm.feed(chunk)
+
+    async def feed(self, data: bytes):
+        self._process.stdin.write(data)
+        await self._process.stdin.drain()
+
+    async def close(self):
+        """Signal end of input and wait for ffmpeg to flush the remaining samples"""
+        if self._process is None:
+            return
+        if not self._process.stdin.is_closing():
+            self._process.stdin.close()
+        try:
+            await self._reader
+        finally:
+            if self._process.returncode is None:
+                try:
+                    await asyncio.wait_for(self._process.wait(), 5)
+                except asyncio.TimeoutError:
+                    self._process.kill()
+
+    def abort(self):
+        """Stop ffmpeg without waiting for its output, e.g. when the client has gone"""
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._process is not None and self._process.returncode is None:
+            self._process.kill()
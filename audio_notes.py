@@ -0,0 +1,309 @@
+#One-shot audio to note: transcription, summarization and saving run as one overlapped server-side job
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+
+from audio_io import SAMPLE_RATE, decode_audio
+from databases import async_session
+from metrics import AUDIO_NOTE_JOBS
+from models import Note
+from summurization import IncrementalSummary
+from transcript_segments import TranscriptSegmentIn, replace_segments, segment_to_dict, segments_text
+from transcription_jobs import QueueFullError, QUEUED, COMPLETED, FAILED
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Audio-to-note jobs running at once; each one keeps Whisper busy for the length of its recording
+AUDIO_NOTE_MAX_RUNNING = int(os.environ.get("AUDIO_NOTE_MAX_RUNNING", "4"))
+AUDIO_NOTE_JOB_TTL = int(os.environ.get("AUDIO_NOTE_JOB_TTL", "3600"))  # seconds to keep finished jobs
+
+# Stages a running job goes through, reported in "status" events
+TRANSCRIBING = "transcribing"
+SUMMARIZING = "summarizing"
+SAVING = "saving"
+
+
+class NoteOwnerError(Exception):
+    """Raised when the user a note is being made for no longer exists"""
+
+
+@dataclass
+class AudioNoteJob:
+    id: str
+    user_id: int
+    title: str
+    category: str
+    profile: Optional[str] = None
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    note_id: Optional[int] = None
+    error: Optional[str] = None
+    summary_error: Optional[str] = None
+    audio_seconds: Optional[float] = None
+    segments: int = 0
+    sections: int = 0
+    # Seconds spent in each stage; summary_tail is what summarization adds after the last segment
+    timings: Dict[str, float] = field(default_factory=dict)
+    events: List[dict] = field(default_factory=list)
+    _changed: asyncio.Condition = field(default_factory=asyncio.Condition, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in (COMPLETED, FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "note_id": self.note_id,
+            "error": self.error,
+            "summary_error": self.summary_error,
+            "audio_seconds": self.audio_seconds,
+            "segments": self.segments,
+            "sections": self.sections,
+            "timings": {name: round(seconds, 3) for name, seconds in self.timings.items()},
+            "profile": self.profile,
+        }
+
+    async def publish(self, event: str, data: dict):
+        async with self._changed:
+            self.events.append({"event": event, "data": data})
+            self._changed.notify_all()
+
+    async def set_status(self, status: str, event: str = "status", data: Optional[dict] = None):
+        """Change status and publish it in one step, so followers never see a finished job without its last event"""
+        async with self._changed:
+            self.status = status
+            if status in (COMPLETED, FAILED):
+                self.finished_at = time.time()
+            self.events.append({"event": event, "data": data if data is not None else {"job_id": self.id, "status": status}})
+            self._changed.notify_all()
+
+    async def follow(self) -> AsyncIterator[dict]:
+        """Every event of the job from the first one, then new ones as they happen, until it is done"""
+        sent = 0
+        while True:
+            async with self._changed:
+                while sent == len(self.events) and not self.done:
+                    await self._changed.wait()
+                pending = self.events[sent:]
+                finished = self.done
+            sent += len(pending)
+            for event in pending:
+                yield event
+            if finished and sent == len(self.events):
+                return
+
+
+class AudioNotePipeline:
+    """
+    Turns an uploaded recording into a saved note in one job. Segments are
+    handed from the Whisper thread to the event loop as they are decoded, and
+    fed to an IncrementalSummary that summarizes the transcript section by
+    section while the rest is still being transcribed. Once the last segment
+    is in, only the last section and the reduce are left, so a job takes
+    about as long as transcribing the recording. The note, its timed segments
+    and the summary are saved in one transaction.
+
+    A failed summary does not lose the transcript: the note is saved without
+    one and the error is reported in summary_error.
+    """
+
+    def __init__(self, stt_model, transcript_cache=None, max_running: int = AUDIO_NOTE_MAX_RUNNING,
+                 job_ttl: int = AUDIO_NOTE_JOB_TTL):
+        self.stt_model = stt_model
+        self.transcript_cache = transcript_cache
+        self.max_running = max(1, max_running)
+        self.job_ttl = job_ttl
+        self._jobs: Dict[str, AudioNoteJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def running(self) -> int:
+        return len(self._tasks)
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.job_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.done and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, file_path: Path, user_id: int, title: str, category: str, profile: Optional[str] = None,
+               cache_keys: Optional[Dict[str, List[str]]] = None) -> AudioNoteJob:
+        """
+        Start a job for an uploaded file, which is deleted once it is decoded.
+
+        cache_keys maps "text" and "segments" to transcript cache keys for the
+        upload; a cached segment list skips transcription altogether.
+        """
+        self._purge_expired()
+        if len(self._tasks) >= self.max_running:
+            AUDIO_NOTE_JOBS.inc("rejected")
+            file_path.unlink(missing_ok=True)
+            raise QueueFullError("Too many audio notes in progress")
+        job = AudioNoteJob(id=uuid.uuid4().hex, user_id=user_id, title=title, category=category, profile=profile)
+        job.events.append({"event": "status", "data": {"job_id": job.id, "status": job.status}})
+        self._jobs[job.id] = job
+        self._tasks[job.id] = asyncio.create_task(self._run(job, file_path, cache_keys or {}))
+        logger.info(f"Started audio note job {job.id} for user {user_id} ({len(self._tasks)} running)")
+        return job
+
+    def get(self, job_id: str) -> Optional[AudioNoteJob]:
+        return self._jobs.get(job_id)
+
+    async def _run(self, job: AudioNoteJob, file_path: Path, cache_keys: Dict[str, List[str]]):
+        start = time.perf_counter()
+        summary = IncrementalSummary(
+            user_id=job.user_id,
+            on_section=lambda index, text: job.publish("section", {"index": index, "summary": text}),
+        )
+        try:
+            await job.set_status(TRANSCRIBING)
+            segments = await self._transcribe(job, file_path, cache_keys, summary)
+            job.timings["transcription"] = time.perf_counter() - start
+
+            await job.set_status(SUMMARIZING)
+            summarized_at = time.perf_counter()
+            summarized_notes = ""
+            if summary.text:
+                try:
+                    summarized_notes = await summary.finish()
+                except Exception as e:
+                    summary.cancel()
+                    job.summary_error = f"{type(e).__name__}: {str(e)}"
+                    logger.error(f"Audio note job {job.id}: summary failed, saving the transcript alone: {str(e)}")
+            job.sections = summary.sections
+            job.timings["summary_tail"] = time.perf_counter() - summarized_at
+
+            await job.set_status(SAVING)
+            saved_at = time.perf_counter()
+            job.note_id = await self._save(job, segments, summarized_notes)
+            job.timings["save"] = time.perf_counter() - saved_at
+            job.timings["total"] = time.perf_counter() - start
+
+            AUDIO_NOTE_JOBS.inc(COMPLETED)
+            await job.set_status(COMPLETED, "done", {**job.to_dict(), "status": COMPLETED, "finished_at": time.time()})
+            logger.info(f"Audio note job {job.id} saved note {job.note_id} in {job.timings['total']:.1f}s "
+                        f"({job.timings['transcription']:.1f}s transcribing)")
+        except asyncio.CancelledError:
+            summary.cancel()
+            raise
+        except Exception as e:
+            summary.cancel()
+            job.error = f"{type(e).__name__}: {str(e)}"
+            AUDIO_NOTE_JOBS.inc(FAILED)
+            await job.set_status(FAILED, "error", {"job_id": job.id, "status": FAILED, "detail": job.error})
+            logger.error(f"Audio note job {job.id} failed: {str(e)}")
+        finally:
+            file_path.unlink(missing_ok=True)
+            self._tasks.pop(job.id, None)
+
+    async def _transcribe(self, job: AudioNoteJob, file_path: Path, cache_keys: Dict[str, List[str]],
+                          summary: IncrementalSummary) -> List[dict]:
+        """Segments of the recording as dicts, fed to summary and published as they are decoded"""
+        cached = self._cached_segments(cache_keys)
+        if cached is not None:
+            file_path.unlink(missing_ok=True)
+            logger.info(f"Audio note job {job.id}: transcript served from cache")
+            for item in cached:
+                await self._accept(job, item, summary)
+            return cached
+
+        audio = await run_in_threadpool(decode_audio, file_path)
+        file_path.unlink(missing_ok=True)
+        job.audio_seconds = round(len(audio) / SAMPLE_RATE, 2)
+        await job.publish("audio", {"seconds": job.audio_seconds})
+
+        # Whisper runs on its own thread and hands each segment over as soon as it is decoded
+        loop = asyncio.get_running_loop()
+        handoff: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def produce():
+            try:
+                for segment in self.stt_model.segments(audio, job.profile, "pipeline"):
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(handoff.put_nowait, segment)
+                loop.call_soon_threadsafe(handoff.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(handoff.put_nowait, e)
+
+        items = []
+        producer = loop.run_in_executor(None, produce)
+        try:
+            while True:
+                segment = await handoff.get()
+                if segment is done:
+                    break
+                if isinstance(segment, Exception):
+                    raise segment
+                item = segment_to_dict(segment)
+                items.append(item)
+                await self._accept(job, item, summary)
+        finally:
+            stop.set()
+        await producer
+
+        if self.transcript_cache is not None:
+            for key in cache_keys.get("text", []):
+                self.transcript_cache.set(key, segments_text(items))
+            for key in cache_keys.get("segments", []):
+                self.transcript_cache.set(key, json.dumps(items))
+        return items
+
+    def _cached_segments(self, cache_keys: Dict[str, List[str]]) -> Optional[List[dict]]:
+        if self.transcript_cache is None:
+            return None
+        for key in cache_keys.get("segments", []):
+            cached = self.transcript_cache.get(key)
+            if cached is not None:
+                return json.loads(cached)
+        return None
+
+    async def _accept(self, job: AudioNoteJob, item: dict, summary: IncrementalSummary):
+        job.segments += 1
+        summary.add(item["text"])
+        await job.publish("segment", item)
+
+    async def _save(self, job: AudioNoteJob, items: List[dict], summarized_notes: str) -> int:
+        segments = [TranscriptSegmentIn(**item) for item in items]
+        async with async_session() as session:
+            note = Note(
+                user_id=job.user_id,
+                title=job.title,
+                transcription=segments_text(segments),
+                summarized_notes=summarized_notes,
+                category=job.category,
+            )
+            session.add(note)
+            try:
+                await session.flush()  # assigns the note id
+                if segments:
+                    await replace_segments(session, note.id, segments)
+                await session.commit()
+            except IntegrityError:
+                # The user was deleted while the recording was transcribed
+                await session.rollback()
+                raise NoteOwnerError(f"User {job.user_id} not found")
+            return note.id
+
+    async def shutdown(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
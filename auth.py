@@ -0,0 +1,142 @@
+#Signed, expiring access tokens issued by /login and checked without a database lookup
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+from typing import Dict, NamedTuple, Optional
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+ACCESS_TOKEN_TTL = int(os.environ.get("ACCESS_TOKEN_TTL", "3600"))  # seconds
+# Without it, endpoints still accept a bare user_id from clients that do not send a token yet
+AUTH_REQUIRED = os.environ.get("AUTH_REQUIRED", "False").lower() == "true"
+
+
+class TokenError(Exception):
+    """Raised when a token is malformed, badly signed, signed with an unknown key or expired"""
+
+
+class TokenClaims(NamedTuple):
+    user_id: int
+    username: str
+    expires_at: int
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def load_signing_keys() -> Dict[str, bytes]:
+    """
+    Keys from AUTH_SECRET_KEYS as "kid:secret,kid:secret". The first key signs new
+    tokens and every key verifies, so a key is rotated by putting the new one first
+    and removing the old one once its tokens have expired.
+    """
+    keys = {}
+    for entry in os.environ.get("AUTH_SECRET_KEYS", "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        kid, sep, secret = entry.partition(":")
+        if not sep or not kid or not secret:
+            raise ValueError("AUTH_SECRET_KEYS entries must look like kid:secret")
+        keys[kid] = secret.encode("utf-8")
+    if not keys:
+        if AUTH_REQUIRED:
+            # Every replica would sign with its own random key and reject the others' tokens
+            raise ValueError("AUTH_REQUIRED is set but AUTH_SECRET_KEYS is empty; configure a signing key")
+        logger.warning("AUTH_SECRET_KEYS is not set; using a random key, tokens will not survive a restart")
+        keys["ephemeral"] = secrets.token_bytes(32)
+    return keys
+
+
+class TokenSigner:
+    """Issues and verifies HS256 JWTs, picking the verification key by the header's kid"""
+
+    def __init__(self, keys: Dict[str, bytes], ttl: int = ACCESS_TOKEN_TTL):
+        self.keys = keys
+        self.signing_kid = next(iter(keys))
+        self.ttl = ttl
+
+    def _sign(self, kid: str, signing_input: bytes) -> bytes:
+        return hmac.new(self.keys[kid], signing_input, hashlib.sha256).digest()
+
+    def issue(self, user_id: int, username: str) -> str:
+        now = int(time.time())
+        header = {"alg": "HS256", "typ": "JWT", "kid": self.signing_kid}
+        payload = {"sub": str(user_id), "username": username, "iat": now, "exp": now + self.ttl}
+        signing_input = ".".join(
+            _b64encode(json.dumps(part, separators=(",", ":")).encode("utf-8")) for part in (header, payload)
+        ).encode("ascii")
+        return signing_input.decode("ascii") + "." + _b64encode(self._sign(self.signing_kid, signing_input))
+
+    def verify(self, token: str) -> TokenClaims:
+        try:
+            header_b64, payload_b64, signature_b64 = token.split(".")
+            signing_input = f"{header_b64}.{payload_b64}".encode("ascii")
+            header = json.loads(_b64decode(header_b64))
+            signature = _b64decode(signature_b64)
+        except ValueError:
+            raise TokenError("Malformed token")
+        if not isinstance(header, dict):
+            raise TokenError("Malformed token")
+        kid = header.get("kid")
+        if header.get("alg") != "HS256" or kid not in self.keys:
+            raise TokenError("Token signed with an unknown key")
+        expected = self._sign(kid, signing_input)
+        if not hmac.compare_digest(signature, expected):
+            raise TokenError("Invalid token signature")
+        try:
+            payload = json.loads(_b64decode(payload_b64))
+            claims = TokenClaims(int(payload["sub"]), payload["username"], int(payload["exp"]))
+        except (ValueError, KeyError, TypeError):
+            raise TokenError("Malformed token")
+        if claims.expires_at <= time.time():
+            raise TokenError("Token has expired")
+        return claims
+
+
+# The process-wide signer
+token_signer = TokenSigner(load_signing_keys())
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+
+def get_token_claims(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)) -> Optional[TokenClaims]:
+    """
+    Dependency returning the caller's verified claims, or None when no token was sent
+    (rejected with 401 instead when AUTH_REQUIRED is set). A bad token is always a 401.
+    """
+    if credentials is None:
+        if AUTH_REQUIRED:
+            raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+        return None
+    try:
+        return token_signer.verify(credentials.credentials)
+    except TokenError as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+
+
+def authorize_user(claims: Optional[TokenClaims], user_id: int) -> bool:
+    """
+    Check the caller may act as user_id. Returns True when a token vouched for
+    the user, so the caller can skip its existence lookup; False means no token
+    was sent and the caller still has to check the user exists.
+    """
+    if claims is None:
+        return False
+    if claims.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Not allowed to act for this user")
+    return True
@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+API Benchmark
+
+Runs the FastAPI app in process against a throwaway SQLite database, with a
+fake Gemini backend (fixed latency plus jitter) and a small Whisper model, and
+measures throughput and p50/p99 latency for:
+
+  notes       POST /notes and GET /notes/{id}
+  lists       GET /users/{id}/notes (first page, full view, a deep page) with
+              10 / 10k / 100k notes for the user
+  transcribe  POST /transcribe on synthetic audio, reported as audio seconds
+              per wall second (the transcript cache is disabled)
+  study_guide POST /study-guide end to end, regenerated and stored
+  audio_note  POST /notes/from-audio?stream=true on synthetic audio, with the
+              time summarizing added after transcription finished
+
+Requests go through httpx's ASGI transport, so the numbers leave out the
+network and uvicorn but include routing, validation, the database and the
+models. Prints JSON; keep it per commit and pass it back with --compare.
+
+    python benchmarks/api.py --output before.json
+    python benchmarks/api.py --scenario lists --list-sizes 10,10000 --compare before.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+SCENARIOS = ("notes", "lists", "transcribe", "study_guide", "audio_note")
+SAMPLE_RATE = 16000
+
+
+# ----------------------
+# Fake Gemini backend
+# ----------------------
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Stands in for genai.GenerativeModel: waits latency +/- jitter seconds, then answers with filler text"""
+
+    def __init__(self, latency: float, jitter: float, words: int, seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.words = words
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+
+    def _text(self, prompt: str) -> str:
+        return " ".join(f"point{(len(prompt) + i) % 97}" for i in range(self.words))
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        self.calls += 1
+        if stream:
+            return self._stream(prompt)
+        await asyncio.sleep(self._delay())
+        return FakeResponse(self._text(prompt))
+
+    async def _stream(self, prompt: str):
+        words = self._text(prompt).split(" ")
+        pieces = [" ".join(words[i:i + 20]) for i in range(0, len(words), 20)]
+        await asyncio.sleep(self._delay() / 2)  # time to first piece
+        for piece in pieces:
+            await asyncio.sleep(self._delay() / 2 / len(pieces))
+            yield FakeResponse(piece)
+
+
+# ----------------------
+# Synthetic data
+# ----------------------
+
+def synthetic_wav(seconds: float, seed: int) -> bytes:
+    """16 kHz mono WAV of gliding tones over noise; the seed changes the samples so every upload hashes differently"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 150 + 60 * np.sin(2 * np.pi * rng.uniform(0.2, 0.5) * t)
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(2, 4) * t) ** 2  # syllable-like bursts
+    signal = envelope * np.sin(2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE) * 0.3
+    signal += rng.normal(0, 0.02, len(t))
+    pcm = (np.clip(signal, -1, 1) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(SAMPLE_RATE)
+        out.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def wav_seconds(data: bytes) -> float:
+    with wave.open(io.BytesIO(data)) as audio:
+        return audio.getnframes() / audio.getframerate()
+
+
+def note_text(words: int, rng: random.Random) -> str:
+    return " ".join(rng.choice(("cell", "energy", "membrane", "protein", "the", "of", "and", "is", "process")) for _ in range(words))
+
+
+def seed_user(engine, username: str) -> int:
+    from models import User
+    with engine.begin() as conn:
+        result = conn.execute(User.__table__.insert(), {
+            "username": username, "password": "x", "email": f"{username}@bench.local", "first_name": "Bench",
+            "last_name": "User", "age": 20, "major": "Biology", "created_at": datetime.utcnow(),
+        })
+        return result.inserted_primary_key[0]
+
+
+def seed_notes(engine, user_id: int, count: int, words: int, rng: random.Random, category: str = "Biology",
+               start: datetime = datetime(2024, 1, 1), batch: int = 5000):
+    """Insert count notes one second apart, oldest first, in batches of one statement each"""
+    from models import Note
+    for offset in range(0, count, batch):
+        rows = []
+        for i in range(offset, min(offset + batch, count)):
+            created_at = start + timedelta(seconds=i)
+            rows.append({"user_id": user_id, "title": f"Lecture {i}", "transcription": note_text(words, rng),
+                         "summarized_notes": note_text(words // 4, rng), "category": category,
+                         "created_at": created_at, "updated_at": created_at})
+        with engine.begin() as conn:
+            conn.execute(Note.__table__.insert(), rows)
+
+
+# ----------------------
+# Measurement
+# ----------------------
+
+def percentile(sorted_values, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+async def measure(call, requests: int, concurrency: int, warmup: int = 0) -> dict:
+    """
+    Await call(i) for i in range(requests), at most concurrency at a time, and
+    report throughput and latency. Warm-up calls get indexes after the measured ones.
+    """
+    for i in range(warmup):
+        await call(requests + i)
+
+    latencies, errors = [], 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        nonlocal errors
+        async with slots:
+            start = time.perf_counter()
+            response = await call(i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "wall_s": round(wall, 4),
+        "throughput_rps": round(requests / wall, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+
+
+# ----------------------
+# Scenarios
+# ----------------------
+
+async def bench_notes(client, engine, args, rng) -> dict:
+    user_id = seed_user(engine, "bench_notes")
+    created = []
+
+    async def create(i):
+        response = await client.post("/notes", json={
+            "user_id": user_id, "title": f"Note {i}", "transcription": note_text(args.note_words, rng),
+            "summarized_notes": note_text(args.note_words // 4, rng), "category": "Biology",
+        })
+        if response.status_code == 200:
+            created.append(response.json()["id"])
+        return response
+
+    results = {"create": await measure(create, args.requests, args.concurrency, args.warmup)}
+    results["read"] = await measure(lambda i: client.get(f"/notes/{created[i % len(created)]}"),
+                                    args.requests, args.concurrency, args.warmup)
+    return results
+
+
+async def bench_lists(client, engine, args, rng) -> dict:
+    from pagination import encode_cursor
+    results = {}
+    for size in args.list_sizes:
+        user_id = seed_user(engine, f"bench_list_{size}")
+        start = datetime(2024, 1, 1)
+        seed_started = time.perf_counter()
+        seed_notes(engine, user_id, size, args.note_words, rng, start=start)
+        # A cursor halfway down the list, as if the client had paged that far
+        middle = encode_cursor(start + timedelta(seconds=size // 2), 10 ** 12)
+        path = f"/users/{user_id}/notes"
+        results[str(size)] = {
+            "seed_s": round(time.perf_counter() - seed_started, 2),
+            "first_page": await measure(lambda i: client.get(path), args.requests, args.concurrency, args.warmup),
+            "first_page_full": await measure(lambda i: client.get(path, params={"view": "full"}),
+                                             args.requests, args.concurrency, args.warmup),
+            "deep_page": await measure(lambda i: client.get(path, params={"cursor": middle}),
+                                       args.requests, args.concurrency, args.warmup),
+        }
+    return results
+
+
+async def bench_transcribe(client, engine, args, rng) -> dict:
+    if args.audio_file:
+        clips = [Path(args.audio_file).read_bytes()]
+        suffix = Path(args.audio_file).suffix
+    else:
+        clips = [synthetic_wav(args.audio_seconds, args.seed + i)
+                 for i in range(args.transcribe_requests + args.warmup)]
+        suffix = ".wav"
+    audio_seconds = wav_seconds(clips[0]) if suffix == ".wav" else args.audio_seconds
+
+    def upload(i):
+        clip = clips[i % len(clips)]
+        return client.post("/transcribe", params={"profile": args.stt_profile} if args.stt_profile else None,
+                           files={"file": (f"clip{i}{suffix}", clip, "audio/wav")})
+
+    result = await measure(upload, args.transcribe_requests, args.transcribe_concurrency, args.warmup)
+    result["audio_seconds"] = round(audio_seconds * args.transcribe_requests, 2)
+    result["audio_seconds_per_wall_second"] = round(result["audio_seconds"] / result["wall_s"], 3)
+    return result
+
+
+def sse_events(body: str):
+    """(event, data) pairs of a server-sent event stream"""
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "data" in lines:
+            yield lines.get("event"), json.loads(lines["data"])
+
+
+async def bench_audio_note(client, engine, args, rng) -> dict:
+    user_id = seed_user(engine, "bench_audio_notes")
+    clips = [synthetic_wav(args.audio_seconds, args.seed + 1000 + i)
+             for i in range(args.transcribe_requests + args.warmup)]
+    timings = []
+
+    async def upload(i):
+        response = await client.post(
+            "/notes/from-audio",
+            params={"stream": "true", **({"profile": args.stt_profile} if args.stt_profile else {})},
+            data={"user_id": str(user_id), "category": "Biology"},
+            files={"file": (f"lecture{i}.wav", clips[i], "audio/wav")},
+        )
+        for event, data in sse_events(response.text):
+            if event == "done" and i < args.transcribe_requests:
+                timings.append(data["timings"])
+        return response
+
+    result = await measure(upload, args.transcribe_requests, args.transcribe_concurrency, args.warmup)
+    for stage in ("transcription", "summary_tail", "save", "total"):
+        values = sorted(timing[stage] for timing in timings)
+        if values:
+            result[f"{stage}_p50_ms"] = round(percentile(values, 0.50) * 1000, 3)
+    result["completed"] = len(timings)
+    return result
+
+
+async def bench_study_guide(client, engine, args, rng, fake) -> dict:
+    user_id = seed_user(engine, "bench_guides")
+    categories = [f"Topic {i}" for i in range(args.requests + args.warmup)]
+    for category in categories:
+        seed_notes(engine, user_id, args.guide_notes, args.note_words, rng, category=category)
+
+    calls_before = fake.calls
+    # Every category is new, so each request reads its notes, calls Gemini and stores the guide
+    generated = await measure(
+        lambda i: client.post("/study-guide", json={"category": categories[i], "user_id": user_id}),
+        args.requests, args.concurrency, args.warmup,
+    )
+    generated["llm_calls"] = fake.calls - calls_before
+    # Same categories again: the stored guides are still fresh
+    stored = await measure(
+        lambda i: client.post("/study-guide", json={"category": categories[i], "user_id": user_id}),
+        args.requests, args.concurrency,
+    )
+    return {"generated": generated, "stored": stored}
+
+
+# ----------------------
+# Runner
+# ----------------------
+
+def configure_environment(args, data_dir: str):
+    """Settings read at import time by databases.py, main.py and friends"""
+    os.environ.update({
+        "USE_SQLITE": "True",
+        "DB_ECHO": "False",  # SQL echo would dominate the timings
+        "DATA_DIR": data_dir,
+        "DATABASE_NAME": "bench.db",
+        "LOG_LEVEL": "WARNING",
+        "LOG_FILE": os.path.join(data_dir, "bench.log"),
+        "STT_MODEL_SIZE": args.whisper_model,
+        "TRANSCRIPT_CACHE_MEMORY_MB": "0",
+        "TRANSCRIPT_CACHE_DISK_MB": "0",
+        "GOOGLE_API_KEY": "benchmark",
+        "AUTH_REQUIRED": "False",
+        "NOTE_COMPRESSION": args.note_compression,
+        "LLM_MAX_CONCURRENCY": str(args.llm_concurrency),
+        "LLM_PER_USER_CONCURRENCY": str(args.llm_concurrency),
+    })
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+async def run(args, data_dir: str) -> dict:
+    configure_environment(args, data_dir)
+    import httpx
+    import main
+    from llm_client import llm_client
+
+    main.on_startup()
+
+    fake = FakeGenerativeModel(args.llm_latency, args.llm_jitter, args.llm_words, args.seed)
+    llm_client._model = lambda name: fake
+
+    rng = random.Random(args.seed)
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for scenario in args.scenario:
+                print(f"Running {scenario}...", file=sys.stderr)
+                if scenario == "notes":
+                    results[scenario] = await bench_notes(client, main.engine, args, rng)
+                elif scenario == "lists":
+                    results[scenario] = await bench_lists(client, main.engine, args, rng)
+                elif scenario == "transcribe":
+                    results[scenario] = await bench_transcribe(client, main.engine, args, rng)
+                elif scenario == "study_guide":
+                    results[scenario] = await bench_study_guide(client, main.engine, args, rng, fake)
+                elif scenario == "audio_note":
+                    results[scenario] = await bench_audio_note(client, main.engine, args, rng)
+    finally:
+        await main.on_shutdown()
+        main.engine.dispose()
+    return results
+
+
+def flatten(results: dict, prefix: str = ""):
+    """Yield (dotted name, measurement) for every measurement in a results tree"""
+    for name, value in results.items():
+        if isinstance(value, dict) and "p50_ms" in value:
+            yield prefix + name, value
+        elif isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{name}.")
+
+
+def compare(previous: dict, current: dict):
+    """Print p50/p99/throughput changes against an earlier report to stderr"""
+    before = dict(flatten(previous.get("results", {})))
+    print(f"Compared with {previous.get('commit', 'unknown')}:", file=sys.stderr)
+    for name, after in flatten(current["results"]):
+        if name not in before:
+            continue
+        changes = []
+        for key in ("p50_ms", "p99_ms", "throughput_rps"):
+            old, new = before[name].get(key), after[key]
+            if old:
+                changes.append(f"{key} {old} -> {new} ({(new - old) / old * 100:+.1f}%)")
+        print(f"  {name}: " + ", ".join(changes), file=sys.stderr)
+
+
+def parse_arguments():
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="Benchmark the API offline against SQLite")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests before each measurement")
+    parser.add_argument("--list-sizes", default="10,10000,100000", help="Comma separated notes per user for the lists scenario")
+    parser.add_argument("--note-words", type=int, default=200, help="Words in each seeded transcription")
+    parser.add_argument("--note-compression", default="none", help="NOTE_COMPRESSION for the run")
+    parser.add_argument("--whisper-model", default="tiny", help="Whisper model size or path")
+    parser.add_argument("--audio-seconds", type=float, default=30, help="Length of each synthetic clip")
+    parser.add_argument("--audio-file", help="Upload this file instead of synthetic audio")
+    parser.add_argument("--stt-profile", help="Decoding profile for /transcribe (default: the server's)")
+    parser.add_argument("--transcribe-requests", type=int, default=8)
+    parser.add_argument("--transcribe-concurrency", type=int, default=2)
+    parser.add_argument("--guide-notes", type=int, default=5, help="Notes per study-guide category")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="Fake Gemini seconds per call")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="Fake Gemini latency +/- seconds")
+    parser.add_argument("--llm-words", type=int, default=600, help="Words in each fake Gemini answer")
+    parser.add_argument("--llm-concurrency", type=int, default=16, help="LLM_MAX_CONCURRENCY for the run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON here instead of stdout")
+    parser.add_argument("--compare", help="Earlier JSON report to compare against")
+    args = parser.parse_args()
+    args.scenario = args.scenario or list(SCENARIOS)
+    args.list_sizes = [int(size) for size in args.list_sizes.split(",") if size.strip()]
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    with tempfile.TemporaryDirectory() as data_dir:
+        results = asyncio.run(run(args, data_dir))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), report)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Note Compression Benchmark
+
+Compares storing note text as plain TEXT (the schema without NOTE_COMPRESSION)
+against the compressed binary format from note_compression.py: compression
+ratio, encode/decode throughput, and the cost of writing and reading notes
+through a SQLite database. Prints JSON.
+
+    python benchmarks/compression.py --notes 200 --words 9000
+    python benchmarks/compression.py --sample-file transcript.txt
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+
+from note_compression import compress_text, decompress_text, zstandard  # noqa: E402
+
+
+def synthetic_transcript(words: int, rng: random.Random) -> str:
+    """Lecture-like text: a Zipf-distributed vocabulary, sentences of 8-25 words"""
+    vocabulary = [f"w{i}" for i in range(3000)]
+    common = ("the", "of", "and", "to", "a", "in", "is", "that", "so", "we", "this", "it", "cell", "energy", "process")
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    out, count = [], 0
+    while count < words:
+        length = rng.randint(8, 25)
+        sentence = [rng.choice(common) if rng.random() < 0.4 else rng.choices(vocabulary, weights)[0] for _ in range(length)]
+        out.append(" ".join(sentence).capitalize() + ".")
+        count += length
+    return " ".join(out)
+
+
+def timed(fn, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def codec_results(samples, configs, repeat: int):
+    raw_bytes = sum(len(sample.encode("utf-8")) for sample in samples)
+    results = []
+    for codec, level in configs:
+        encoded, encode_time = timed(lambda: [compress_text(sample, codec, level) for sample in samples], repeat)
+        _, decode_time = timed(lambda: [decompress_text(value) for value in encoded], repeat)
+        stored = sum(len(value) for value in encoded)
+        results.append({
+            "codec": codec,
+            "level": level,
+            "stored_bytes": stored,
+            "ratio": round(stored / raw_bytes, 4),
+            "encode_mb_s": round(raw_bytes / encode_time / 1e6, 1),
+            "decode_mb_s": round(raw_bytes / decode_time / 1e6, 1),
+        })
+    return raw_bytes, results
+
+
+def database_results(samples, configs):
+    """Insert every sample into a fresh SQLite table and read them all back, per format"""
+    results = []
+    for codec, level in [("plain", None)] + configs:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            engine = create_engine(f"sqlite:///{path}")
+            column_type = "TEXT" if codec == "plain" else "BLOB"
+            with engine.begin() as conn:
+                conn.execute(text(f"CREATE TABLE note (id INTEGER PRIMARY KEY, transcription {column_type} NOT NULL)"))
+
+            start = time.perf_counter()
+            rows = [{"id": i, "value": sample if codec == "plain" else compress_text(sample, codec, level)}
+                    for i, sample in enumerate(samples)]
+            with engine.begin() as conn:
+                conn.execute(text("INSERT INTO note (id, transcription) VALUES (:id, :value)"), rows)
+            write_time = time.perf_counter() - start
+
+            engine.dispose()  # cold-ish read: new connection, OS cache still warm
+            start = time.perf_counter()
+            with engine.connect() as conn:
+                values = [decompress_text(row[0]) for row in conn.execute(text("SELECT transcription FROM note"))]
+            read_time = time.perf_counter() - start
+            assert values == samples
+            engine.dispose()
+
+            results.append({
+                "codec": codec,
+                "level": level,
+                "write_ms": round(write_time * 1000, 2),
+                "read_ms": round(read_time * 1000, 2),
+                "file_bytes": os.path.getsize(path),
+            })
+    return results
+
+
+def parse_arguments():
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="Benchmark note text compression")
+    parser.add_argument("--notes", type=int, default=100, help="Number of synthetic notes")
+    parser.add_argument("--words", type=int, default=9000, help="Words per synthetic note (about an hour of speech)")
+    parser.add_argument("--sample-file", action="append", default=[], help="Use real transcripts instead (repeatable)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions for encode/decode")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON here instead of stdout")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    rng = random.Random(args.seed)
+    if args.sample_file:
+        samples = [Path(name).read_text(encoding="utf-8") for name in args.sample_file]
+    else:
+        samples = [synthetic_transcript(args.words, rng) for _ in range(args.notes)]
+
+    configs = [("zlib", 1), ("zlib", 6), ("zlib", 9)]
+    if zstandard is not None:
+        configs += [("zstd", 1), ("zstd", 3), ("zstd", 9), ("zstd", 19)]
+
+    raw_bytes, codecs = codec_results(samples, configs, args.repeat)
+    report = {
+        "notes": len(samples),
+        "raw_bytes": raw_bytes,
+        "codecs": codecs,
+        "sqlite": database_results(samples, configs),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
@@ -0,0 +1,192 @@
+#Small cache building blocks shared by the transcription and summary caches
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class CacheStats:
+    """Hit/miss counters for a cache"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def to_dict(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class LRUCache:
+    """In-process cache that evicts least recently used entries once max_bytes is exceeded.
+
+    With a ttl (seconds) entries also expire, and expired entries count as misses.
+    """
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[object], int] = len, ttl: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[str, object]" = OrderedDict()
+        self._sizes = {}
+        self._expires = {}
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, key: str):
+        del self._entries[key]
+        self._expires.pop(key, None)
+        self._total -= self._sizes.pop(key)
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None and self.ttl is not None and self._expires[key] < time.monotonic():
+                self._remove(key)
+                value = None
+            if value is not None:
+                self._entries.move_to_end(key)
+            self.stats.record(value is not None)
+            return value
+
+    def set(self, key: str, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = value
+            self._sizes[key] = size
+            if self.ttl is not None:
+                self._expires[key] = time.monotonic() + self.ttl
+            self._total += size
+            while self._total > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def info(self) -> dict:
+        return {**self.stats.to_dict(), "entries": len(self._entries), "bytes": self._total,
+                "max_bytes": self.max_bytes, "ttl": self.ttl}
+
+
+class DiskCache:
+    """Directory of text files keyed by hash, evicting least recently read files past max_bytes"""
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._total = sum(path.stat().st_size for path in self.directory.glob("*.txt"))
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.txt"
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            value = path.read_text(encoding="utf-8")
+            os.utime(path)  # mtime doubles as the LRU clock
+        except FileNotFoundError:
+            value = None
+        self.stats.record(value is not None)
+        return value
+
+    def set(self, key: str, value: str):
+        data = value.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = path.with_suffix(".tmp")
+        with self._lock:
+            if path.exists():
+                self._total -= path.stat().st_size
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+            self._total += len(data)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        files = sorted(self.directory.glob("*.txt"), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            if self._total <= self.max_bytes:
+                break
+            try:
+                size = path.stat().st_size
+                path.unlink()
+                self._total -= size
+            except FileNotFoundError:
+                continue
+
+    def info(self) -> dict:
+        return {**self.stats.to_dict(), "bytes": self._total, "max_bytes": self.max_bytes, "directory": str(self.directory)}
+
+
+class TieredCache:
+    """Looks keys up tier by tier (fastest first) and promotes hits into the faster tiers"""
+
+    def __init__(self, *tiers):
+        self.tiers = [tier for tier in tiers if tier is not None]
+        self.stats = CacheStats()
+
+    def get(self, key: str):
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster in self.tiers[:i]:
+                    faster.set(key, value)
+                self.stats.record(True)
+                return value
+        self.stats.record(False)
+        return None
+
+    def set(self, key: str, value):
+        for tier in self.tiers:
+            tier.set(key, value)
+
+    def info(self) -> dict:
+        return {
+            **self.stats.to_dict(),
+            "tiers": [{"type": type(tier).__name__, **tier.info()} for tier in self.tiers],
+        }
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one task whose result all callers share"""
+
+    def __init__(self):
+        self._calls = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield: a caller that disconnects must not cancel the call the others are waiting on
+        return await asyncio.shield(task)
@@ -1,7 +1,10 @@
-from sqlmodel import SQLModel, create_engine
+from sqlmodel import create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
 import os
 from pathlib import Path
 import logging
+from metrics import TimedQueuePool, TimedAsyncAdaptedQueuePool
 #file worked on by Jorge to create database models and setting up database
 
 # Set up logging
@@ -19,33 +22,50 @@ mysql_database = os.environ.get("MYSQLDATABASE", "railway")
 # Check if we should use SQLite for local development
 use_sqlite = os.environ.get("USE_SQLITE", "False").lower() == "true"
 
+# Log every SQL statement; for debugging only, it floods the logs in production
+DB_ECHO = os.environ.get("DB_ECHO", "False").lower() == "true"
+
 if use_sqlite:
     # SQLite configuration for local development and testing
     data_dir = Path(os.environ.get("DATA_DIR", "."))
     data_dir.mkdir(exist_ok=True)
     sqlite_file_name = os.path.join(data_dir, os.environ.get("DATABASE_NAME", "database.db"))
     db_url = f"sqlite:///{sqlite_file_name}"
+    async_db_url = f"sqlite+aiosqlite:///{sqlite_file_name}"
     connect_args = {"check_same_thread": False}
+    engine_args = {}
+    async_engine_args = {}
     logger.info(f"Using SQLite database at: {sqlite_file_name}")
 else:
     # MySQL configuration for production
     db_url = f"mysql+pymysql://{mysql_user}:{mysql_password}@{mysql_host}:{mysql_port}/{mysql_database}"
+    async_db_url = f"mysql+aiomysql://{mysql_user}:{mysql_password}@{mysql_host}:{mysql_port}/{mysql_database}"
     connect_args = {}
+    # Queue pools that time checkouts for the db_pool_checkout_seconds metric
+    engine_args = {"poolclass": TimedQueuePool}
+    # Async endpoints are limited by these connections rather than by worker threads
+    async_engine_args = {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "20")),
+        "pool_recycle": 1800,  # MySQL drops idle connections after wait_timeout
+        "pool_pre_ping": True,
+        "poolclass": TimedAsyncAdaptedQueuePool,
+    }
     logger.info(f"Using MySQL database at: {mysql_host}:{mysql_port}/{mysql_database}")
 
-# Create database engine
+# Create database engines: the sync engine runs migrations and scripts,
+# the async engine serves the API endpoints
 try:
-    engine = create_engine(db_url, echo=True, connect_args=connect_args)
-    logger.info("Database engine created successfully")
+    engine = create_engine(db_url, echo=DB_ECHO, connect_args=connect_args, **engine_args)
+    async_engine = create_async_engine(async_db_url, echo=DB_ECHO, **async_engine_args)
+    logger.info("Database engines created successfully")
 except Exception as e:
     logger.error(f"Failed to create database engine: {str(e)}")
     raise
 
-def create_db_and_tables():
-    """Create database tables if they don't exist"""
-    try:
-        SQLModel.metadata.create_all(engine)
-        logger.info("Database tables created successfully")
-    except Exception as e:
-        logger.error(f"Failed to create database tables: {str(e)}")
-        raise
+def async_session() -> AsyncSession:
+    """
+    New session on the async engine, used as `async with async_session() as session`.
+    Objects stay loaded after commit, since lazy refreshes cannot run outside an await.
+    """
+    return AsyncSession(async_engine, expire_on_commit=False)
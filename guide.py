@@ -1,53 +1,94 @@
 import os
-import google.generativeai as genai
-from sqlmodel import Session, select
-from models import Note
-from databases import engine
+import hashlib
+from sqlmodel import select, delete
+from models import Note, StudyGuide
+from databases import async_session
 from fastapi import HTTPException
 import logging
-from dotenv import load_dotenv
+from caching import SingleFlight
+from llm_client import llm_client
 #File worked on by Jorge Rdz
 
-# Load environment variables
-load_dotenv()
-
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Configure the Gemini API
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-
-# Check if the key was loaded successfully
-if not GOOGLE_API_KEY:
-    logger.error("API key not found. Ensure the 'GOOGLE_API_KEY' environment variable is set correctly.")
-else:
-    genai.configure(api_key=GOOGLE_API_KEY)
-    logger.info("Gemini API Key configured successfully.")
+# Deadline in seconds for generating one study guide
+GUIDE_TIMEOUT = float(os.getenv("GUIDE_TIMEOUT", "120"))
 
-def get_notes_by_category(category: str, user_id: int):
+async def get_notes_by_category(category: str, user_id: int):
     """Retrieve notes with the specified category belonging to the specified user"""
     try:
-        with Session(engine) as session:
-            notes = session.exec(
+        async with async_session() as session:
+            notes = (await session.exec(
                 select(Note).where(
                     (Note.category == category) & 
                     (Note.user_id == user_id)
                 )
-            ).all()
+            )).all()
             logger.info(f"Retrieved {len(notes)} notes for user {user_id} with category '{category}'")
             return notes
     except Exception as e:
         logger.error(f"Error retrieving notes by category and user_id: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-def generate_study_guide(category: str, user_id: int):
-    """Generate a study guide from notes with the specified category belonging to the user"""
-    # Get notes with the specified category belonging to the user
-    notes = get_notes_by_category(category, user_id)
-    
-    if not notes:
-        return f"No notes found for category: {category}"
-    
+# Concurrent requests for the same (user, category, fingerprint) share one generation
+guide_flight = SingleFlight()
+
+async def notes_fingerprint(category: str, user_id: int) -> str:
+    """Hash of the ids and updated_at of the user's notes in a category; changes whenever one is added, edited or deleted"""
+    async with async_session() as session:
+        rows = (await session.exec(
+            select(Note.id, Note.updated_at)
+            .where((Note.category == category) & (Note.user_id == user_id))
+            .order_by(Note.id)
+        )).all()
+    material = ";".join(f"{note_id}:{updated_at}" for note_id, updated_at in rows)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+async def lookup_study_guide(category: str, user_id: int):
+    """
+    Look up a stored guide for the user's category.
+
+    Returns (fingerprint, fresh, stale): fresh is the stored guide if it was
+    built from the current notes, stale is the most recent guide otherwise.
+    """
+    fingerprint = await notes_fingerprint(category, user_id)
+    async with async_session() as session:
+        stored = (await session.exec(
+            select(StudyGuide)
+            .where((StudyGuide.user_id == user_id) & (StudyGuide.category == category))
+            .order_by(StudyGuide.created_at.desc())
+        )).first()
+    if stored is None:
+        return fingerprint, None, None
+    if stored.fingerprint == fingerprint:
+        return fingerprint, stored.guide, None
+    return fingerprint, None, stored.guide
+
+async def save_study_guide(category: str, user_id: int, fingerprint: str, guide: str):
+    """Store a guide, replacing older guides for the same category"""
+    try:
+        async with async_session() as session:
+            await session.execute(
+                delete(StudyGuide).where((StudyGuide.user_id == user_id) & (StudyGuide.category == category))
+            )
+            session.add(StudyGuide(user_id=user_id, category=category, fingerprint=fingerprint, guide=guide))
+            await session.commit()
+    except Exception as e:
+        # The guide is still returned, it just gets regenerated next time
+        logger.error(f"Error saving study guide for user {user_id}, category '{category}': {str(e)}")
+
+async def generate_study_guide(category: str, user_id: int, fingerprint: str = None):
+    """Generate a study guide and store it under the notes fingerprint; repeat calls share in-flight work"""
+    if fingerprint is None:
+        fingerprint = await notes_fingerprint(category, user_id)
+    return await guide_flight.do(
+        f"{user_id}:{category}:{fingerprint}",
+        lambda: _generate_study_guide(category, user_id, fingerprint),
+    )
+
+def build_study_guide_prompt(notes):
+    """Combine the notes' transcriptions and summaries into the study guide prompt, or None if they are empty"""
     # Combine the transcriptions from all notes
     combined_content = ""
     for note in notes:
@@ -57,14 +98,10 @@ def generate_study_guide(category: str, user_id: int):
             combined_content += note.summarized_notes + "\n\n"
     
     if not combined_content.strip():
-        return f"No content found in notes for category: {category}"
+        return None
     
-    try:
-        # Initialize the Gemini model 
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        
-        # Create the prompt with clear instructions to create guide
-        prompt = f"""
+    # Create the prompt with clear instructions to create guide
+    return f"""
         Create a comprehensive study guide based on the following content. 
         Structure your response with these elements:
         1. Key Concepts: Bullet points of the main ideas and theories
@@ -79,16 +116,59 @@ def generate_study_guide(category: str, user_id: int):
         
         Make a well-organized study guide for this content.
         """
-        
+
+async def _generate_study_guide(category: str, user_id: int, fingerprint: str):
+    """Generate a study guide from notes with the specified category belonging to the user"""
+    # Get notes with the specified category belonging to the user
+    notes = await get_notes_by_category(category, user_id)
+    
+    if not notes:
+        return f"No notes found for category: {category}"
+    
+    prompt = build_study_guide_prompt(notes)
+    if prompt is None:
+        return f"No content found in notes for category: {category}"
+    
+    try:
         # Generate the study guide
-        response = model.generate_content(prompt)
+        guide = await llm_client.generate(prompt, user_id=user_id, timeout=GUIDE_TIMEOUT)
         
-        if not response or not hasattr(response, 'text'):
+        if not guide:
             return "Failed to generate study guide. Please try again later."
         
         logger.info(f"Successfully generated study guide for user {user_id}, category: {category}")
-        return response.text
+        await save_study_guide(category, user_id, fingerprint, guide)
+        return guide
     
     except Exception as e:
         logger.error(f"Error generating study guide with Gemini API: {str(e)}")
-        return f"Error generating study guide: {str(e)}" 
\ No newline at end of file
+        return f"Error generating study guide: {str(e)}"
+
+async def stream_study_guide(category: str, user_id: int):
+    """
+    Yield the study guide in pieces while Gemini generates it.
+
+    A stored guide that is still fresh is yielded whole; a newly generated
+    guide is stored once the stream completes. Gemini errors are raised.
+    """
+    fingerprint, fresh, _ = await lookup_study_guide(category, user_id)
+    if fresh is not None:
+        yield fresh
+        return
+
+    notes = await get_notes_by_category(category, user_id)
+    if not notes:
+        yield f"No notes found for category: {category}"
+        return
+
+    prompt = build_study_guide_prompt(notes)
+    if prompt is None:
+        yield f"No content found in notes for category: {category}"
+        return
+
+    pieces = []
+    async for piece in llm_client.stream(prompt, user_id=user_id, timeout=GUIDE_TIMEOUT):
+        pieces.append(piece)
+        yield piece
+    logger.info(f"Successfully streamed study guide for user {user_id}, category: {category}")
+    await save_study_guide(category, user_id, fingerprint, "".join(pieces))
@@ -0,0 +1,235 @@
+#Live transcription of audio streamed over a WebSocket, decoded from a rolling buffer
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+
+from audio_io import SAMPLE_RATE, AudioDecodeError, FfmpegStreamDecoder, PcmStreamDecoder
+from metrics import record_transcription
+from stt_model import Segment, decode_options
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# New audio between two decodes of the buffer; partial results lag the speaker by about this plus the decode time
+LIVE_STEP_SECONDS = float(os.environ.get("LIVE_STEP_SECONDS", "1.0"))
+# Audio not yet finalized is kept at most this long, which bounds how late a segment becomes final
+LIVE_MAX_BUFFER_SECONDS = float(os.environ.get("LIVE_MAX_BUFFER_SECONDS", "20"))
+# Finalized text passed back to Whisper as the prompt for the next window, in characters
+LIVE_PROMPT_CHARS = 200
+
+# Accepted values of ?format= on /ws/transcribe
+LIVE_FORMATS = ("pcm_s16le", "pcm_f32le", "ffmpeg")
+
+
+class LiveTranscriber:
+    """
+    Rolling-buffer transcription of a growing recording.
+
+    Whisper re-decodes the uncommitted tail of the audio each time enough new
+    audio has arrived, with word timestamps. Text is committed as soon as it
+    is stable: every segment except the last one Whisper returns is complete
+    (it only starts a new segment after finishing one), and within the last
+    one, the words that two decodes in a row agree on will not change any
+    more. Committed words become a "final" segment and their audio is cut
+    from the buffer, so a step only re-decodes the few seconds that are still
+    in doubt. If the buffer outgrows LIVE_MAX_BUFFER_SECONDS the oldest
+    segment is committed anyway, and a buffer with no speech in it is dropped.
+    """
+
+    def __init__(self, stt_model, profile: Optional[str] = None):
+        self.stt_model = stt_model
+        self.options = {**decode_options(profile), "condition_on_previous_text": False, "word_timestamps": True}
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.offset = 0.0  # seconds of audio before buffer[0], all of it committed
+        self.segments: List[Segment] = []  # committed so far
+        self.received_seconds = 0.0
+        self.processing_seconds = 0.0
+        self._new_samples = 0
+        self._tentative: List[Tuple[float, float, str]] = []  # uncommitted words of the previous decode
+        # Audio keeps arriving on the event loop while decode() runs on a worker thread
+        self._lock = threading.Lock()
+
+    def add(self, samples: np.ndarray):
+        with self._lock:
+            self.buffer = np.concatenate((self.buffer, samples))
+            self._new_samples += len(samples)
+            self.received_seconds += len(samples) / SAMPLE_RATE
+
+    @property
+    def due(self) -> bool:
+        return self._new_samples >= LIVE_STEP_SECONDS * SAMPLE_RATE
+
+    @property
+    def text(self) -> str:
+        return " ".join(segment.text for segment in self.segments)
+
+    def decode(self, final: bool = False) -> Tuple[List[Segment], List[Segment]]:
+        """Decode the buffer; returns (newly committed, partial) segments with times from the start of the recording"""
+        with self._lock:
+            audio = self.buffer
+            self._new_samples = 0
+        buffered = len(audio) / SAMPLE_RATE
+        if buffered == 0:
+            return [], []
+
+        start = time.perf_counter()
+        prompt = self.text[-LIVE_PROMPT_CHARS:] or None
+        segments, _ = self.stt_model.model.transcribe(audio, initial_prompt=prompt, **self.options)
+        # Words of each segment as (start, end, text), in seconds from the start of the recording
+        decoded = [[(self.offset + word.start, self.offset + min(word.end, buffered), word.word)
+                    for word in (segment.words or [])] for segment in segments]
+        decoded = [words for words in decoded if words]
+        self.processing_seconds += time.perf_counter() - start
+
+        words = [word for segment_words in decoded for word in segment_words]
+        if final:
+            committed = len(words)
+        else:
+            complete = sum(len(segment_words) for segment_words in decoded[:-1])
+            committed = max(complete, _agreed_prefix(self._tentative, words))
+            if committed == 0 and decoded and buffered > LIVE_MAX_BUFFER_SECONDS:
+                committed = len(decoded[0])
+        finals, rest = words[:committed], words[committed:]
+        self._tentative = rest
+
+        if final:
+            cut = buffered
+        elif finals:
+            cut = finals[-1][1] - self.offset
+        elif not words and buffered > LIVE_MAX_BUFFER_SECONDS:
+            cut = buffered - LIVE_STEP_SECONDS  # nothing said; keep only the tail, a word may be starting
+        else:
+            cut = 0.0
+        cut_samples = int(cut * SAMPLE_RATE)
+        if cut_samples > 0:
+            with self._lock:
+                self.buffer = self.buffer[cut_samples:]
+            self.offset += cut_samples / SAMPLE_RATE
+
+        committed_segments = [_words_segment(finals)] if finals else []
+        self.segments.extend(committed_segments)
+        return committed_segments, [_words_segment(rest)] if rest else []
+
+
+def _agreed_prefix(previous: List[Tuple[float, float, str]], current: List[Tuple[float, float, str]]) -> int:
+    """Number of leading words two consecutive decodes agree on"""
+    count = 0
+    for (_, _, before), (_, _, now) in zip(previous, current):
+        if before.strip().lower() != now.strip().lower():
+            break
+        count += 1
+    return count
+
+
+def _words_segment(words: List[Tuple[float, float, str]]) -> Segment:
+    return Segment(words[0][0], words[-1][1], "".join(word for _, _, word in words).strip())
+
+
+def segment_event(kind: str, segment: Segment) -> dict:
+    return {"type": kind, "start": round(segment.start, 2), "end": round(segment.end, 2), "text": segment.text}
+
+
+async def _send_error(websocket: WebSocket, detail: str, code: int):
+    """Tell the client what went wrong and close, unless it is already gone"""
+    with contextlib.suppress(Exception):
+        await websocket.send_json({"type": "error", "detail": detail})
+        await websocket.close(code=code)
+
+
+async def run_live_session(websocket: WebSocket, transcriber: LiveTranscriber, audio_format: str):
+    """
+    Receive binary audio messages until the client sends {"type": "end"} or
+    disconnects, decoding as audio arrives. Sends "partial" and "final"
+    segment events, then a "done" event with the whole transcript.
+    """
+    wake = asyncio.Event()
+    ended = asyncio.Event()
+    disconnected = False
+
+    def on_samples(samples: np.ndarray):
+        transcriber.add(samples)
+        if transcriber.due:
+            wake.set()
+
+    if audio_format == "ffmpeg":
+        decoder = FfmpegStreamDecoder(on_samples)
+        try:
+            await decoder.start()
+        except AudioDecodeError as e:
+            logger.error(f"Could not start live audio decoder: {str(e)}")
+            await _send_error(websocket, "Audio decoding is unavailable", 1011)
+            return
+    else:
+        decoder = PcmStreamDecoder("<i2" if audio_format == "pcm_s16le" else "<f4", on_samples)
+
+    async def receive():
+        nonlocal disconnected
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    disconnected = True
+                    return
+                if message.get("bytes"):
+                    await decoder.feed(message["bytes"])
+                elif message.get("text"):
+                    try:
+                        command = json.loads(message["text"])
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(command, dict) and command.get("type") == "end":
+                        return
+        finally:
+            await decoder.close()  # ffmpeg hands over what it still buffers
+            ended.set()
+            wake.set()
+
+    receiver = asyncio.create_task(receive())
+    try:
+        while True:
+            await wake.wait()
+            wake.clear()
+            final = ended.is_set()
+            if final and disconnected:
+                return  # nobody left to send the rest to
+            if not final and not transcriber.due:
+                continue
+            finals, partial = await run_in_threadpool(transcriber.decode, final)
+            for segment in finals:
+                await websocket.send_json(segment_event("final", segment))
+            if partial:
+                await websocket.send_json({**segment_event("partial", partial[0]),
+                                           "end": round(partial[-1].end, 2),
+                                           "text": " ".join(segment.text for segment in partial)})
+            if final:
+                break
+        await receiver  # surfaces a failed decoder
+        await websocket.send_json({"type": "done", "text": transcriber.text,
+                                   "duration": round(transcriber.received_seconds, 2)})
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.info("Live transcription client disconnected")
+    except (AudioDecodeError, OSError) as e:
+        logger.error(f"Live transcription audio error: {str(e)}")
+        if not disconnected:
+            await _send_error(websocket, "Could not decode the audio stream", 1003)
+    except Exception as e:
+        # Whisper failing on the buffer, or a send racing the client's disconnect
+        if disconnected:
+            logger.info(f"Live transcription client disconnected: {str(e)}")
+        else:
+            logger.error(f"Live transcription failed: {str(e)}", exc_info=True)
+            await _send_error(websocket, "Transcription failed", 1011)
+    finally:
+        receiver.cancel()
+        decoder.abort()  # ffmpeg is not left running whichever way the session ended
+        record_transcription(transcriber.received_seconds, transcriber.processing_seconds, "live")
@@ -0,0 +1,244 @@
+#Shared async Gemini client used by summurization.py and guide.py
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from google.api_core import exceptions as google_exceptions
+from dotenv import load_dotenv
+
+from metrics import LLM_ERRORS, LLM_LATENCY, LLM_RETRIES
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash-latest")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))  # Gemini calls in flight, process wide
+LLM_PER_USER_CONCURRENCY = int(os.getenv("LLM_PER_USER_CONCURRENCY", "2"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))  # seconds, doubled per attempt
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))  # default deadline per call, retries included
+
+# 429 and 5xx responses are worth retrying; everything else fails straight away
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+)
+
+
+class LLMTimeoutError(Exception):
+    """Raised when a call does not finish before its deadline"""
+
+
+class LLMBlockedError(Exception):
+    """Raised when Gemini blocks the prompt or answers without any text; retrying gets the same answer"""
+
+
+def _response_text(response, partial: bool = False) -> str:
+    """
+    Text of a Gemini response or streamed chunk. response.text raises a bare
+    ValueError when the prompt was blocked or no candidate came back; that is
+    turned into LLMBlockedError with the reason. A streamed chunk without
+    candidates (partial=True) is just empty.
+    """
+    block_reason = getattr(getattr(response, "prompt_feedback", None), "block_reason", None)
+    if block_reason:
+        raise LLMBlockedError(f"Gemini blocked the prompt: {getattr(block_reason, 'name', block_reason)}")
+    candidates = getattr(response, "candidates", None)
+    if candidates is not None and not candidates:
+        if partial:
+            return ""
+        raise LLMBlockedError("Gemini returned no candidates")
+    try:
+        return response.text
+    except ValueError as e:
+        finish_reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+        raise LLMBlockedError(f"Gemini returned no text (finish reason: {getattr(finish_reason, 'name', finish_reason)})") from e
+
+
+class LLMClient:
+    """
+    One Gemini client per process. Model objects (and with them the
+    underlying transport) are created once and reused; calls are bounded by
+    a global and a per-user concurrency limit, retried with jittered
+    exponential backoff on 429/5xx, and cut off at a deadline.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, per_user_concurrency: int = LLM_PER_USER_CONCURRENCY,
+                 max_retries: int = LLM_MAX_RETRIES, timeout: float = LLM_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.per_user_concurrency = per_user_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._configured = False
+        self._models = {}
+        self._global_slots: Optional[asyncio.Semaphore] = None
+        self._user_slots = {}  # user_id -> [semaphore, number of callers holding or waiting]
+
+    def _model(self, name: str):
+        # Imported here rather than at module level: it is slow to load and processes that only serve CRUD never need it
+        import google.generativeai as genai
+        if not self._configured:
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key:
+                raise ValueError("API key not found. Ensure the 'GOOGLE_API_KEY' environment variable is set correctly.")
+            genai.configure(api_key=api_key)
+            self._configured = True
+            logger.info("Gemini API Key configured successfully.")
+        model = self._models.get(name)
+        if model is None:
+            model = self._models[name] = genai.GenerativeModel(name)
+        return model
+
+    @asynccontextmanager
+    async def user_slot(self, user_id):
+        """
+        Hold one of user_id's per-user slots. A fan-out of calls made on one
+        request's behalf (a map-reduce summary) holds a single slot here and
+        makes its calls with user_id=None, so only the global limit applies
+        to them and the fan-out is not capped at LLM_PER_USER_CONCURRENCY.
+        """
+        if user_id is None:
+            yield
+            return
+        # Semaphores are created lazily so they bind to the running event loop
+        entry = self._user_slots.setdefault(user_id, [asyncio.Semaphore(self.per_user_concurrency), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._user_slots.pop(user_id, None)
+
+    @asynccontextmanager
+    async def _slot(self, user_id):
+        if self._global_slots is None:
+            self._global_slots = asyncio.Semaphore(self.max_concurrency)
+        async with self.user_slot(user_id):
+            async with self._global_slots:
+                yield
+
+    @asynccontextmanager
+    async def _observe(self, call: str):
+        """Record the latency and outcome of a whole call, retries included"""
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield
+        except LLMTimeoutError:
+            outcome = "timeout"
+            LLM_ERRORS.inc(call, "LLMTimeoutError")
+            raise
+        except RETRYABLE_ERRORS:
+            outcome = "error"  # each attempt was already counted
+            raise
+        except Exception as e:
+            outcome = "error"
+            LLM_ERRORS.inc(call, type(e).__name__)
+            raise
+        except BaseException:
+            outcome = "cancelled"
+            raise
+        finally:
+            LLM_LATENCY.observe(time.perf_counter() - start, call, outcome)
+
+    def _retry_or_raise(self, call: str, attempt: int, error: Exception, final: bool):
+        LLM_ERRORS.inc(call, type(error).__name__)
+        if final:
+            raise error
+        LLM_RETRIES.inc(call)
+
+    def _deadline(self, timeout: Optional[float], deadline: Optional[float]) -> float:
+        if deadline is not None:
+            return deadline
+        return asyncio.get_running_loop().time() + (timeout if timeout is not None else self.timeout)
+
+    async def _backoff(self, attempt: int, deadline: float, error: Exception):
+        delay = random.uniform(0, LLM_RETRY_BASE_DELAY * (2 ** attempt))  # full jitter
+        remaining = deadline - asyncio.get_running_loop().time()
+        if delay >= remaining:
+            raise LLMTimeoutError(f"Gemini call out of time after {attempt + 1} attempts") from error
+        logger.warning(f"Gemini call failed ({type(error).__name__}), retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    async def generate(self, prompt: str, *, user_id=None, timeout: Optional[float] = None,
+                       deadline: Optional[float] = None, model: str = GEMINI_MODEL) -> str:
+        """
+        Generate a completion for prompt and return its text.
+
+        timeout is in seconds for the whole call including retries; deadline
+        is an absolute event-loop time that takes precedence, so several
+        calls can share one budget.
+        """
+        deadline = self._deadline(timeout, deadline)
+        loop = asyncio.get_running_loop()
+        async with self._observe("generate"):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with self._slot(user_id):
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            raise LLMTimeoutError("Gemini call deadline exceeded")
+                        response = await asyncio.wait_for(self._model(model).generate_content_async(prompt), remaining)
+                    return _response_text(response)
+                except asyncio.TimeoutError:
+                    raise LLMTimeoutError("Gemini call deadline exceeded")
+                except RETRYABLE_ERRORS as e:
+                    self._retry_or_raise("generate", attempt, e, attempt == self.max_retries)
+                    await self._backoff(attempt, deadline, e)
+
+    async def stream(self, prompt: str, *, user_id=None, timeout: Optional[float] = None,
+                     deadline: Optional[float] = None, model: str = GEMINI_MODEL) -> AsyncIterator[str]:
+        """
+        Yield the completion for prompt in pieces as they are generated.
+
+        Failures are retried only until the first piece has been yielded.
+        """
+        deadline = self._deadline(timeout, deadline)
+        loop = asyncio.get_running_loop()
+        async with self._observe("stream"):
+            for attempt in range(self.max_retries + 1):
+                started = False
+                try:
+                    async with self._slot(user_id):
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            raise LLMTimeoutError("Gemini call deadline exceeded")
+                        response = await asyncio.wait_for(
+                            self._model(model).generate_content_async(prompt, stream=True), remaining
+                        )
+                        iterator = response.__aiter__()
+                        while True:
+                            remaining = deadline - loop.time()
+                            if remaining <= 0:
+                                raise LLMTimeoutError("Gemini call deadline exceeded")
+                            try:
+                                chunk = await asyncio.wait_for(iterator.__anext__(), remaining)
+                            except StopAsyncIteration:
+                                return
+                            text = _response_text(chunk, partial=True)
+                            if text:
+                                started = True
+                                yield text
+                except asyncio.TimeoutError:
+                    raise LLMTimeoutError("Gemini call deadline exceeded")
+                except RETRYABLE_ERRORS as e:
+                    self._retry_or_raise("stream", attempt, e, started or attempt == self.max_retries)
+                    await self._backoff(attempt, deadline, e)
+
+
+# The process-wide client
+llm_client = LLMClient()
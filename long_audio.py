@@ -0,0 +1,158 @@
+#Long recordings split at pauses and transcribed in parallel by a pool of Whisper processes
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Recordings at least this long are split; shorter ones are not worth the hand-off
+STT_LONG_AUDIO_MIN_SECONDS = float(os.environ.get("STT_LONG_AUDIO_MIN_SECONDS", "600"))
+# Aimed-for chunk length; a chunk is cut at the pause nearest to it
+STT_CHUNK_SECONDS = float(os.environ.get("STT_CHUNK_SECONDS", "240"))
+# Worker processes, each with its own model in memory, so opt-in; 0 or 1 keeps long-audio mode off.
+# Half the cores is a good value on a host with the memory for that many models.
+STT_LONG_AUDIO_WORKERS = int(os.environ.get("STT_LONG_AUDIO_WORKERS") or 0)
+
+FRAME_MS = 30
+MIN_SILENCE_MS = 300
+SILENCE_MARGIN_DB = 6  # above the recording's noise floor
+
+
+def split_on_silence(audio: np.ndarray, chunk_seconds: float = STT_CHUNK_SECONDS,
+                     sample_rate: int = SAMPLE_RATE) -> List[Tuple[int, int]]:
+    """
+    (start, end) sample ranges covering the audio, each about chunk_seconds long
+    and cut in the middle of a pause so no word is split. A pause is a run of
+    at least MIN_SILENCE_MS whose energy stays within SILENCE_MARGIN_DB of the
+    quietest tenth of the recording. Without a pause in reach the cut is made
+    at chunk_seconds anyway.
+    """
+    target = int(chunk_seconds * sample_rate)
+    longest = target + target // 2
+    if len(audio) <= longest:
+        return [(0, len(audio))]
+
+    frame = int(sample_rate * FRAME_MS / 1000)
+    count = len(audio) // frame
+    frames = audio[:count * frame].reshape(count, frame).astype(np.float64)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    silent = energy_db < np.percentile(energy_db, 10) + SILENCE_MARGIN_DB
+
+    # Start and end frame of every silent run, then the middle of the long enough ones
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], silent.astype(np.int8), [0]))))
+    starts, ends = edges[::2], edges[1::2]
+    pauses = (ends - starts) >= MIN_SILENCE_MS // FRAME_MS
+    cuts = (starts[pauses] + ends[pauses]) // 2 * frame
+
+    ranges, start = [], 0
+    while len(audio) - start > longest:
+        reachable = cuts[(cuts > start + target // 2) & (cuts <= start + longest)]
+        if len(reachable):
+            cut = int(reachable[np.argmin(np.abs(reachable - (start + target)))])
+        else:
+            cut = start + target
+        ranges.append((start, cut))
+        start = cut
+    ranges.append((start, len(audio)))
+    return ranges
+
+
+# Each worker process loads its own model once, in the pool initializer
+_worker_model = None
+
+
+def _init_worker(model_size: str, cpu_threads: int):
+    global _worker_model
+    from stt_model import SpeechToTextModel
+    _worker_model = SpeechToTextModel(model_size, cpu_threads=cpu_threads, num_workers=1, long_audio_workers=0,
+                                      batch_size=1)
+    _worker_model.load()
+
+
+def _transcribe_chunk(audio: np.ndarray, profile: Optional[str]) -> List[Tuple[float, float, str, float]]:
+    """Segments of one chunk as (start, end, text, confidence), with times relative to the chunk"""
+    from stt_model import decode_options
+    segments, _ = _worker_model.model.transcribe(audio, **decode_options(profile))
+    return [(segment.start, segment.end, segment.text, math.exp(segment.avg_logprob)) for segment in segments]
+
+
+class LongAudioTranscriber:
+    """Pool of Whisper processes that transcribe the chunks of one long recording side by side"""
+
+    def __init__(self, model_size: str, workers: int = STT_LONG_AUDIO_WORKERS,
+                 chunk_seconds: float = STT_CHUNK_SECONDS, min_seconds: float = STT_LONG_AUDIO_MIN_SECONDS):
+        self.model_size = model_size
+        self.workers = max(1, workers)
+        self.chunk_seconds = chunk_seconds
+        self.min_seconds = min_seconds
+        # Cores split evenly between the workers, so together they use the machine without oversubscribing it
+        self.cpu_threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def wants(self, audio) -> bool:
+        return isinstance(audio, np.ndarray) and len(audio) >= self.min_seconds * SAMPLE_RATE
+
+    def _start(self) -> ProcessPoolExecutor:
+        """Start the worker processes on first use"""
+        with self._lock:
+            if self._executor is None:
+                logger.info(f"Starting {self.workers} long-audio workers with model '{self.model_size}', "
+                            f"{self.cpu_threads} threads each")
+                # spawn keeps the workers clean of the server's threads and sockets
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_size, self.cpu_threads),
+                )
+            return self._executor
+
+    def segments(self, audio: np.ndarray, profile: Optional[str] = None) -> Iterator[Tuple[float, float, str, float]]:
+        """
+        Split the audio at pauses, transcribe every chunk in the pool and yield
+        (start, end, text, confidence) segments in recording order with times from the start
+        of the recording. Segments of a chunk are yielded as soon as it and every
+        chunk before it are done.
+
+        Chunks are decoded side by side, so a chunk cannot be prompted with
+        the text of the one before it: Whisper's condition_on_previous_text
+        context restarts at every cut. Cutting in pauses keeps sentences
+        whole, but spelling of names and terms may drift between chunks.
+        """
+        ranges = split_on_silence(audio, self.chunk_seconds)
+        logger.info(f"Transcribing {len(audio) / SAMPLE_RATE:.0f}s of audio as {len(ranges)} chunks")
+        executor = self._start()
+        futures = [executor.submit(_transcribe_chunk, audio[start:end], profile) for start, end in ranges]
+        try:
+            for (start, _), future in zip(ranges, futures):
+                offset = start / SAMPLE_RATE
+                for segment_start, segment_end, text, confidence in future.result():
+                    yield segment_start + offset, segment_end + offset, text, confidence
+        except BrokenProcessPool:
+            # A worker died (most likely out of memory); start a fresh pool next time
+            with self._lock:
+                if self._executor is executor:
+                    logger.warning("Long-audio worker pool broke, a new one starts with the next recording")
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    self._executor = None
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
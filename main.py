@@ -2,32 +2,54 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+from readiness import readiness, PROCESS_STARTED
+
 from pydantic import BaseModel
-from summurization import summarize_and_categorize, summarize_text
-from fastapi import FastAPI, HTTPException, Request, Body
+from summurization import summarize_and_categorize, stream_summary, summary_cache, summary_flight
+from fastapi import FastAPI, HTTPException, Request, Response, Body, BackgroundTasks, Depends
 from pydantic import BaseModel
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 from models import User, Note
-from databases import engine, create_db_and_tables
-from fastapi import FastAPI, UploadFile, File
-import shutil
+from databases import engine, async_engine, async_session
+from migrations import run_migrations, pending_migrations
+from fastapi import FastAPI, UploadFile, File, Form, WebSocket
 from pathlib import Path
 from fastapi.middleware.cors import CORSMiddleware
 import os
 from fastapi.responses import JSONResponse
 import uvicorn
-from typing import Optional, List
+from typing import Optional, List, Union
 from datetime import datetime, date
-import tempfile
 import logging
 from logging.handlers import RotatingFileHandler
-from stt_model import SpeechToTextModel
+from stt_model import SpeechToTextModel, STT_PRELOAD, STT_PROFILE, DECODING_PROFILES, UnknownProfileError, decode_options
 from fastapi.responses import StreamingResponse
 from pathlib import Path
-from pydub import AudioSegment
 from fastapi import Query
+from fastapi.concurrency import run_in_threadpool
 from passlib.context import CryptContext
-from guide import generate_study_guide
+from auth import TokenClaims, get_token_claims, authorize_user, token_signer
+from search import note_search
+from note_export import export_notes, EXPORT_FORMATS
+from note_import import import_notes, BULK_IMPORT_BATCH_SIZE, BULK_IMPORT_MAX_BATCH_SIZE
+from note_compression import check_note_storage
+from pagination import paginate, split_page, encode_offset_cursor, decode_offset_cursor, encode_seq_cursor, decode_seq_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
+from guide import generate_study_guide, lookup_study_guide, stream_study_guide, guide_flight
+from audio_io import SpooledUpload, spool_upload, decode_audio, UploadTooLargeError, AudioDecodeError, SAMPLE_RATE
+from transcription_jobs import TranscriptionJobQueue, QueueFullError
+from audio_notes import AudioNotePipeline
+from live_transcription import LiveTranscriber, run_live_session, LIVE_FORMATS
+from transcription_cache import build_transcript_cache, cache_key, audio_digest
+from transcript_segments import TranscriptSegmentIn, TranscriptSegmentOut, replace_segments, read_segments, segment_to_dict, segments_text
+from metrics import MetricsMiddleware, MetricFamily, register_collector, render, pool_families, cache_families, CONTENT_TYPE
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Set up logging
 log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
@@ -63,25 +85,107 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=[NEXT_CURSOR_HEADER],  # Lets browser clients read the pagination cursor
 )
 
-# Initialize models
+# Request counts and latencies for /metrics, labelled by route template
+app.add_middleware(MetricsMiddleware, routes_app=app)
+
+# Initialize models; Whisper itself loads on first use or as set by STT_PRELOAD
 stt_model = SpeechToTextModel()
 
+# Transcripts keyed by audio content, shared by /transcribe and the job queue
+transcript_cache = build_transcript_cache()
+
+# Background transcription queue, its worker processes start on the first job
+transcription_queue = TranscriptionJobQueue(cache=transcript_cache)
+
+# Audio-to-note jobs (/notes/from-audio) run in this process, on the shared model
+audio_note_pipeline = AudioNotePipeline(stt_model, transcript_cache=transcript_cache)
+
 # Password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# Create database tables on startup
+# bcrypt is slow on purpose, so it runs on its own threads instead of the event loop
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "4"))
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
+async def hash_password(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(password_executor, pwd_context.hash, password)
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(password_executor, pwd_context.verify, password, hashed)
+
+@register_collector
+def runtime_metrics():
+    """Pool, cache and queue values read when /metrics is scraped"""
+    transcripts = transcript_cache.info()
+    caches = {"transcript": transcripts, "summary": summary_cache.info(),
+              "search_index": note_search.info()["python_index"]}
+    for tier in transcripts["tiers"]:
+        caches[f"transcript_{tier['type'].lower()}"] = tier
+    queue = MetricFamily("transcription_jobs_queued", "Jobs waiting for a worker").add(transcription_queue.queued())
+    audio_notes = MetricFamily("audio_note_jobs_running", "Audio-to-note jobs in progress").add(audio_note_pipeline.running())
+    coalesced = MetricFamily("singleflight_coalesced_total", "Requests that shared an in-flight call", "counter", ("flight",))
+    coalesced.add(summary_flight.coalesced, "summary").add(guide_flight.coalesced, "study_guide")
+    pools = pool_families({"sync": engine.pool, "async": async_engine.sync_engine.pool})
+    stt = MetricFamily("stt_model_loaded", "Whether this process has loaded the Whisper model").add(int(stt_model.loaded))
+    return pools + cache_families(caches) + [queue, audio_notes, coalesced, stt]
+
+# Apply migrations on boot, or leave them to a release step (`python migrations.py upgrade`)
+# and only check that none are pending, which saves a lock round trip per replica start
+MIGRATE_ON_STARTUP = os.environ.get("MIGRATE_ON_STARTUP", "True").lower() == "true"
+
+# /ready waits for these; a preloaded model is required, a lazily loaded one is not
+readiness.require("database")
+if STT_PRELOAD in ("startup", "background"):
+    readiness.require("stt_model")
+
+def load_stt_model():
+    with readiness.phase("stt_model"):
+        stt_model.load(warm_up=True)
+    readiness.mark("stt_model")
+
+def load_stt_model_in_background():
+    try:
+        load_stt_model()
+    except Exception as e:
+        logger.error(f"Whisper preload failed, /transcribe will retry on first use: {str(e)}")
+
+# Bring the database schema up to date on startup
 @app.on_event("startup")
 def on_startup():
-    logger.info("Application startup: Creating database tables")
+    logger.info(f"Application startup: imports took {(time.perf_counter() - PROCESS_STARTED) * 1000:.0f}ms")
     try:
-        create_db_and_tables()
-        logger.info("Database tables created successfully")
+        with readiness.phase("database"):
+            if MIGRATE_ON_STARTUP:
+                run_migrations(engine)
+            else:
+                pending = pending_migrations(engine)
+                if pending:
+                    raise RuntimeError(f"{len(pending)} migrations pending; run `python migrations.py upgrade`")
+            check_note_storage(engine)
+            note_search.configure(engine)
+        readiness.mark("database")
     except Exception as e:
         logger.error(f"Database initialization error: {str(e)}")
         raise
 
+    if STT_PRELOAD == "startup":
+        load_stt_model()
+    elif STT_PRELOAD == "background":
+        threading.Thread(target=load_stt_model_in_background, name="stt-preload", daemon=True).start()
+    logger.info(f"Application startup complete {(time.perf_counter() - PROCESS_STARTED) * 1000:.0f}ms after process start")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    logger.info("Application shutdown: Stopping transcription workers")
+    transcription_queue.shutdown()
+    await audio_note_pipeline.shutdown()
+    stt_model.shutdown()
+    password_executor.shutdown(wait=False)
+    await async_engine.dispose()
+
 # ----------------------
 # Request/Response Models
 # ----------------------
@@ -112,6 +216,8 @@ class NoteCreate(BaseModel):
     transcription: Optional[str] = None
     summarized_notes: Optional[str] = None
     category: Optional[str] = None
+    # Timed segments as returned by /transcribe?segments=true; they also fill transcription when it is empty
+    segments: Optional[List[TranscriptSegmentIn]] = None
 
 class NoteResponse(BaseModel):
     id: int
@@ -122,8 +228,26 @@ class NoteResponse(BaseModel):
     category: str
     created_at: datetime
 
+class NoteListItem(BaseModel):
+    """Note without its large text columns, returned by the list endpoints unless view=full"""
+    id: int
+    user_id: int
+    title: str
+    category: str
+    created_at: datetime
+
+class NoteSearchResult(BaseModel):
+    id: int
+    user_id: int
+    title: str
+    category: str
+    created_at: datetime
+    score: float  # relevance, higher is better; only comparable within one search
+    snippet: str  # HTML-escaped matching passage with terms wrapped in <mark></mark>
+
 class TextRequest(BaseModel):
     text: str
+    user_id: Optional[int] = None  # only used for per-user rate limiting of Gemini calls
 
 class SummaryResponse(BaseModel):
     summary: str
@@ -136,16 +260,22 @@ class UserLogin(BaseModel):
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str
+    expires_in: int  # seconds
     user_id: int
     username: str
 
 class StudyGuideRequest(BaseModel):
     category: str
     user_id: int
+    # "sync" regenerates changed guides before answering, "background" answers
+    # with the previous guide right away and regenerates it afterwards
+    refresh: str = "sync"
 
 class StudyGuideResponse(BaseModel):
     guide: str
     category: str
+    cached: bool = False
+    stale: bool = False
 
 class UserUpdateRequest(BaseModel):
     first_name: Optional[str] = None
@@ -169,15 +299,15 @@ async def create_user(user: UserCreate):
         safe_user_data["password"] = "***REDACTED***"
         logger.info(f"User registration request received: {safe_user_data}")
         
-        with Session(engine) as session:
+        async with async_session() as session:
             # Check if username already exists
-            existing_username = session.exec(select(User).where(User.username == user.username)).first()
+            existing_username = (await session.exec(select(User).where(User.username == user.username))).first()
             if existing_username:
                 logger.warning(f"Registration failed: Username '{user.username}' already exists")
                 raise HTTPException(status_code=400, detail="Username already exists")
             
             # Check if email already exists
-            existing_email = session.exec(select(User).where(User.email == user.email)).first()
+            existing_email = (await session.exec(select(User).where(User.email == user.email))).first()
             if existing_email:
                 logger.warning(f"Registration failed: Email '{user.email}' already registered")
                 raise HTTPException(status_code=400, detail="Email already registered")
@@ -185,7 +315,7 @@ async def create_user(user: UserCreate):
             # Hash the password
             try:
                 logger.debug(f"Hashing password for user: {user.username}")
-                hashed_password = pwd_context.hash(user.password)
+                hashed_password = await hash_password(user.password)
                 logger.debug("Password hashed successfully")
             except Exception as e:
                 logger.error(f"Password hashing error: {str(e)}", exc_info=True)
@@ -211,16 +341,20 @@ async def create_user(user: UserCreate):
                 logger.debug("Adding user to session")
                 session.add(db_user)
                 logger.debug("Committing session")
-                session.commit()
+                await session.commit()
                 logger.debug("Session committed successfully")
-                session.refresh(db_user)
+                await session.refresh(db_user)
                 
                 logger.info(f"User created successfully: {user.username}")
                 return db_user
+            except IntegrityError:
+                # Lost a race with a concurrent registration; the unique indexes caught it
+                await session.rollback()
+                raise HTTPException(status_code=400, detail="Username or email already registered")
             except Exception as e:
                 error_msg = f"Database error: {str(e)}"
                 logger.error(f"Error creating user in database: {error_msg}", exc_info=True)
-                session.rollback()
+                await session.rollback()
                 raise HTTPException(status_code=500, detail=error_msg)
     except HTTPException:
         raise
@@ -230,7 +364,7 @@ async def create_user(user: UserCreate):
         raise HTTPException(status_code=500, detail=error_msg)
 
 @app.post("/register-simple", response_model=UserResponse)
-def create_user_simple(user: UserCreate):
+async def create_user_simple(user: UserCreate):
     """Create a new user without password hashing - for testing only"""
     try:
         # Log the incoming request data (excluding password)
@@ -238,15 +372,15 @@ def create_user_simple(user: UserCreate):
         safe_user_data["password"] = "***REDACTED***"
         logger.info(f"Simple user registration request received: {safe_user_data}")
         
-        with Session(engine) as session:
+        async with async_session() as session:
             # Check if username already exists
-            existing_username = session.exec(select(User).where(User.username == user.username)).first()
+            existing_username = (await session.exec(select(User).where(User.username == user.username))).first()
             if existing_username:
                 logger.warning(f"Simple registration failed: Username '{user.username}' already exists")
                 raise HTTPException(status_code=400, detail="Username already exists")
             
             # Check if email already exists
-            existing_email = session.exec(select(User).where(User.email == user.email)).first()
+            existing_email = (await session.exec(select(User).where(User.email == user.email))).first()
             if existing_email:
                 logger.warning(f"Simple registration failed: Email '{user.email}' already registered")
                 raise HTTPException(status_code=400, detail="Email already registered")
@@ -271,16 +405,20 @@ def create_user_simple(user: UserCreate):
                 logger.debug("Adding user to session (simple)")
                 session.add(db_user)
                 logger.debug("Committing session (simple)")
-                session.commit()
+                await session.commit()
                 logger.debug("Session committed successfully (simple)")
-                session.refresh(db_user)
+                await session.refresh(db_user)
                 
                 logger.info(f"User created successfully with simple method: {user.username}")
                 return db_user
+            except IntegrityError:
+                # Lost a race with a concurrent registration; the unique indexes caught it
+                await session.rollback()
+                raise HTTPException(status_code=400, detail="Username or email already registered")
             except Exception as e:
                 error_msg = f"Database error: {str(e)}"
                 logger.error(f"Error creating user in database (simple): {error_msg}", exc_info=True)
-                session.rollback()
+                await session.rollback()
                 raise HTTPException(status_code=500, detail=error_msg)
     except HTTPException:
         raise
@@ -290,56 +428,85 @@ def create_user_simple(user: UserCreate):
         raise HTTPException(status_code=500, detail=error_msg)
 
 #API user registration and log in worked on by Jorge
+# Columns needed for UserResponse; the password hash is never loaded for listings
+USER_LIST_COLUMNS = (User.id, User.username, User.email, User.first_name, User.last_name,
+                     User.age, User.major, User.date_of_birth, User.created_at)
+
+# Note columns for the list projection; transcription and summarized_notes are left out
+NOTE_LIST_COLUMNS = (Note.id, Note.user_id, Note.title, Note.category, Note.created_at)
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+async def note_page(session: AsyncSession, view: str, cursor: Optional[str], limit: int, user_id: Optional[int] = None):
+    """One page of notes, newest first, as list projections or full rows"""
+    if view not in ("list", "full"):
+        raise HTTPException(status_code=400, detail="view must be 'list' or 'full'")
+    statement = select(Note) if view == "full" else select(*NOTE_LIST_COLUMNS)
+    if user_id is not None:
+        statement = statement.where(Note.user_id == user_id)
+    rows = (await session.exec(paginate(statement, Note, cursor, limit))).all()
+    return split_page(rows, limit)
+
 @app.get("/users", response_model=List[UserResponse])
-def get_users():
-    """Get all users"""
-    with Session(engine) as session:
-        users = session.exec(select(User)).all()
-        return users
+async def get_users(
+    response: Response,
+    cursor: Optional[str] = Query(None, description=f"Value of the {NEXT_CURSOR_HEADER} header from the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    """Get users, newest first, one page at a time"""
+    async with async_session() as session:
+        rows = (await session.exec(paginate(select(*USER_LIST_COLUMNS), User, cursor, limit))).all()
+        users, next_cursor = split_page(rows, limit)
+        set_next_cursor(response, next_cursor)
+        return [dict(row._mapping) for row in users]
 
 @app.get("/users/{user_id}", response_model=UserResponse)
-def get_user(user_id: int):
+async def get_user(user_id: int):
     """Get a specific user by ID"""
-    with Session(engine) as session:
-        user = session.get(User, user_id)
+    async with async_session() as session:
+        user = await session.get(User, user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         return user
 
 @app.post("/login", response_model=TokenResponse)
-def login(user_credentials: UserLogin):
+async def login(user_credentials: UserLogin):
     """Authenticate a user and return a token"""
-    with Session(engine) as session:
+    async with async_session() as session:
         # Find user by username
-        user = session.exec(select(User).where(User.username == user_credentials.username)).first()
+        user = (await session.exec(select(User).where(User.username == user_credentials.username))).first()
         if not user:
             raise HTTPException(status_code=401, detail="Invalid username or password")
         
         # Verify password
-        if not pwd_context.verify(user_credentials.password, user.password):
+        if not await verify_password(user_credentials.password, user.password):
             raise HTTPException(status_code=401, detail="Invalid username or password")
         
-        # For now, we're just returning user details
+        # Signed token, sent back as "Authorization: Bearer <token>" and verified without a database lookup
         return {
-            "access_token": f"user_{user.id}_{user.username}",  # This is a placeholder, not secure
+            "access_token": token_signer.issue(user.id, user.username),
             "token_type": "bearer",
+            "expires_in": token_signer.ttl,
             "user_id": user.id,
             "username": user.username
         }
 
 @app.put("/users/{user_id}", response_model=UserResponse)
-def update_user(user_id: int, user_update: UserUpdateRequest):
+async def update_user(user_id: int, user_update: UserUpdateRequest, claims: Optional[TokenClaims] = Depends(get_token_claims)):
     """Update a user's profile information"""
+    authorize_user(claims, user_id)
     try:
-        with Session(engine) as session:
+        async with async_session() as session:
             # Get the user
-            db_user = session.get(User, user_id)
+            db_user = await session.get(User, user_id)
             if not db_user:
                 raise HTTPException(status_code=404, detail="User not found")
             
             # Check if email is being updated and if it's already taken
             if user_update.email and user_update.email != db_user.email:
-                existing_email = session.exec(select(User).where(User.email == user_update.email)).first()
+                existing_email = (await session.exec(select(User).where(User.email == user_update.email))).first()
                 if existing_email:
                     raise HTTPException(status_code=400, detail="Email already registered")
             
@@ -353,8 +520,12 @@ def update_user(user_id: int, user_update: UserUpdateRequest):
             
             # Save changes
             session.add(db_user)
-            session.commit()
-            session.refresh(db_user)
+            try:
+                await session.commit()
+            except IntegrityError:
+                await session.rollback()
+                raise HTTPException(status_code=400, detail="Email already registered")
+            await session.refresh(db_user)
             
             return db_user
     except HTTPException:
@@ -365,25 +536,26 @@ def update_user(user_id: int, user_update: UserUpdateRequest):
         raise HTTPException(status_code=500, detail=error_msg)
 
 @app.put("/users/{user_id}/password", response_model=dict)
-def update_password(user_id: int, password_update: PasswordUpdateRequest):
+async def update_password(user_id: int, password_update: PasswordUpdateRequest, claims: Optional[TokenClaims] = Depends(get_token_claims)):
     """Update a user's password"""
+    authorize_user(claims, user_id)
     try:
-        with Session(engine) as session:
+        async with async_session() as session:
             # Get the user
-            db_user = session.get(User, user_id)
+            db_user = await session.get(User, user_id)
             if not db_user:
                 raise HTTPException(status_code=404, detail="User not found")
             
             # Verify current password
-            if not pwd_context.verify(password_update.current_password, db_user.password):
+            if not await verify_password(password_update.current_password, db_user.password):
                 raise HTTPException(status_code=401, detail="Current password is incorrect")
             
             # Hash and update new password
-            db_user.password = pwd_context.hash(password_update.new_password)
+            db_user.password = await hash_password(password_update.new_password)
             
             # Save changes
             session.add(db_user)
-            session.commit()
+            await session.commit()
             
             return {"message": "Password updated successfully"}
     except HTTPException:
@@ -398,130 +570,504 @@ def update_password(user_id: int, password_update: PasswordUpdateRequest):
 # ----------------------
 #Note and Study guide API and logic by Jorge
 @app.post("/notes", response_model=NoteResponse)
-def create_note(note: NoteCreate):
+async def create_note(note: NoteCreate, claims: Optional[TokenClaims] = Depends(get_token_claims)):
     """Create a new note"""
-    with Session(engine) as session:
-        # Verify user exists
-        user = session.get(User, note.user_id)
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
+    async with async_session() as session:
+        # Verify user exists, unless the caller's token already vouches for them
+        if not authorize_user(claims, note.user_id):
+            user = await session.get(User, note.user_id)
+            if not user:
+                raise HTTPException(status_code=404, detail="User not found")
         
         # Create new note
         db_note = Note(
             user_id=note.user_id,
             title=note.title or "Untitled Note",
-            transcription=note.transcription or "",
+            transcription=note.transcription or (segments_text(note.segments) if note.segments else ""),
             summarized_notes=note.summarized_notes or "",
             category=note.category or ""
         )
         session.add(db_note)
-        session.commit()
-        session.refresh(db_note)
+        try:
+            if note.segments:
+                await session.flush()  # assigns the note id
+                await replace_segments(session, db_note.id, note.segments)
+            await session.commit()
+        except IntegrityError:
+            # The token outlived its user
+            await session.rollback()
+            raise HTTPException(status_code=404, detail="User not found")
+        await session.refresh(db_note)
         
         return db_note
 
-@app.get("/notes", response_model=List[NoteResponse])
-def get_notes():
-    """Get all notes"""
-    with Session(engine) as session:
-        notes = session.exec(select(Note)).all()
-        return notes
+@app.get("/notes", response_model=List[Union[NoteResponse, NoteListItem]])
+async def get_notes(
+    response: Response,
+    cursor: Optional[str] = Query(None, description=f"Value of the {NEXT_CURSOR_HEADER} header from the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    view: str = Query("list", description="'list' leaves out transcription and summarized_notes, 'full' includes them"),
+):
+    """Get notes, newest first, one page at a time"""
+    async with async_session() as session:
+        notes, next_cursor = await note_page(session, view, cursor, limit)
+        set_next_cursor(response, next_cursor)
+        return notes if view == "full" else [dict(row._mapping) for row in notes]
 
 @app.get("/notes/{note_id}", response_model=NoteResponse)
-def get_note(note_id: int):
+async def get_note(note_id: int, claims: Optional[TokenClaims] = Depends(get_token_claims)):
     """Get a specific note by ID"""
-    with Session(engine) as session:
-        note = session.get(Note, note_id)
+    async with async_session() as session:
+        note = await session.get(Note, note_id)
         if not note:
             raise HTTPException(status_code=404, detail="Note not found")
+        authorize_user(claims, note.user_id)
         return note
 
-@app.get("/users/{user_id}/notes", response_model=List[NoteResponse])
-def get_user_notes(user_id: int):
-    """Get all notes for a specific user"""
-    with Session(engine) as session:
-        # Verify user exists
-        user = session.get(User, user_id)
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
+async def note_owner(session: AsyncSession, note_id: int) -> int:
+    """user_id of a note, without loading its text columns"""
+    user_id = (await session.exec(select(Note.user_id).where(Note.id == note_id))).first()
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+    return user_id
+
+@app.put("/notes/{note_id}/segments")
+async def put_note_segments(note_id: int, segments: List[TranscriptSegmentIn],
+                            claims: Optional[TokenClaims] = Depends(get_token_claims)):
+    """Replace a note's timed transcript segments"""
+    async with async_session() as session:
+        authorize_user(claims, await note_owner(session, note_id))
+        count = await replace_segments(session, note_id, segments)
+        await session.commit()
+        return {"note_id": note_id, "segments": count}
+
+@app.get("/notes/{note_id}/segments", response_model=List[TranscriptSegmentOut])
+async def get_note_segments(
+    note_id: int,
+    response: Response,
+    start: Optional[float] = Query(None, ge=0, description="Only segments still running at or after this second"),
+    end: Optional[float] = Query(None, ge=0, description="Only segments starting before this second"),
+    first: Optional[int] = Query(None, ge=0, description="First segment number (seq) to return"),
+    last: Optional[int] = Query(None, ge=0, description="Last segment number (seq) to return"),
+    cursor: Optional[str] = Query(None, description=f"Value of the {NEXT_CURSOR_HEADER} header from the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+):
+    """Read part of a note's transcript by time or segment range, in order, one page at a time"""
+    async with async_session() as session:
+        authorize_user(claims, await note_owner(session, note_id))
+        rows, more = await read_segments(session, note_id, start, end, first, last, decode_seq_cursor(cursor), limit)
+        if more:
+            set_next_cursor(response, encode_seq_cursor(rows[-1].seq))
+        return [{"seq": row.seq, "start": row.start_ms / 1000, "end": row.end_ms / 1000,
+                 "text": row.text, "confidence": row.confidence} for row in rows]
+
+@app.get("/users/{user_id}/notes", response_model=List[Union[NoteResponse, NoteListItem]])
+async def get_user_notes(
+    user_id: int,
+    response: Response,
+    cursor: Optional[str] = Query(None, description=f"Value of the {NEXT_CURSOR_HEADER} header from the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    view: str = Query("list", description="'list' leaves out transcription and summarized_notes, 'full' includes them"),
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+):
+    """Get a specific user's notes, newest first, one page at a time"""
+    async with async_session() as session:
+        # Verify user exists, unless the caller's token already vouches for them
+        if not authorize_user(claims, user_id):
+            user = await session.get(User, user_id)
+            if not user:
+                raise HTTPException(status_code=404, detail="User not found")
         
         # Get user's notes
-        notes = session.exec(select(Note).where(Note.user_id == user_id)).all()
-        return notes
+        notes, next_cursor = await note_page(session, view, cursor, limit, user_id)
+        set_next_cursor(response, next_cursor)
+        return notes if view == "full" else [dict(row._mapping) for row in notes]
+
+@app.post("/users/{user_id}/notes:bulk")
+async def bulk_import_notes(
+    user_id: int,
+    request: Request,
+    batch_size: int = Query(BULK_IMPORT_BATCH_SIZE, ge=1, le=BULK_IMPORT_MAX_BATCH_SIZE),
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+):
+    """
+    Import notes from an NDJSON body (one JSON note per line, streamed).
+    Lines are validated as they arrive and inserted batch_size at a time;
+    failed lines are reported by number without stopping the import.
+    """
+    # Verify user exists, unless the caller's token already vouches for them
+    if not authorize_user(claims, user_id) and not await user_exists(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    logger.info(f"Bulk note import started for user {user_id}")
+    return await import_notes(request.stream(), user_id, batch_size)
+
+@app.get("/users/{user_id}/notes/export")
+async def export_user_notes(
+    user_id: int,
+    format: str = Query("ndjson", description="'ndjson' (one JSON note per line) or 'csv'"),
+    category: Optional[str] = Query(None, description="Only export notes in this category"),
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+):
+    """Download all of a user's notes, streamed from a server-side cursor so memory use stays flat"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+
+    # Verify user exists, unless the caller's token already vouches for them
+    if not authorize_user(claims, user_id) and not await user_exists(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return StreamingResponse(
+        export_notes(user_id, format, category),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="notes-{user_id}.{format}"'},
+    )
+
+@app.get("/users/{user_id}/notes/search", response_model=List[NoteSearchResult])
+async def search_user_notes(
+    user_id: int,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=500, description="Words to look for in titles, transcriptions and summaries"),
+    cursor: Optional[str] = Query(None, description=f"Value of the {NEXT_CURSOR_HEADER} header from the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+):
+    """Search a user's notes, best matches first, one page at a time"""
+    offset = decode_offset_cursor(cursor)
+    async with async_session() as session:
+        # Verify user exists, unless the caller's token already vouches for them
+        if not authorize_user(claims, user_id):
+            user = await session.get(User, user_id)
+            if not user:
+                raise HTTPException(status_code=404, detail="User not found")
+
+        hits = await note_search.search(session, user_id, q, offset, limit + 1)
+        if len(hits) > limit:
+            hits = hits[:limit]
+            set_next_cursor(response, encode_offset_cursor(offset + limit))
+        return [hit._asdict() for hit in hits]
+
+@app.get("/notes/search/info")
+def search_info():
+    """Which search backend is in use, and the in-process index cache when it is the fallback"""
+    return note_search.info()
+
+# ----------------------
+# Server-Sent Events
+# ----------------------
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Format one server-sent event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+async def sse_text_stream(pieces, done: dict):
+    """Forward text pieces as 'token' events, then a 'done' event (or 'error' if the generator fails)"""
+    try:
+        async for piece in pieces:
+            yield sse_event({"text": piece}, "token")
+        yield sse_event(done, "done")
+    except Exception as e:
+        logger.error(f"Streaming generation failed: {str(e)}")
+        yield sse_event({"detail": f"{type(e).__name__}: {str(e)}"}, "error")
 
 # ----------------------
 # Transcription Endpoint
 # ----------------------
 
+async def spool_upload_file(file: UploadFile) -> SpooledUpload:
+    """Spool an upload to a temp file in chunks, mapping the size cap to a 413"""
+    try:
+        return await run_in_threadpool(spool_upload, file.file, Path(file.filename).suffix)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        logger.error(f"Could not read uploaded file: {e}")
+        raise HTTPException(status_code=400, detail="File read error")
+
+def transcript_cache_key(content_digest: str, profile: Optional[str] = None, segments: bool = False) -> str:
+    # Timed segments are cached as JSON under their own key, next to the plain text
+    content = f"segments:{content_digest}" if segments else content_digest
+    return cache_key(content, stt_model.model_size, decode_options(profile))
+
+def check_profile(profile: Optional[str]):
+    """Reject an unknown decoding profile before the upload is read"""
+    try:
+        decode_options(profile)
+    except UnknownProfileError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+PROFILE_QUERY = Query(None, description=f"Decoding profile: {', '.join(DECODING_PROFILES)} (default {STT_PROFILE})")
+
 @app.post("/transcribe")
 async def transcribe_audio(
     file: UploadFile = File(...),
-    stream: bool = Query(False)
+    stream: bool = Query(False),
+    profile: Optional[str] = PROFILE_QUERY,
+    segments: bool = Query(False, description="Return timed segments (NDJSON lines when streaming)"),
 ):
     # Debug: Confirm file received
-    print(f"[DEBUG] Received file: {file.filename}, type: {file.content_type}, stream={stream}")
+    logger.debug(f"Received file: {file.filename}, type: {file.content_type}, stream={stream}, profile={profile}")
     
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file uploaded")
+    check_profile(profile)
 
-    # Debug: Check file size before processing
-    try:
-        contents = await file.read()
-        print(f"[DEBUG] File content size: {len(contents)} bytes")
-        await file.seek(0)  # Reset pointer so we can read it again
-    except Exception as e:
-        print(f"[ERROR] Could not read uploaded file: {e}")
-        raise HTTPException(status_code=400, detail="File read error")
+    upload = await spool_upload_file(file)
+    keys = [transcript_cache_key(upload.sha256, profile, segments)]
+    transcript = transcript_cache.get(keys[0])
+    if transcript is None:
+        try:
+            audio = await run_in_threadpool(decode_audio, upload.path)
+        except AudioDecodeError as e:
+            logger.error(f"Could not decode audio: {e}")
+            raise HTTPException(status_code=400, detail="Could not decode audio file")
+        finally:
+            upload.path.unlink(missing_ok=True)
+        logger.debug(f"Decoded {len(audio) / SAMPLE_RATE:.1f}s of audio")
+
+        # Same audio in a different container still hits on the decoded samples
+        keys.append(transcript_cache_key(await run_in_threadpool(audio_digest, audio), profile, segments))
+        transcript = transcript_cache.get(keys[1])
+    else:
+        upload.path.unlink(missing_ok=True)
+
+    if transcript is not None:
+        logger.debug("Transcript served from cache")
+        for key in keys:
+            transcript_cache.set(key, transcript)
+        if segments:
+            items = json.loads(transcript)
+            if stream:
+                return StreamingResponse(iter([json.dumps(item) + "\n" for item in items]), media_type="application/x-ndjson")
+            return JSONResponse({"transcription": segments_text(items), "segments": items})
+        if stream:
+            return StreamingResponse(iter([transcript]), media_type="text/plain")
+        return JSONResponse({"transcription": transcript})
 
     try:
-        suffix = Path(file.filename).suffix or ".wav"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            temp_path = Path(tmp.name)
-
-        # Convert to .wav if needed
-        if suffix != ".wav":
-            wav_path = temp_path.with_suffix(".wav")
-            audio = AudioSegment.from_file(temp_path)
-            audio.export(wav_path, format="wav")
-            temp_path.unlink()
-            temp_path = wav_path
+        if segments and stream:
+            def generate_segments():
+                items = []
+                for segment in stt_model.segments(audio, profile, "stream"):
+                    items.append(segment_to_dict(segment))
+                    yield json.dumps(items[-1]) + "\n"
+                for key in keys:
+                    transcript_cache.set(key, json.dumps(items))
+            return StreamingResponse(generate_segments(), media_type="application/x-ndjson")
+
+        if segments:
+            items = [segment_to_dict(segment) for segment in await run_in_threadpool(lambda: list(stt_model.segments(audio, profile)))]
+            for key in keys:
+                transcript_cache.set(key, json.dumps(items))
+            return JSONResponse({"transcription": segments_text(items), "segments": items})
 
         if stream:
             def generate():
-                for chunk in stt_model.transcribe_stream(str(temp_path)):
+                chunks = []
+                for chunk in stt_model.transcribe_stream(audio, profile):
+                    chunks.append(chunk)
                     yield chunk
-                temp_path.unlink()
+                for key in keys:
+                    transcript_cache.set(key, "".join(chunks)[:-1])  # same text transcribe() returns
             return StreamingResponse(generate(), media_type="text/plain")
 
-        transcript = stt_model.transcribe(str(temp_path))
-        temp_path.unlink()
+        transcript = await run_in_threadpool(stt_model.transcribe, audio, profile)
+        for key in keys:
+            transcript_cache.set(key, transcript)
         return JSONResponse({"transcription": transcript})
 
     except Exception as e:
-        print(f"[ERROR] Transcription error: {e}")
+        logger.error(f"Transcription error: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
+@app.get("/transcribe/profiles")
+def transcription_profiles():
+    """Decoding profiles accepted by /transcribe and /transcribe/jobs, and which one is the default"""
+    return {"default": STT_PROFILE, "profiles": {name: decode_options(name) for name in DECODING_PROFILES}}
+
+@app.get("/transcribe/cache")
+def transcript_cache_stats():
+    """Hit/miss counters and sizes of the transcript cache tiers"""
+    return transcript_cache.info()
+
+@app.post("/transcribe/jobs", status_code=202)
+async def submit_transcription_job(file: UploadFile = File(...), profile: Optional[str] = PROFILE_QUERY):
+    """Queue an audio file for background transcription and return its job id"""
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+    check_profile(profile)
+
+    upload = await spool_upload_file(file)
+    try:
+        job = transcription_queue.submit(upload.path, cache_key=transcript_cache_key(upload.sha256, profile), profile=profile)
+    except QueueFullError:
+        upload.path.unlink(missing_ok=True)
+        raise HTTPException(status_code=503, detail="Transcription queue is full, try again later")
+
+    return {"job_id": job.id, "status": job.status}
+
+@app.get("/transcribe/jobs/{job_id}")
+def get_transcription_job(job_id: str):
+    """Get the status and, once finished, the result of a transcription job"""
+    job = transcription_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/transcribe/jobs/{job_id}/events")
+async def stream_transcription_job(job_id: str):
+    """Stream job status changes as server-sent events until the job finishes"""
+    job = transcription_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last_status = None
+        while True:
+            if job.status != last_status:
+                last_status = job.status
+                yield sse_event(job.to_dict(), "status")
+            if job.done:
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/notes/from-audio", status_code=202)
+async def create_note_from_audio(
+    file: UploadFile = File(...),
+    user_id: int = Form(...),
+    category: Optional[str] = Form(None),
+    title: Optional[str] = Form(None),
+    profile: Optional[str] = PROFILE_QUERY,
+    stream: bool = Query(False, description="Answer with the job's progress events instead of its id"),
+    claims: Optional[TokenClaims] = Depends(get_token_claims),
+):
+    """
+    Transcribe a recording, summarize it and save it as a note in one job.
+    Summarizing starts while the recording is still being transcribed, so the
+    note is ready shortly after the transcript. Follow progress at
+    /notes/from-audio/{job_id}/events, or pass stream=true to get the events
+    in this response.
+    """
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+    check_profile(profile)
+    if not authorize_user(claims, user_id) and not await user_exists(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    upload = await spool_upload_file(file)
+    cache_keys = {"text": [transcript_cache_key(upload.sha256, profile)],
+                  "segments": [transcript_cache_key(upload.sha256, profile, segments=True)]}
+    try:
+        job = audio_note_pipeline.submit(upload.path, user_id, title or "Untitled Note", category or "",
+                                         profile, cache_keys)
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Too many audio notes in progress, try again later")
+
+    if stream:
+        return StreamingResponse(audio_note_events(job), media_type="text/event-stream", headers=SSE_HEADERS)
+    return JSONResponse({"job_id": job.id, "status": job.status}, status_code=202)
+
+async def audio_note_events(job):
+    async for event in job.follow():
+        yield sse_event(event["data"], event["event"])
+
+def find_audio_note_job(job_id: str, claims: Optional[TokenClaims]):
+    job = audio_note_pipeline.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    authorize_user(claims, job.user_id)
+    return job
+
+@app.get("/notes/from-audio/{job_id}")
+def get_audio_note_job(job_id: str, claims: Optional[TokenClaims] = Depends(get_token_claims)):
+    """Get the stage of an audio-to-note job and, once saved, the id of its note"""
+    return find_audio_note_job(job_id, claims).to_dict()
+
+@app.get("/notes/from-audio/{job_id}/events")
+async def stream_audio_note_job(job_id: str, claims: Optional[TokenClaims] = Depends(get_token_claims)):
+    """
+    Stream an audio-to-note job as server-sent events, from its start: "status"
+    on each stage, "audio" with the recording length, "segment" per transcribed
+    segment, "section" per partial summary, then "done" or "error"
+    """
+    job = find_audio_note_job(job_id, claims)
+    return StreamingResponse(audio_note_events(job), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.websocket("/ws/transcribe")
+async def live_transcribe(
+    websocket: WebSocket,
+    profile: Optional[str] = None,
+    format: str = "pcm_s16le",
+):
+    """
+    Live transcription while recording. Send audio as binary messages, either
+    raw 16 kHz mono PCM (format=pcm_s16le or pcm_f32le) or any stream ffmpeg
+    can read, such as MediaRecorder's WebM (format=ffmpeg), then {"type": "end"}.
+    Receive "partial" and "final" segments with timestamps as you go, then "done".
+    """
+    await websocket.accept()
+    try:
+        decode_options(profile)
+    except UnknownProfileError as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1008)
+        return
+    if format not in LIVE_FORMATS:
+        await websocket.send_json({"type": "error", "detail": f"format must be one of: {', '.join(LIVE_FORMATS)}"})
+        await websocket.close(code=1008)
+        return
+
+    logger.info(f"Live transcription started (format={format}, profile={profile})")
+    await run_live_session(websocket, LiveTranscriber(stt_model, profile), format)
+
 
 # ----------------------
 # Summarization Endpoint
 # ----------------------
 #Summurization API and logic worked on by Jorge 
 @app.post("/summarize", response_model=SummaryResponse)
-def summarize_text_endpoint(req: TextRequest):
+async def summarize_text_endpoint(req: TextRequest, claims: Optional[TokenClaims] = Depends(get_token_claims)):
     """Summarize and categorize text"""
     if not req.text or len(req.text.strip()) == 0:
         raise HTTPException(status_code=400, detail="Text cannot be empty")
     
-    summary, category = summarize_and_categorize(req.text)
+    summary, category = await summarize_and_categorize(req.text, claims.user_id if claims else req.user_id)
     return {"summary": summary, "category": category}
 
+@app.post("/summarize/stream")
+async def stream_summary_endpoint(req: TextRequest, claims: Optional[TokenClaims] = Depends(get_token_claims)):
+    """Stream the summary as server-sent events while Gemini generates it"""
+    if not req.text or len(req.text.strip()) == 0:
+        raise HTTPException(status_code=400, detail="Text cannot be empty")
+
+    return StreamingResponse(
+        sse_text_stream(stream_summary(req.text, claims.user_id if claims else req.user_id), {"category": "General"}),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+@app.get("/summarize/cache")
+def summary_cache_stats():
+    """Hit/miss counters of the summary cache and how many requests were coalesced"""
+    return {**summary_cache.info(), "coalesced": summary_flight.coalesced}
+
 # ----------------------
 # Study Guide Endpoint
 # ----------------------
 
+async def user_exists(user_id: int) -> bool:
+    async with async_session() as session:
+        return (await session.get(User, user_id)) is not None
+
 @app.post("/study-guide", response_model=StudyGuideResponse)
-def create_study_guide(req: StudyGuideRequest):
+async def create_study_guide(req: StudyGuideRequest, background_tasks: BackgroundTasks,
+                             claims: Optional[TokenClaims] = Depends(get_token_claims)):
     """Generate a study guide based on notes with a specific category for a specific user"""
     try:
         if not req.category or len(req.category.strip()) == 0:
@@ -529,23 +1075,52 @@ def create_study_guide(req: StudyGuideRequest):
         
         if not req.user_id:
             raise HTTPException(status_code=400, detail="User ID is required")
+
+        if req.refresh not in ("sync", "background"):
+            raise HTTPException(status_code=400, detail="refresh must be 'sync' or 'background'")
         
-        # Verify user exists
-        with Session(engine) as session:
-            user = session.get(User, req.user_id)
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
+        # Verify user exists, unless the caller's token already vouches for them
+        if not authorize_user(claims, req.user_id) and not await user_exists(req.user_id):
+            raise HTTPException(status_code=404, detail="User not found")
         
+        fingerprint, fresh, stale = await lookup_study_guide(req.category, req.user_id)
+        if fresh is not None:
+            logger.info(f"Serving stored study guide for user {req.user_id}, category: {req.category}")
+            return {"guide": fresh, "category": req.category, "cached": True}
+        if stale is not None and req.refresh == "background":
+            logger.info(f"Serving stale study guide for user {req.user_id}, category: {req.category}; refreshing in background")
+            background_tasks.add_task(generate_study_guide, req.category, req.user_id, fingerprint)
+            return {"guide": stale, "category": req.category, "cached": True, "stale": True}
+
         logger.info(f"Generating study guide for user {req.user_id}, category: {req.category}")
-        study_guide = generate_study_guide(req.category, req.user_id)
+        study_guide = await generate_study_guide(req.category, req.user_id, fingerprint)
         logger.info(f"Study guide generation completed for user {req.user_id}, category: {req.category}")
         
         return {"guide": study_guide, "category": req.category}
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = f"Error generating study guide: {str(e)}"
         logger.error(error_msg)
         raise HTTPException(status_code=500, detail=error_msg)
 
+@app.post("/study-guide/stream")
+async def stream_study_guide_endpoint(req: StudyGuideRequest, claims: Optional[TokenClaims] = Depends(get_token_claims)):
+    """Stream the study guide as server-sent events while Gemini generates it"""
+    if not req.category or len(req.category.strip()) == 0:
+        raise HTTPException(status_code=400, detail="Category cannot be empty")
+
+    # Verify user exists, unless the caller's token already vouches for them
+    if not authorize_user(claims, req.user_id) and not await user_exists(req.user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    logger.info(f"Streaming study guide for user {req.user_id}, category: {req.category}")
+    return StreamingResponse(
+        sse_text_stream(stream_study_guide(req.category, req.user_id), {"category": req.category}),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
 # ----------------------
 # Root Endpoint
 # ----------------------
@@ -560,28 +1135,69 @@ def read_root():
             {"path": "/users", "methods": ["GET", "POST"]},
             {"path": "/users/{user_id}", "methods": ["GET"]},
             {"path": "/users/{user_id}/notes", "methods": ["GET"]},
+            {"path": "/users/{user_id}/notes/search", "methods": ["GET"]},
+            {"path": "/users/{user_id}/notes:bulk", "methods": ["POST"]},
+            {"path": "/users/{user_id}/notes/export", "methods": ["GET"]},
+            {"path": "/notes/search/info", "methods": ["GET"]},
             {"path": "/notes", "methods": ["GET", "POST"]},
             {"path": "/notes/{note_id}", "methods": ["GET"]},
+            {"path": "/notes/{note_id}/segments", "methods": ["GET", "PUT"]},
+            {"path": "/notes/from-audio", "methods": ["POST"]},
+            {"path": "/notes/from-audio/{job_id}", "methods": ["GET"]},
+            {"path": "/notes/from-audio/{job_id}/events", "methods": ["GET"]},
             {"path": "/transcribe", "methods": ["POST"]},
+            {"path": "/transcribe/profiles", "methods": ["GET"]},
+            {"path": "/transcribe/cache", "methods": ["GET"]},
+            {"path": "/transcribe/jobs", "methods": ["POST"]},
+            {"path": "/transcribe/jobs/{job_id}", "methods": ["GET"]},
+            {"path": "/transcribe/jobs/{job_id}/events", "methods": ["GET"]},
+            {"path": "/ws/transcribe", "methods": ["WEBSOCKET"]},
             {"path": "/summarize", "methods": ["POST"]},
-            {"path": "/study-guide", "methods": ["POST"]}
+            {"path": "/summarize/stream", "methods": ["POST"]},
+            {"path": "/summarize/cache", "methods": ["GET"]},
+            {"path": "/study-guide", "methods": ["POST"]},
+            {"path": "/study-guide/stream", "methods": ["POST"]},
+            {"path": "/metrics", "methods": ["GET"]},
+            {"path": "/health", "methods": ["GET"]},
+            {"path": "/ready", "methods": ["GET"]}
         ]
     }
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: request latencies, STT real-time factor, Gemini calls, pools and caches"""
+    return Response(render(), media_type=CONTENT_TYPE)
+
 @app.get("/ping")
 def ping():
     return {"ping": "pong"}
 
+@app.get("/ready")
+async def ready(response: Response):
+    """Readiness probe: 503 until startup has finished (including a preloaded model) or while the database is unreachable"""
+    status = readiness.info()
+    status["stt_model_loaded"] = stt_model.loaded
+    if status["ready"]:
+        try:
+            async with async_session() as session:
+                await session.execute(text("SELECT 1"))
+        except Exception as e:
+            status["ready"] = False
+            status["database_error"] = str(e)
+    if not status["ready"]:
+        response.status_code = 503
+    return status
+
 @app.get("/health")
-def health():
+async def health():
     """Health check endpoint for API and Database"""
     health_status = {"api": "ok"}
     
     # Check database connection
     try:
-        with Session(engine) as session:
+        async with async_session() as session:
             # Simple query to test database connection
-            session.exec(select(User).limit(1)).all()
+            (await session.exec(select(User).limit(1))).all()
             health_status["database"] = "ok"
     except Exception as e:
         logger.error(f"Database health check failed: {str(e)}")
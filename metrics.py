@@ -0,0 +1,290 @@
+#Prometheus text-format metrics, collected in process with no extra dependencies
+import bisect
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.routing import Match
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"  # Response adds the charset
+
+# Seconds; covers cached lookups through long transcriptions and Gemini calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Sequence[str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(label) for label in labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+# Functions called at scrape time, returning ready-made metric families
+_collectors: List[Callable[[], Iterable["MetricFamily"]]] = []
+
+
+class MetricFamily:
+    """Gauge or counter values computed at scrape time (pool sizes, cache stats)"""
+
+    def __init__(self, name: str, documentation: str, kind: str = "gauge", labelnames: Sequence[str] = ()):
+        self.name, self.documentation, self.kind, self.labelnames = name, documentation, kind, tuple(labelnames)
+        self.samples: List[Tuple[Tuple[str, ...], float]] = []
+
+    def add(self, value: float, *labels: str) -> "MetricFamily":
+        self.samples.append((tuple(str(label) for label in labels), value))
+        return self
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in self.samples
+        ]
+
+
+def register_collector(collector: Callable[[], Iterable[MetricFamily]]):
+    _collectors.append(collector)
+    return collector
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            for family in collector():
+                lines.extend(family.render())
+        except Exception as e:
+            logger.warning(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {str(e)}")
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------
+# HTTP
+# ----------------------
+HTTP_REQUESTS = Counter("http_requests_total", "Requests by route template, method and status", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Time to send the full response, streaming included", ("method", "route"))
+HTTP_IN_PROGRESS = Gauge("http_requests_in_progress", "Requests being handled", ("method", "route"))
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (no BaseHTTPMiddleware, so streaming responses are
+    not buffered). Routes are labelled by their template, e.g.
+    /users/{user_id}/notes, to keep label cardinality bounded.
+    """
+
+    def __init__(self, app, routes_app=None):
+        self.app = app
+        self.routes_app = routes_app
+
+    def _route(self, scope) -> str:
+        for route in self.routes_app.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        route = self._route(scope)
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc(method, route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_LATENCY.observe(time.perf_counter() - start, method, route)
+            HTTP_REQUESTS.inc(method, route, status)
+            HTTP_IN_PROGRESS.dec(method, route)
+
+
+# ----------------------
+# Speech to text
+# ----------------------
+STT_AUDIO_SECONDS = Counter("stt_audio_seconds_total", "Seconds of audio transcribed", ("source",))
+STT_PROCESSING_SECONDS = Counter("stt_processing_seconds_total", "Wall time spent transcribing", ("source",))
+STT_REAL_TIME_FACTOR = Histogram("stt_real_time_factor", "Processing time divided by audio duration per transcription",
+                                 ("source",), buckets=RTF_BUCKETS)
+STT_BATCH_SIZE_OBSERVED = Histogram("stt_batch_size", "Clips decoded together per batched Whisper call",
+                                    buckets=(1, 2, 4, 8, 16, 32))
+TRANSCRIPTION_JOBS = Counter("transcription_jobs_total", "Background transcription jobs by outcome", ("status",))
+AUDIO_NOTE_JOBS = Counter("audio_note_jobs_total", "Audio-to-note pipeline jobs by outcome", ("status",))
+
+
+def record_transcription(audio_seconds: float, processing_seconds: float, source: str):
+    STT_AUDIO_SECONDS.inc(source, amount=audio_seconds)
+    STT_PROCESSING_SECONDS.inc(source, amount=processing_seconds)
+    if audio_seconds > 0:
+        STT_REAL_TIME_FACTOR.observe(processing_seconds / audio_seconds, source)
+
+
+# ----------------------
+# Gemini
+# ----------------------
+LLM_LATENCY = Histogram("llm_request_duration_seconds", "Gemini calls including retries, by call type and outcome", ("call", "outcome"))
+LLM_ERRORS = Counter("llm_errors_total", "Failed Gemini attempts by exception type", ("call", "error"))
+LLM_RETRIES = Counter("llm_retries_total", "Gemini attempts retried after a 429/5xx", ("call",))
+
+
+# ----------------------
+# Database pools
+# ----------------------
+DB_POOL_WAIT = Histogram("db_pool_checkout_seconds", "Time waiting for a pooled connection", ("engine",), buckets=POOL_WAIT_BUCKETS)
+
+
+class _TimedCheckout:
+    """Pool mixin timing how long checkouts wait for a free connection"""
+
+    metrics_label = ""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - start, self.metrics_label)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    metrics_label = "sync"
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    metrics_label = "async"
+
+
+def pool_families(pools: Dict[str, object]) -> List[MetricFamily]:
+    """Current size and usage of the queue pools"""
+    size = MetricFamily("db_pool_size", "Configured pool size", labelnames=("engine",))
+    checked_out = MetricFamily("db_pool_checked_out", "Connections in use", labelnames=("engine",))
+    overflow = MetricFamily("db_pool_overflow", "Connections open beyond the pool size", labelnames=("engine",))
+    for label, pool in pools.items():
+        if isinstance(pool, QueuePool):
+            size.add(pool.size(), label)
+            checked_out.add(pool.checkedout(), label)
+            overflow.add(max(pool.overflow(), 0), label)
+    return [size, checked_out, overflow]
+
+
+# ----------------------
+# Caches
+# ----------------------
+def cache_families(caches: Dict[str, dict]) -> List[MetricFamily]:
+    """Hit/miss counters and sizes from the caches' info() dicts"""
+    hits = MetricFamily("cache_hits_total", "Cache hits", "counter", ("cache",))
+    misses = MetricFamily("cache_misses_total", "Cache misses", "counter", ("cache",))
+    ratio = MetricFamily("cache_hit_ratio", "Hits over lookups since start", labelnames=("cache",))
+    size = MetricFamily("cache_bytes", "Bytes held", labelnames=("cache",))
+    for name, info in caches.items():
+        hits.add(info["hits"], name)
+        misses.add(info["misses"], name)
+        ratio.add(info["hit_ratio"], name)
+        if "bytes" in info:
+            size.add(info["bytes"], name)
+    return [hits, misses, ratio, size]
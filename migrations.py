@@ -0,0 +1,221 @@
+#Versioned schema migrations, applied at startup in place of create_all
+import argparse
+import logging
+from contextlib import contextmanager
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import SQLModel
+
+import models  # noqa: F401  (registers the tables on SQLModel.metadata)
+from note_compression import COMPRESSION_ENABLED
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_TABLE = "schema_version"
+MIGRATION_LOCK_NAME = "study_app_migrations"
+MIGRATION_LOCK_TIMEOUT = 60  # seconds to wait for another replica to finish migrating
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """Register a migration. Versions must be added in increasing order and never renumbered."""
+    def register(fn):
+        if MIGRATIONS and version <= MIGRATIONS[-1].version:
+            raise ValueError(f"Migration {version} registered out of order")
+        MIGRATIONS.append(Migration(version, description, fn))
+        return fn
+    return register
+
+
+# ----------------------
+# Helpers
+# ----------------------
+def _columns(conn: Connection, table: str) -> set:
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+
+def _indexes(conn: Connection, table: str) -> set:
+    return {index["name"] for index in inspect(conn).get_indexes(table)}
+
+
+def _create_index(conn: Connection, table: str, name: str):
+    """Create an index declared on the model, unless it already exists"""
+    if name in _indexes(conn, table):
+        return
+    index = next(index for index in SQLModel.metadata.tables[table].indexes if index.name == name)
+    logger.info(f"Creating index {name} on {table}")
+    index.create(conn)
+
+
+# ----------------------
+# Migrations
+# ----------------------
+# The models always describe the latest schema, so the baseline creates any
+# missing table in its current shape and later migrations must be no-ops on a
+# table that already has their change.
+@migration(1, "Create tables")
+def _create_tables(conn: Connection):
+    SQLModel.metadata.create_all(conn)
+
+
+@migration(2, "Add note.updated_at")
+def _add_note_updated_at(conn: Connection):
+    if "updated_at" not in _columns(conn, "note"):
+        conn.execute(text("ALTER TABLE note ADD COLUMN updated_at DATETIME"))
+        conn.execute(text("UPDATE note SET updated_at = created_at"))
+
+
+@migration(3, "Index user lookups and note listings")
+def _add_lookup_indexes(conn: Connection):
+    duplicates = conn.execute(text(
+        "SELECT 'username' AS field, username AS value FROM user GROUP BY username HAVING COUNT(*) > 1 "
+        "UNION ALL "
+        "SELECT 'email', email FROM user GROUP BY email HAVING COUNT(*) > 1"
+    )).fetchall()
+    if duplicates:
+        found = ", ".join(f"{field}={value!r}" for field, value in duplicates[:10])
+        raise RuntimeError(f"Cannot add unique user indexes, resolve duplicate accounts first: {found}")
+
+    for name in ("ix_user_username", "ix_user_email", "ix_user_created_at_id"):
+        _create_index(conn, "user", name)
+    for name in ("ix_note_user_category_created_at", "ix_note_user_created_at_id", "ix_note_created_at_id"):
+        _create_index(conn, "note", name)
+    # Study guides are looked up by (user_id, category); the composite replaces the user_id index.
+    # Create it first so MySQL always has an index backing the foreign key.
+    _create_index(conn, "studyguide", "ix_studyguide_user_category")
+    if "ix_studyguide_user_id" in _indexes(conn, "studyguide"):
+        conn.execute(text("DROP INDEX ix_studyguide_user_id ON studyguide" if conn.dialect.name == "mysql"
+                          else "DROP INDEX ix_studyguide_user_id"))
+
+
+# SQLite keeps an external-content FTS5 table over the note columns, kept in
+# sync by triggers; MySQL's FULLTEXT index is maintained by InnoDB itself
+NOTE_FTS_SQLITE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS note_fts USING fts5("
+    "title, transcription, summarized_notes, content='note', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS note_fts_insert AFTER INSERT ON note BEGIN "
+    "INSERT INTO note_fts(rowid, title, transcription, summarized_notes) "
+    "VALUES (new.id, new.title, new.transcription, new.summarized_notes); END",
+    "CREATE TRIGGER IF NOT EXISTS note_fts_delete AFTER DELETE ON note BEGIN "
+    "INSERT INTO note_fts(note_fts, rowid, title, transcription, summarized_notes) "
+    "VALUES ('delete', old.id, old.title, old.transcription, old.summarized_notes); END",
+    "CREATE TRIGGER IF NOT EXISTS note_fts_update AFTER UPDATE ON note BEGIN "
+    "INSERT INTO note_fts(note_fts, rowid, title, transcription, summarized_notes) "
+    "VALUES ('delete', old.id, old.title, old.transcription, old.summarized_notes); "
+    "INSERT INTO note_fts(rowid, title, transcription, summarized_notes) "
+    "VALUES (new.id, new.title, new.transcription, new.summarized_notes); END",
+    "INSERT INTO note_fts(note_fts) VALUES ('rebuild')",
+]
+
+
+def sqlite_has_fts5(conn: Connection) -> bool:
+    return bool(conn.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar())
+
+
+@migration(4, "Full-text index on notes")
+def _add_note_fulltext(conn: Connection):
+    if COMPRESSION_ENABLED:
+        # Compressed columns cannot be indexed; disabling compression and running the backfill adds the index
+        logger.warning("NOTE_COMPRESSION is set, skipping the note full-text index")
+        return
+    if conn.dialect.name == "mysql":
+        if "ft_note_text" not in _indexes(conn, "note"):
+            conn.execute(text("ALTER TABLE note ADD FULLTEXT INDEX ft_note_text (title, transcription, summarized_notes)"))
+    elif conn.dialect.name == "sqlite":
+        if not sqlite_has_fts5(conn):
+            logger.warning("SQLite was built without FTS5, note search will use the in-process index")
+            return
+        for statement in NOTE_FTS_SQLITE:
+            conn.execute(text(statement))
+
+
+@migration(5, "Add transcript segments")
+def _add_transcript_segments(conn: Connection):
+    SQLModel.metadata.tables["transcriptsegment"].create(conn, checkfirst=True)
+
+
+# ----------------------
+# Runner
+# ----------------------
+@contextmanager
+def _migration_lock(engine: Engine):
+    """Keep replicas starting at the same time from migrating concurrently (MySQL only)"""
+    if engine.dialect.name != "mysql":
+        yield
+        return
+    with engine.connect() as conn:
+        acquired = conn.execute(text("SELECT GET_LOCK(:name, :timeout)"),
+                                {"name": MIGRATION_LOCK_NAME, "timeout": MIGRATION_LOCK_TIMEOUT}).scalar()
+        if acquired != 1:
+            raise RuntimeError("Timed out waiting for another process to finish migrating")
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATION_LOCK_NAME})
+
+
+def _ensure_version_table(engine: Engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} ("
+            "version INTEGER NOT NULL PRIMARY KEY, "
+            "description VARCHAR(255) NOT NULL, "
+            "applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        ))
+
+
+def current_version(engine: Engine) -> int:
+    _ensure_version_table(engine)
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT MAX(version) FROM {SCHEMA_VERSION_TABLE}")).scalar() or 0
+
+
+def run_migrations(engine: Engine) -> int:
+    """Apply every pending migration in order and return the resulting schema version"""
+    with _migration_lock(engine):
+        version = current_version(engine)
+        for step in MIGRATIONS:
+            if step.version <= version:
+                continue
+            logger.info(f"Applying migration {step.version}: {step.description}")
+            # Each step records itself in the same transaction (MySQL commits DDL
+            # implicitly, which is why every step is written to be re-runnable)
+            with engine.begin() as conn:
+                step.apply(conn)
+                conn.execute(text(f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, description) VALUES (:version, :description)"),
+                             {"version": step.version, "description": step.description})
+            version = step.version
+    logger.info(f"Database schema at version {version}")
+    return version
+
+
+def pending_migrations(engine: Engine) -> List[Migration]:
+    version = current_version(engine)
+    return [step for step in MIGRATIONS if step.version > version]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Apply or inspect database schema migrations")
+    parser.add_argument("command", choices=["upgrade", "status"], nargs="?", default="upgrade")
+    args = parser.parse_args()
+
+    from databases import engine
+
+    if args.command == "status":
+        print(f"Current version: {current_version(engine)}")
+        for step in pending_migrations(engine):
+            print(f"Pending: {step.version} {step.description}")
+    else:
+        run_migrations(engine)
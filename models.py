@@ -1,10 +1,18 @@
 from sqlmodel import SQLModel, Field, Relationship
 from typing import Optional, List
 from datetime import datetime, date
-from sqlalchemy import Column, Text, String
+from sqlalchemy import Column, Text, String, Index
+from note_compression import CompressedText
 
 #This file worked on by Jorge
 class User(SQLModel, table=True):
+    # Lookups by username/email in register, login and update; created_at/id for paged listings
+    __table_args__ = (
+        Index("ix_user_username", "username", unique=True),
+        Index("ix_user_email", "email", unique=True),
+        Index("ix_user_created_at_id", "created_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     username: str
     password: str
@@ -20,12 +28,46 @@ class User(SQLModel, table=True):
 
 
 class Note(SQLModel, table=True):
+    # Category lookups for study guides, and paged listings per user and overall
+    __table_args__ = (
+        Index("ix_note_user_category_created_at", "user_id", "category", "created_at"),
+        Index("ix_note_user_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_note_created_at_id", "created_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str = Field(default="Untitled Note")
-    transcription: str = Field(sa_column=Column(Text(length=16777215), nullable=False))  # MEDIUMTEXT (up to 16MB)
-    summarized_notes: str = Field(sa_column=Column(Text, nullable=False))  # TEXT (up to 64KB)
+    # MEDIUMTEXT (up to 16MB) and TEXT (up to 64KB), or binary columns when NOTE_COMPRESSION is set
+    transcription: str = Field(sa_column=Column(CompressedText(length=16777215), nullable=False))
+    summarized_notes: str = Field(sa_column=Column(CompressedText(), nullable=False))
     category: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow, sa_column_kwargs={"onupdate": datetime.utcnow})
 
     user_id: int = Field(foreign_key="user.id")
     user: Optional[User] = Relationship(back_populates="notes")
+
+
+# Generated study guides, reused until the notes they were built from change
+class StudyGuide(SQLModel, table=True):
+    __table_args__ = (Index("ix_studyguide_user_category", "user_id", "category"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+    category: str
+    fingerprint: str = Field(max_length=64)  # sha256 of the source notes' ids and updated_at
+    guide: str = Field(sa_column=Column(Text(length=16777215), nullable=False))  # MEDIUMTEXT
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# Timed transcript segments of a note, clustered by (note_id, seq) so a range of
+# a long transcript is read without touching the rest of it
+class TranscriptSegment(SQLModel, table=True):
+    __table_args__ = (Index("ix_transcriptsegment_note_start", "note_id", "start_ms"),)
+
+    note_id: int = Field(foreign_key="note.id", primary_key=True)
+    seq: int = Field(primary_key=True)  # position in the transcript, from 0, in time order
+    start_ms: int
+    end_ms: int
+    text: str = Field(sa_column=Column(Text, nullable=False))
+    confidence: Optional[float] = None
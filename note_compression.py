@@ -0,0 +1,266 @@
+#Optional zlib/zstd compression of the large note text columns
+"""
+Compressed values are stored as binary with a three byte header:
+
+    0x00, format version, codec id, payload
+
+Anything else read from the column (a str, or bytes without the header) is
+plain UTF-8 text written before compression was enabled, so rows can be
+converted gradually and NOTE_COMPRESSION can be changed at any time; the
+backfill command rewrites existing rows with the current setting.
+"""
+import argparse
+import logging
+import os
+import zlib
+
+from sqlalchemy import LargeBinary, Text, inspect, text
+from sqlalchemy.dialects import mysql
+from sqlalchemy.types import TypeDecorator
+
+try:
+    import zstandard
+except ImportError:  # only needed when NOTE_COMPRESSION=zstd or zstd rows exist
+    zstandard = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+NOTE_COMPRESSION = os.environ.get("NOTE_COMPRESSION", "none").lower()  # none, zlib or zstd
+NOTE_COMPRESSION_LEVEL = os.environ.get("NOTE_COMPRESSION_LEVEL")  # codec default when unset
+NOTE_COMPRESSION_MIN_BYTES = int(os.environ.get("NOTE_COMPRESSION_MIN_BYTES", "256"))  # shorter values are stored as-is
+
+MAGIC = b"\x00"
+FORMAT_VERSION = 1
+CODECS = {"none": 0, "zlib": 1, "zstd": 2}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODECS.items()}
+
+if NOTE_COMPRESSION not in CODECS:
+    raise ValueError(f"NOTE_COMPRESSION must be one of {', '.join(CODECS)}")
+if NOTE_COMPRESSION == "zstd" and zstandard is None:
+    raise ValueError("NOTE_COMPRESSION=zstd needs the zstandard package")
+
+COMPRESSION_ENABLED = NOTE_COMPRESSION != "none"
+
+
+def _require_zstd():
+    if zstandard is None:
+        raise RuntimeError("Found zstd compressed note text but the zstandard package is not installed")
+    return zstandard
+
+
+def compress_text(value: str, codec: str = NOTE_COMPRESSION, level=NOTE_COMPRESSION_LEVEL) -> bytes:
+    """Encode text in the stored format, compressing it with codec when that makes it smaller"""
+    data = value.encode("utf-8")
+    payload, codec_id = data, CODECS["none"]
+    if codec != "none" and len(data) >= NOTE_COMPRESSION_MIN_BYTES:
+        if codec == "zstd":
+            compressed = _require_zstd().ZstdCompressor(level=int(level or 3)).compress(data)
+        else:
+            compressed = zlib.compress(data, int(level or 6))
+        if len(compressed) < len(data):
+            payload, codec_id = compressed, CODECS[codec]
+    return MAGIC + bytes((FORMAT_VERSION, codec_id)) + payload
+
+
+def stored_codec(value) -> str:
+    """Codec a stored value was written with; "plain" for text without the header"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+        if value[:1] == MAGIC and len(value) >= 3:
+            return CODEC_NAMES.get(value[2], "unknown")
+    return "plain"
+
+
+def decompress_text(value) -> str:
+    """Decode a stored value, whichever format it was written in"""
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    if value[:1] != MAGIC or len(value) < 3:
+        return value.decode("utf-8")
+    version, codec_id, payload = value[1], value[2], value[3:]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unknown note text format version {version}")
+    if codec_id == CODECS["none"]:
+        data = payload
+    elif codec_id == CODECS["zlib"]:
+        data = zlib.decompress(payload)
+    elif codec_id == CODECS["zstd"]:
+        data = _require_zstd().ZstdDecompressor().decompress(payload)
+    else:
+        raise ValueError(f"Unknown note text codec {codec_id}")
+    return data.decode("utf-8")
+
+
+class CompressedText(TypeDecorator):
+    """
+    Text column that is compressed on write when NOTE_COMPRESSION is set.
+
+    With compression off the column is a plain TEXT column and values are
+    written as text, so the full-text indexes keep working; with it on the
+    column is binary (BLOB/MEDIUMBLOB on MySQL) and values carry the header.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, length: int = None):
+        super().__init__()
+        self.length = length
+
+    def load_dialect_impl(self, dialect):
+        if not COMPRESSION_ENABLED:
+            return dialect.type_descriptor(Text(length=self.length))
+        if dialect.name == "mysql":
+            return dialect.type_descriptor(mysql.MEDIUMBLOB() if (self.length or 0) > 65535 else mysql.BLOB())
+        return dialect.type_descriptor(LargeBinary(length=self.length))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or not COMPRESSION_ENABLED:
+            return value
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
+
+
+# ----------------------
+# Schema checks and backfill
+# ----------------------
+# Columns and their MySQL types; must match the Note model
+NOTE_TEXT_COLUMNS = {"transcription": ("MEDIUMTEXT", "MEDIUMBLOB"), "summarized_notes": ("TEXT", "BLOB")}
+
+
+def _column_types(conn) -> dict:
+    return {column["name"]: column["type"] for column in inspect(conn).get_columns("note")}
+
+
+def _has_text_columns(conn) -> bool:
+    types = _column_types(conn)
+    return all(isinstance(types[name], Text) for name in NOTE_TEXT_COLUMNS)
+
+
+def _has_fts(conn) -> bool:
+    if conn.dialect.name == "mysql":
+        return "ft_note_text" in {index["name"] for index in inspect(conn).get_indexes("note")}
+    return inspect(conn).has_table("note_fts")
+
+
+def check_note_storage(engine):
+    """
+    Refuse to start with a schema that cannot hold the configured format:
+    compressed bytes need binary columns on MySQL, and the full-text index
+    would index compressed bytes. Fixed by running the backfill command.
+    """
+    if not COMPRESSION_ENABLED:
+        return
+    with engine.connect() as conn:
+        if conn.dialect.name == "mysql" and _has_text_columns(conn):
+            raise RuntimeError("NOTE_COMPRESSION is set but note text columns are TEXT; run `python note_compression.py backfill`")
+        if _has_fts(conn):
+            raise RuntimeError("NOTE_COMPRESSION is set but the note full-text index exists; run `python note_compression.py backfill`")
+
+
+def _prepare_for_compression(engine):
+    """Drop the full-text index and switch MySQL columns to binary"""
+    with engine.begin() as conn:
+        if conn.dialect.name == "mysql":
+            if _has_fts(conn):
+                conn.execute(text("ALTER TABLE note DROP INDEX ft_note_text"))
+            if _has_text_columns(conn):
+                logger.info("Converting note text columns to binary")
+                conn.execute(text("ALTER TABLE note " + ", ".join(
+                    f"MODIFY {name} {binary} NOT NULL" for name, (_, binary) in NOTE_TEXT_COLUMNS.items()
+                )))
+        elif _has_fts(conn):
+            for trigger in ("note_fts_insert", "note_fts_delete", "note_fts_update"):
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+            conn.execute(text("DROP TABLE note_fts"))
+
+
+def _restore_text_columns(engine):
+    """After decompressing every row: back to TEXT columns and the full-text index"""
+    from migrations import NOTE_FTS_SQLITE, sqlite_has_fts5
+
+    with engine.begin() as conn:
+        if conn.dialect.name == "mysql":
+            if not _has_text_columns(conn):
+                logger.info("Converting note text columns back to text")
+                conn.execute(text("ALTER TABLE note " + ", ".join(
+                    f"MODIFY {name} {text_type} NOT NULL" for name, (text_type, _) in NOTE_TEXT_COLUMNS.items()
+                )))
+            if not _has_fts(conn):
+                conn.execute(text("ALTER TABLE note ADD FULLTEXT INDEX ft_note_text (title, transcription, summarized_notes)"))
+        elif not _has_fts(conn) and sqlite_has_fts5(conn):
+            for statement in NOTE_FTS_SQLITE:
+                conn.execute(text(statement))
+
+
+def backfill(engine, batch_size: int = 200) -> dict:
+    """
+    Rewrite every note's text columns in the current NOTE_COMPRESSION format,
+    in id order and in batches. Rows already in that format are skipped, so
+    an interrupted run can simply be started again. updated_at is left alone.
+    """
+    if COMPRESSION_ENABLED:
+        _prepare_for_compression(engine)
+    target = NOTE_COMPRESSION if COMPRESSION_ENABLED else "plain"
+    stats = {"rows": 0, "rewritten": 0, "bytes_before": 0, "bytes_after": 0}
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text("SELECT id, transcription, summarized_notes FROM note WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                {"last_id": last_id, "limit": batch_size},
+            ).all()
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                stats["rows"] += 1
+                values = {}
+                for name in NOTE_TEXT_COLUMNS:
+                    raw = getattr(row, name)
+                    size = len(raw.encode("utf-8")) if isinstance(raw, str) else len(raw)
+                    stats["bytes_before"] += size
+                    codec = stored_codec(raw)
+                    # Values too small to compress are stored with the "none" codec
+                    if COMPRESSION_ENABLED and codec in (target, "none"):
+                        stats["bytes_after"] += size
+                        continue
+                    if not COMPRESSION_ENABLED and codec == "plain":
+                        stats["bytes_after"] += size
+                        continue
+                    decoded = decompress_text(raw)
+                    values[name] = compress_text(decoded) if COMPRESSION_ENABLED else decoded
+                    new_size = len(values[name]) if COMPRESSION_ENABLED else len(decoded.encode("utf-8"))
+                    stats["bytes_after"] += new_size
+                if values:
+                    updates.append({"id": row.id, **values})
+            for update in updates:
+                assignments = ", ".join(f"{name} = :{name}" for name in NOTE_TEXT_COLUMNS if name in update)
+                conn.execute(text(f"UPDATE note SET {assignments} WHERE id = :id"), update)
+            stats["rewritten"] += len(updates)
+            last_id = rows[-1].id
+        logger.info(f"Backfill at note {last_id}: {stats['rewritten']}/{stats['rows']} rows rewritten")
+    if not COMPRESSION_ENABLED:
+        _restore_text_columns(engine)
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Rewrite stored notes in the NOTE_COMPRESSION format")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    from databases import engine
+    from migrations import run_migrations
+
+    run_migrations(engine)
+    result = backfill(engine, args.batch_size)
+    ratio = result["bytes_after"] / result["bytes_before"] if result["bytes_before"] else 1.0
+    print(f"{result['rewritten']} of {result['rows']} notes rewritten as {NOTE_COMPRESSION}; "
+          f"text columns {result['bytes_before']} -> {result['bytes_after']} bytes ({ratio:.1%})")
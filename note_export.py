@@ -0,0 +1,65 @@
+#Streaming export of a user's notes as NDJSON or CSV
+import csv
+import io
+import json
+import logging
+import os
+from typing import AsyncIterator, Optional
+
+from sqlmodel import select
+
+from databases import async_engine
+from models import Note
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Rows fetched from the server-side cursor at a time; memory use is bounded by this, not by the number of notes
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "50"))
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_COLUMNS = ("id", "title", "category", "created_at", "updated_at", "transcription", "summarized_notes")
+
+
+def _export_statement(user_id: int, category: Optional[str]):
+    statement = select(*(getattr(Note, name) for name in EXPORT_COLUMNS)).where(Note.user_id == user_id)
+    if category is not None:
+        statement = statement.where(Note.category == category)
+    # Oldest first, so an export reads like the user's history
+    return statement.order_by(Note.created_at, Note.id)
+
+
+async def _stream_rows(user_id: int, category: Optional[str], batch_size: int):
+    """Rows from a server-side cursor (stream_results), batch_size at a time"""
+    async with async_engine.connect() as conn:
+        result = await conn.stream(_export_statement(user_id, category).execution_options(max_row_buffer=batch_size))
+        async for rows in result.partitions(batch_size):
+            yield rows
+
+
+async def export_notes(user_id: int, export_format: str, category: Optional[str] = None,
+                       batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Yield the user's notes encoded as export_format, one batch of rows per chunk"""
+    exported = 0
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        async for rows in _stream_rows(user_id, category, batch_size):
+            writer.writerows(
+                [row.id, row.title, row.category, row.created_at.isoformat(), row.updated_at.isoformat() if row.updated_at else "",
+                 row.transcription, row.summarized_notes]
+                for row in rows
+            )
+            exported += len(rows)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+    else:
+        async for rows in _stream_rows(user_id, category, batch_size):
+            exported += len(rows)
+            yield "".join(json.dumps(dict(row._mapping), default=lambda value: value.isoformat()) + "\n"
+                          for row in rows).encode("utf-8")
+    logger.info(f"Exported {exported} notes for user {user_id} as {export_format}")
@@ -0,0 +1,181 @@
+#Bulk import of notes from a streamed NDJSON body, inserted in batches
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional
+
+from pydantic import BaseModel, ValidationError, validator
+from sqlalchemy import insert
+
+from databases import async_engine
+from models import Note
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+BULK_IMPORT_BATCH_SIZE = int(os.environ.get("BULK_IMPORT_BATCH_SIZE", "1000"))
+BULK_IMPORT_MAX_BATCH_SIZE = 10000
+BULK_IMPORT_MAX_LINE_BYTES = int(os.environ.get("BULK_IMPORT_MAX_LINE_MB", "20")) * 1024 * 1024
+BULK_IMPORT_MAX_ERRORS = 1000  # errors listed in the response; the count keeps going
+
+# Column limits on MySQL (VARCHAR(255), MEDIUMTEXT, TEXT); checked up front so a bad
+# line is reported on its own instead of failing the batch it is in
+MAX_TITLE_CHARS = 255
+MAX_TRANSCRIPTION_BYTES = 16777215
+MAX_SUMMARY_BYTES = 65535
+
+
+class NoteImportLine(BaseModel):
+    """One NDJSON line; unknown fields from other tools are ignored"""
+    title: Optional[str] = None
+    transcription: str = ""
+    summarized_notes: str = ""
+    category: str = ""
+    created_at: Optional[datetime] = None  # keeps the original date when migrating
+
+    @validator("title", "category")
+    def short_text(cls, value):
+        if value is not None and len(value) > MAX_TITLE_CHARS:
+            raise ValueError(f"longer than {MAX_TITLE_CHARS} characters")
+        return value
+
+    @validator("transcription")
+    def transcription_size(cls, value):
+        if len(value.encode("utf-8")) > MAX_TRANSCRIPTION_BYTES:
+            raise ValueError("larger than 16 MB")
+        return value
+
+    @validator("summarized_notes")
+    def summary_size(cls, value):
+        if len(value.encode("utf-8")) > MAX_SUMMARY_BYTES:
+            raise ValueError("larger than 64 KB")
+        return value
+
+    @validator("created_at")
+    def naive_utc(cls, value):
+        # Stored like datetime.utcnow(): naive, in UTC
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
+class ImportReport:
+    def __init__(self):
+        self.lines = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    def error(self, line: int, message: str):
+        self.failed += 1
+        if len(self.errors) < BULK_IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self) -> dict:
+        return {
+            "lines": self.lines,
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+async def ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int = BULK_IMPORT_MAX_LINE_BYTES):
+    """Yield (line number, bytes or None) from a byte stream; None marks a line that was too long"""
+    buffer = bytearray()
+    number = 0
+    skipping = False
+    async for chunk in chunks:
+        buffer.extend(chunk)
+        while True:
+            end = buffer.find(b"\n")
+            if end < 0:
+                break
+            number += 1
+            line = bytes(buffer[:end])
+            del buffer[:end + 1]
+            if skipping:
+                skipping = False
+                yield number, None
+            else:
+                yield number, line
+        if len(buffer) > max_line_bytes:
+            # Drop the rest of this line as it arrives instead of buffering it
+            buffer.clear()
+            skipping = True
+    if skipping:
+        yield number + 1, None
+    elif buffer.strip():
+        yield number + 1, bytes(buffer)
+
+
+def _row(user_id: int, note: NoteImportLine, now: datetime) -> dict:
+    created_at = note.created_at or now
+    return {
+        "user_id": user_id,
+        "title": note.title or "Untitled Note",
+        "transcription": note.transcription,
+        "summarized_notes": note.summarized_notes,
+        "category": note.category,
+        "created_at": created_at,
+        "updated_at": created_at,
+    }
+
+
+async def _insert_batch(batch: List[tuple], report: ImportReport):
+    """Insert a batch in one statement and transaction; if it fails, retry its rows one by one to find the bad ones"""
+    statement = insert(Note.__table__)
+    try:
+        async with async_engine.begin() as conn:
+            await conn.execute(statement, [row for _, row in batch])
+        report.imported += len(batch)
+        return
+    except Exception as e:
+        logger.warning(f"Bulk insert of {len(batch)} notes failed ({e}); retrying row by row")
+    for line, row in batch:
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(statement, row)
+            report.imported += 1
+        except Exception as e:
+            report.error(line, f"Database error: {e.__class__.__name__}")
+
+
+async def import_notes(chunks: AsyncIterator[bytes], user_id: int, batch_size: int = BULK_IMPORT_BATCH_SIZE) -> dict:
+    """
+    Validate NDJSON notes as they stream in and insert them for user_id,
+    batch_size rows per statement and transaction. Lines that fail are
+    reported by line number and the rest of the import carries on.
+    """
+    report = ImportReport()
+    batch: List[tuple] = []
+    now = datetime.utcnow()
+    async for number, line in ndjson_lines(chunks):
+        if line is None:
+            report.lines += 1
+            report.error(number, f"Line longer than {BULK_IMPORT_MAX_LINE_BYTES // (1024 * 1024)} MB")
+            continue
+        if not line.strip():
+            continue
+        report.lines += 1
+        try:
+            note = NoteImportLine.parse_obj(json.loads(line))
+        except json.JSONDecodeError as e:
+            report.error(number, f"Invalid JSON: {e.msg}")
+            continue
+        except ValidationError as e:
+            report.error(number, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+            continue
+        except (TypeError, ValueError) as e:
+            report.error(number, f"Invalid note: {e}")
+            continue
+        batch.append((number, _row(user_id, note, now)))
+        if len(batch) >= batch_size:
+            await _insert_batch(batch, report)
+            batch = []
+    if batch:
+        await _insert_batch(batch, report)
+    logger.info(f"Bulk import for user {user_id}: {report.imported} imported, {report.failed} failed")
+    return report.to_dict()
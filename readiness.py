@@ -0,0 +1,66 @@
+#Startup phase timing and the state behind the /ready probe
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Taken when this module is first imported, which main.py does before its heavier imports
+PROCESS_STARTED = time.perf_counter()
+
+
+class Readiness:
+    """
+    Named components that must be ready before the instance takes traffic,
+    plus how long each startup phase took. /ready reports this; /health only
+    says whether the process is alive.
+    """
+
+    def __init__(self):
+        self._components: Dict[str, dict] = {}
+        self._phases: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def require(self, name: str):
+        """Declare a component that has to be marked ready before the instance is"""
+        with self._lock:
+            self._components.setdefault(name, {"ready": False, "error": None})
+
+    def mark(self, name: str, ready: bool = True, error: Optional[str] = None):
+        with self._lock:
+            self._components[name] = {"ready": ready, "error": error}
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a startup phase and log it; an exception marks the phase's component as failed"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.mark(name, False, str(e))
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._phases[name] = round(elapsed, 4)
+            logger.info(f"Startup phase '{name}' took {elapsed * 1000:.0f}ms")
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return all(component["ready"] for component in self._components.values())
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "ready": all(component["ready"] for component in self._components.values()),
+                "components": {name: dict(component) for name, component in self._components.items()},
+                "startup_phases_s": dict(self._phases),
+            }
+
+
+# The process-wide readiness state
+readiness = Readiness()
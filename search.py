@@ -0,0 +1,223 @@
+#Ranked full-text search over a user's notes: MySQL FULLTEXT, SQLite FTS5, or an in-process inverted index
+import html
+import logging
+import math
+import os
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import DateTime, func, inspect, text
+from sqlmodel import select
+
+from caching import LRUCache, SingleFlight
+from models import Note
+from note_compression import COMPRESSION_ENABLED
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "auto")  # "python" forces the in-process index
+SEARCH_INDEX_CACHE_MB = int(os.environ.get("SEARCH_INDEX_CACHE_MB", "64"))  # in-process indexes, least recently used evicted
+MAX_QUERY_TERMS = 16
+SNIPPET_CHARS = 160
+HIGHLIGHT_START, HIGHLIGHT_END = "<mark>", "</mark>"
+# FTS5 marks matches with these and the snippet is HTML-escaped before they become <mark> tags
+FTS5_MARK_START, FTS5_MARK_END = "\x02", "\x03"
+TITLE_WEIGHT = 3  # a title match counts as this many body matches
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+class SearchHit(NamedTuple):
+    id: int
+    user_id: int
+    title: str
+    category: str
+    created_at: datetime
+    score: float
+    snippet: str
+
+
+def tokenize(value: str) -> List[str]:
+    return TOKEN_RE.findall(value.lower())
+
+
+def query_terms(query: str) -> List[str]:
+    """Distinct words of a query, in order; punctuation and operators are dropped"""
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+
+def make_snippet(texts: List[str], terms: List[str]) -> str:
+    """HTML-escaped window of text around the first term found, with every term in it highlighted"""
+    pattern = re.compile(r"\b(" + "|".join(re.escape(term) for term in terms) + r")\b", re.IGNORECASE)
+    for value in texts:
+        match = pattern.search(value or "")
+        if match:
+            start = max(0, match.start() - SNIPPET_CHARS // 3)
+            window = value[start:start + SNIPPET_CHARS]
+            snippet = "".join(
+                f"{HIGHLIGHT_START}{html.escape(part)}{HIGHLIGHT_END}" if i % 2 else html.escape(part)
+                for i, part in enumerate(pattern.split(window))
+            )
+            return ("…" if start > 0 else "") + snippet + ("…" if start + SNIPPET_CHARS < len(value) else "")
+    first = next((value for value in texts if value), "")
+    return html.escape(first[:SNIPPET_CHARS]) + ("…" if len(first) > SNIPPET_CHARS else "")
+
+
+def fts5_snippet(value: str) -> str:
+    """HTML-escape an FTS5 snippet() made with the FTS5_MARK_* markers, then turn them into highlights"""
+    return html.escape(value or "").replace(FTS5_MARK_START, HIGHLIGHT_START).replace(FTS5_MARK_END, HIGHLIGHT_END)
+
+
+class _UserIndex:
+    """BM25 inverted index over one user's notes"""
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, rows):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.lengths: Dict[int, int] = {}
+        self.notes: Dict[int, tuple] = {}
+        self.nbytes = 0
+        for row in rows:
+            counts = Counter(tokenize(row.transcription or "") + tokenize(row.summarized_notes or ""))
+            for term in tokenize(row.title or ""):
+                counts[term] += TITLE_WEIGHT
+            for term, count in counts.items():
+                self.postings.setdefault(term, {})[row.id] = count
+            self.lengths[row.id] = sum(counts.values())
+            self.notes[row.id] = row
+            self.nbytes += len(row.transcription or "") + len(row.summarized_notes or "") + 64 * len(counts)
+        self.average_length = (sum(self.lengths.values()) / len(self.lengths)) if self.lengths else 0.0
+
+    def search(self, terms: List[str]) -> List[Tuple[float, int]]:
+        scores: Dict[int, float] = {}
+        total = len(self.lengths)
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for note_id, count in postings.items():
+                norm = 1 - self.B + self.B * self.lengths[note_id] / (self.average_length or 1)
+                scores[note_id] = scores.get(note_id, 0.0) + idf * count * (self.K1 + 1) / (count + self.K1 * norm)
+        return sorted(((score, note_id) for note_id, score in scores.items()), key=lambda hit: (-hit[0], -hit[1]))
+
+
+class NoteSearch:
+    """
+    Searches one user's notes with the best index the database offers.
+
+    MySQL uses the FULLTEXT index and SQLite the FTS5 table created by
+    migration 4; both are kept in sync with note writes by the database.
+    Otherwise (including when note text is compressed) an in-process BM25 index is built per user and rebuilt whenever
+    that user's notes change (count, newest id or latest updated_at).
+    """
+
+    def __init__(self, cache_mb: int = SEARCH_INDEX_CACHE_MB):
+        self.backend = "python"
+        self._indexes = LRUCache(cache_mb * 1024 * 1024, sizeof=lambda entry: entry[1].nbytes)
+        self._builds = SingleFlight()
+
+    def configure(self, engine):
+        """Pick the backend once the schema is migrated"""
+        if SEARCH_BACKEND == "python" or COMPRESSION_ENABLED:
+            # Compressed note text cannot be indexed by the database
+            self.backend = "python"
+        elif engine.dialect.name == "mysql":
+            self.backend = "mysql"
+        elif engine.dialect.name == "sqlite" and inspect(engine).has_table("note_fts"):
+            self.backend = "fts5"
+        else:
+            self.backend = "python"
+        logger.info(f"Note search backend: {self.backend}")
+
+    async def search(self, session, user_id: int, query: str, offset: int, limit: int) -> List[SearchHit]:
+        """Up to limit hits for the user, best first, skipping the first offset"""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        if self.backend == "mysql":
+            return await self._search_mysql(session, user_id, terms, offset, limit)
+        if self.backend == "fts5":
+            return await self._search_fts5(session, user_id, terms, offset, limit)
+        return await self._search_python(session, user_id, terms, offset, limit)
+
+    async def _search_mysql(self, session, user_id, terms, offset, limit) -> List[SearchHit]:
+        match = "MATCH(title, transcription, summarized_notes) AGAINST (:query IN NATURAL LANGUAGE MODE)"
+        ranked = (await session.execute(
+            text(f"SELECT id, {match} AS score FROM note WHERE user_id = :user_id AND {match} "
+                 "ORDER BY score DESC, id DESC LIMIT :limit OFFSET :offset"),
+            {"query": " ".join(terms), "user_id": user_id, "limit": limit, "offset": offset},
+        )).all()
+        if not ranked:
+            return []
+        # The text columns are only read for the page being returned, to build snippets
+        rows = (await session.execute(
+            select(Note.id, Note.user_id, Note.title, Note.category, Note.created_at, Note.summarized_notes, Note.transcription)
+            .where(Note.id.in_([row.id for row in ranked]))
+        )).all()
+        by_id = {row.id: row for row in rows}
+        return [
+            SearchHit(row.id, row.user_id, row.title, row.category, row.created_at, float(score),
+                      make_snippet([row.summarized_notes, row.transcription], terms))
+            for row, score in ((by_id[hit.id], hit.score) for hit in ranked if hit.id in by_id)
+        ]
+
+    async def _search_fts5(self, session, user_id, terms, offset, limit) -> List[SearchHit]:
+        statement = text(
+            "SELECT note.id, note.user_id, note.title, note.category, note.created_at, "
+            # bm25 weights per column (title, transcription, summarized_notes); lower is better
+            "-bm25(note_fts, 3.0, 1.0, 2.0) AS score, "
+            "snippet(note_fts, -1, :mark_start, :mark_end, '…', 24) AS snippet "
+            "FROM note_fts JOIN note ON note.id = note_fts.rowid "
+            "WHERE note_fts MATCH :match AND note.user_id = :user_id "
+            "ORDER BY score DESC, note.id DESC LIMIT :limit OFFSET :offset"
+        ).columns(created_at=DateTime)
+        rows = (await session.execute(statement, {
+            "match": " OR ".join(f'"{term}"' for term in terms),
+            "mark_start": FTS5_MARK_START, "mark_end": FTS5_MARK_END,
+            "user_id": user_id, "limit": limit, "offset": offset,
+        })).all()
+        return [SearchHit(row.id, row.user_id, row.title, row.category, row.created_at, row.score, fts5_snippet(row.snippet))
+                for row in rows]
+
+    async def _search_python(self, session, user_id, terms, offset, limit) -> List[SearchHit]:
+        index = await self._user_index(session, user_id)
+        hits = index.search(terms)[offset:offset + limit]
+        return [
+            SearchHit(note.id, note.user_id, note.title, note.category, note.created_at, score,
+                      make_snippet([note.summarized_notes, note.transcription], terms))
+            for score, note in ((score, index.notes[note_id]) for score, note_id in hits)
+        ]
+
+    async def _user_index(self, session, user_id: int) -> _UserIndex:
+        version = tuple((await session.execute(
+            select(func.count(Note.id), func.max(Note.id), func.max(Note.updated_at)).where(Note.user_id == user_id)
+        )).one())
+        cached = self._indexes.get(str(user_id))
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        async def build():
+            rows = (await session.execute(
+                select(Note.id, Note.user_id, Note.title, Note.category, Note.created_at, Note.summarized_notes, Note.transcription)
+                .where(Note.user_id == user_id)
+            )).all()
+            index = await run_in_threadpool(_UserIndex, rows)
+            self._indexes.set(str(user_id), (version, index))
+            logger.info(f"Built search index for user {user_id}: {len(rows)} notes, {len(index.postings)} terms")
+            return index
+
+        return await self._builds.do(f"{user_id}:{version}", build)
+
+    def info(self) -> dict:
+        return {"backend": self.backend, "python_index": self._indexes.info()}
+
+
+# The process-wide search
+note_search = NoteSearch()
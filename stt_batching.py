@@ -0,0 +1,217 @@
+#Micro-batching of short transcriptions into one batched Whisper encode/decode
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE
+from metrics import STT_BATCH_SIZE_OBSERVED
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Clips decoded together at most (1 turns batching off), and how long the first
+# clip of a batch waits for company before it is decoded anyway
+STT_BATCH_SIZE = int(os.environ.get("STT_BATCH_SIZE", "8"))
+STT_BATCH_WAIT_MS = float(os.environ.get("STT_BATCH_WAIT_MS", "50"))
+
+# Whisper's encoder window; clips up to this long fit in one batch row
+WINDOW_SECONDS = 30
+MAX_DECODE_TOKENS = 448  # decoder context of every Whisper model
+TIME_PRECISION = 0.02  # seconds per timestamp token
+MAX_INITIAL_TIMESTAMP = 1.0  # as WhisperModel.transcribe: the first segment starts within a second
+
+# decode options that change a batched decode; clips only share a batch when these match
+BATCH_OPTIONS = ("beam_size", "patience", "length_penalty", "language", "no_speech_threshold", "log_prob_threshold")
+# Options a batched decode gives the same result for as WhisperModel.transcribe. best_of only
+# matters when sampling, and condition_on_previous_text only from the second 30 s window on,
+# so at temperature 0 on a single-window clip both are moot. Anything else (a temperature
+# fallback, VAD, prompts, word timestamps) sends the clip through WhisperModel.transcribe.
+BATCHABLE_OPTIONS = frozenset(BATCH_OPTIONS + ("temperature", "best_of", "condition_on_previous_text", "vad_filter"))
+# VAD picks which stretches of a recording get decoded. A single-window clip is decoded whole
+# in a batch instead, and the no-speech check drops it if it is silent, so the "fast"
+# profile's short clips are batched with VAD off.
+VAD_OPTIONS = ("vad_filter", "vad_parameters")
+
+
+def batchable(options: dict) -> bool:
+    """Whether decode_batch honours every one of these WhisperModel.transcribe options"""
+    if not set(options) <= BATCHABLE_OPTIONS or options.get("vad_filter"):
+        return False
+    # No temperature means faster-whisper's fallback schedule, which a batch cannot follow
+    temperature = options.get("temperature")
+    temperatures = list(temperature) if isinstance(temperature, (list, tuple)) else [temperature]
+    return temperatures == [0] or temperatures == [0.0]
+
+
+def timed_segments(tokenizer, tokens: List[int], duration: float,
+                   confidence: Optional[float]) -> List[Tuple[float, float, str, Optional[float]]]:
+    """
+    Split a decoded token sequence into (start, end, text, confidence) segments
+    at its timestamp tokens (<|0.00|> text <|2.40|><|2.40|> text <|5.00|>), as
+    WhisperModel.transcribe does for one window. Text after the last timestamp
+    runs to the end of the clip.
+    """
+    segments, start, text_tokens = [], 0.0, []
+    for token in tokens:
+        if token < tokenizer.timestamp_begin:
+            text_tokens.append(token)
+            continue
+        time = min(round((token - tokenizer.timestamp_begin) * TIME_PRECISION, 2), duration)
+        if text_tokens:
+            segments.append((start, max(start, time), tokenizer.decode(text_tokens), confidence))
+            text_tokens = []
+        start = time
+    if text_tokens:
+        segments.append((start, max(start, duration), tokenizer.decode(text_tokens), confidence))
+    return [segment for segment in segments if segment[2].strip()]
+
+
+def decode_batch(whisper, clips: List[np.ndarray],
+                 options: dict) -> List[List[Tuple[float, float, str, Optional[float]]]]:
+    """
+    Transcribe clips of up to WINDOW_SECONDS in one encoder pass and one
+    batched beam search on a faster_whisper.WhisperModel, returning the timed
+    segments of each clip. Only used for options that batchable() accepts:
+    a clip is a single window, and a temperature fallback would re-run the
+    whole batch.
+    """
+    import ctranslate2
+    from faster_whisper.tokenizer import Tokenizer
+
+    frames = whisper.feature_extractor.nb_max_frames
+    features = []
+    for audio in clips:
+        mel = whisper.feature_extractor(audio)[:, :frames]
+        features.append(np.pad(mel, ((0, 0), (0, frames - mel.shape[-1]))))
+    encoder_output = whisper.model.encode(ctranslate2.StorageView.from_array(np.ascontiguousarray(np.stack(features))))
+
+    multilingual = whisper.model.is_multilingual
+    if options.get("language") or not multilingual:
+        languages = [options.get("language") or "en"] * len(clips)
+    else:
+        # Best language token per clip, e.g. "<|en|>"
+        languages = [ranked[0][0][2:-2] for ranked in whisper.model.detect_language(encoder_output)]
+
+    tokenizers = [Tokenizer(whisper.hf_tokenizer, multilingual, task="transcribe", language=language)
+                  if multilingual else Tokenizer(whisper.hf_tokenizer, False) for language in languages]
+    prompts = [list(tokenizer.sot_sequence) for tokenizer in tokenizers]
+    results = whisper.model.generate(
+        encoder_output,
+        prompts,
+        beam_size=options.get("beam_size", 5),
+        patience=options.get("patience", 1),
+        length_penalty=options.get("length_penalty", 1),
+        max_length=MAX_DECODE_TOKENS,
+        max_initial_timestamp_index=int(round(MAX_INITIAL_TIMESTAMP / TIME_PRECISION)),
+        return_scores=True,
+        return_no_speech_prob=True,
+        suppress_blank=True,
+        suppress_tokens=[-1],
+    )
+
+    decoded = []
+    for audio, tokenizer, result in zip(clips, tokenizers, results):
+        tokens = result.sequences_ids[0]
+        # Scores come back length-normalized; Whisper's silence rule uses the sum over tokens + 1
+        avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+        silent = (result.no_speech_prob > options.get("no_speech_threshold", 0.6)
+                  and avg_logprob < options.get("log_prob_threshold", -1.0))
+        decoded.append([] if silent else timed_segments(tokenizer, tokens, len(audio) / SAMPLE_RATE,
+                                                         math.exp(avg_logprob)))
+    return decoded
+
+
+class BatchScheduler:
+    """
+    Queues short clips from concurrent requests and decodes them together on
+    one thread. A batch is decoded once it has max_batch clips or its oldest
+    clip has waited max_wait seconds; while a batch decodes, the next one
+    fills up. Callers block until their own segments are ready.
+    """
+
+    def __init__(self, stt_model, max_batch: int = STT_BATCH_SIZE, max_wait: float = STT_BATCH_WAIT_MS / 1000):
+        self.stt_model = stt_model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queues: Dict[str, Deque[Tuple[np.ndarray, float, Future]]] = {}  # batch options as JSON -> clips
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def wants(self, audio, options: dict) -> bool:
+        """Single-window clips, decoded with options a batch follows once VAD is left out"""
+        if not isinstance(audio, np.ndarray) or len(audio) > WINDOW_SECONDS * SAMPLE_RATE:
+            return False
+        return batchable({name: value for name, value in options.items() if name not in VAD_OPTIONS})
+
+    def transcribe(self, audio: np.ndarray, options: dict) -> List[Tuple[float, float, str, Optional[float]]]:
+        key = json.dumps({name: options[name] for name in BATCH_OPTIONS if name in options}, sort_keys=True)
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Transcription batcher is shut down")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stt-batcher", daemon=True)
+                self._thread.start()
+            self._queues.setdefault(key, deque()).append((audio, time.monotonic(), future))
+            self._cond.notify()
+        return future.result()
+
+    def _next_batch(self) -> Tuple[Optional[str], Optional[float]]:
+        """The queue to decode next and how long until it is due (0 if now); (None, None) when all are empty"""
+        best_key, best_wait = None, None
+        now = time.monotonic()
+        for key, pending in self._queues.items():
+            if not pending:
+                continue
+            wait = 0.0 if len(pending) >= self.max_batch else max(0.0, pending[0][1] + self.max_wait - now)
+            if best_wait is None or wait < best_wait:
+                best_key, best_wait = key, wait
+        return best_key, best_wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    key, wait = self._next_batch()
+                    if key is not None and wait == 0:
+                        break
+                    self._cond.wait(wait)
+                pending = self._queues[key]
+                batch = [pending.popleft() for _ in range(min(self.max_batch, len(pending)))]
+                if not pending:
+                    del self._queues[key]
+            self._decode(batch, json.loads(key))
+
+    def _decode(self, batch: List[Tuple[np.ndarray, float, Future]], options: dict):
+        start = time.perf_counter()
+        try:
+            decoded = decode_batch(self.stt_model.model, [audio for audio, _, _ in batch], options)
+        except Exception as e:
+            logger.error(f"Batched transcription of {len(batch)} clips failed: {str(e)}")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        STT_BATCH_SIZE_OBSERVED.observe(len(batch))
+        logger.debug(f"Decoded a batch of {len(batch)} clips in {time.perf_counter() - start:.2f}s")
+        for (_, _, future), segments in zip(batch, decoded):
+            future.set_result(segments)
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            pending = [item for queue in self._queues.values() for item in queue]
+            self._queues.clear()
+            self._cond.notify_all()
+        for _, _, future in pending:
+            future.set_exception(RuntimeError("Transcription batcher is shut down"))
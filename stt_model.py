@@ -1,15 +1,157 @@
 #Rodolfo's stt model set up
-from faster_whisper import WhisperModel
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Iterator, NamedTuple, Optional, Union
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE
+from long_audio import LongAudioTranscriber, STT_LONG_AUDIO_WORKERS
+from stt_batching import BatchScheduler, STT_BATCH_SIZE
+from metrics import record_transcription
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+STT_MODEL_SIZE = os.environ.get("STT_MODEL_SIZE", "base")
+# When the API process loads Whisper: "none" on the first transcription, "background" in a
+# thread right after startup, "startup" before the app accepts requests
+STT_PRELOAD = os.environ.get("STT_PRELOAD", "none").lower()
+# CTranslate2 settings fixed when the model loads: intra-op threads (0 = its default)
+# and how many transcriptions one loaded model runs in parallel
+STT_CPU_THREADS = int(os.environ.get("STT_CPU_THREADS", "0"))
+STT_NUM_WORKERS = int(os.environ.get("STT_NUM_WORKERS", "1"))
+# Profile used when a request does not name one
+STT_PROFILE = os.environ.get("STT_PROFILE", "balanced")
+# Spoken language of the uploads; fixing it skips language detection on every file
+STT_LANGUAGE = os.environ.get("STT_LANGUAGE") or None
+
+# Keyword arguments for WhisperModel.transcribe, per profile. These are part of the
+# transcript cache key, so changing one only invalidates that profile's transcripts.
+DECODING_PROFILES = {
+    # Greedy, no temperature fallback, silent stretches skipped
+    "fast": {
+        "beam_size": 1,
+        "best_of": 1,
+        "temperature": [0.0],
+        "condition_on_previous_text": False,
+        "vad_filter": True,
+        "vad_parameters": {"min_silence_duration_ms": 500},
+        "language": STT_LANGUAGE,
+    },
+    # faster-whisper's own defaults (beam search, temperature fallback, no VAD), so requests
+    # that name no profile get the same transcripts as before profiles existed
+    "balanced": {
+        "language": STT_LANGUAGE,
+    },
+    # Every stretch decoded, wider sampling on fallback
+    "accurate": {
+        "beam_size": 5,
+        "best_of": 5,
+        "patience": 2,
+        "temperature": [0.0, 0.2, 0.4, 0.6, 0.8, 1.0],
+        "vad_filter": False,
+        "language": STT_LANGUAGE,
+    },
+}
+# Per-profile overrides as JSON, e.g. STT_PROFILES='{"fast": {"beam_size": 2}, "lecture": {"beam_size": 3}}'
+for _name, _options in json.loads(os.environ.get("STT_PROFILES") or "{}").items():
+    DECODING_PROFILES[_name] = {**DECODING_PROFILES.get(_name, {}), **_options}
+
+
+class UnknownProfileError(Exception):
+    """Raised when a request names a decoding profile that is not configured"""
+
+
+def decode_options(profile: Optional[str] = None) -> dict:
+    """WhisperModel.transcribe keyword arguments for a profile, the server default when profile is None"""
+    name = profile or STT_PROFILE
+    if name not in DECODING_PROFILES:
+        raise UnknownProfileError(f"Unknown profile '{name}', expected one of: {', '.join(DECODING_PROFILES)}")
+    return {key: value for key, value in DECODING_PROFILES[name].items() if value is not None}
+
+
+class Segment(NamedTuple):
+    start: float  # seconds from the start of the recording
+    end: float
+    text: str
+    confidence: Optional[float] = None  # exp of the mean token log-probability, 0-1
+
 
 class SpeechToTextModel:
-    def __init__(self, model_size_or_path="base"):  #keept the base model and using cpu
-        self.model = WhisperModel(model_size_or_path, device="cpu", compute_type="int8")
+    def __init__(self, model_size_or_path=STT_MODEL_SIZE, cpu_threads: int = STT_CPU_THREADS,
+                 num_workers: int = STT_NUM_WORKERS, long_audio_workers: int = STT_LONG_AUDIO_WORKERS,
+                 batch_size: int = STT_BATCH_SIZE):  #keept the base model and using cpu
+        self.model_size = model_size_or_path
+        self.cpu_threads = cpu_threads
+        self.num_workers = num_workers
+        # Long recordings are split and spread over a process pool instead of one decoder
+        self.long_audio = LongAudioTranscriber(model_size_or_path, long_audio_workers) if long_audio_workers > 1 else None
+        # Short clips from concurrent requests are decoded together, when their profile allows it
+        self.batcher = BatchScheduler(self, batch_size) if batch_size > 1 else None
+        # Loaded on first use, so processes that never transcribe never pay for it
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self.load()
+        return self._model
 
-    def transcribe(self, file_path: str) -> str:
-        segments, _ = self.model.transcribe(file_path)
-        return " ".join([segment.text for segment in segments])
+    def load(self, warm_up: bool = False):
+        """Load the Whisper weights (once, whichever thread gets here first) and optionally run a warm-up decode"""
+        with self._lock:
+            if self._model is None:
+                from faster_whisper import WhisperModel  # pulls in ctranslate2, slow to import
+                start = time.perf_counter()
+                self._model = WhisperModel(self.model_size, device="cpu", compute_type="int8",
+                                           cpu_threads=self.cpu_threads, num_workers=self.num_workers)
+                logger.info(f"Loaded Whisper model '{self.model_size}' in {time.perf_counter() - start:.2f}s")
+        if warm_up:
+            self.warm_up()
 
-    def transcribe_stream(self, file_path: str):
-        segments, _ = self.model.transcribe(file_path)
-        for segment in segments:
+    def warm_up(self):
+        """Decode a second of silence so the first real request does not pay for allocating buffers"""
+        start = time.perf_counter()
+        segments, _ = self.model.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32))
+        list(segments)
+        logger.info(f"Whisper warm-up took {time.perf_counter() - start:.2f}s")
+
+    def segments(self, audio: Union[str, np.ndarray], profile: Optional[str] = None,
+                 source: str = "request") -> Iterator[Segment]:
+        """Yield segments as they are decoded, then record the real-time factor under source"""
+        start = time.perf_counter()
+        if self.long_audio is not None and self.long_audio.wants(audio):
+            segments, duration = self.long_audio.segments(audio, profile), len(audio) / SAMPLE_RATE
+        elif self.batcher is not None and self.batcher.wants(audio, decode_options(profile)):
+            segments, duration = self.batcher.transcribe(audio, decode_options(profile)), len(audio) / SAMPLE_RATE
+        else:
+            segments, info = self.model.transcribe(audio, **decode_options(profile))
+            segments = ((segment.start, segment.end, segment.text, math.exp(segment.avg_logprob)) for segment in segments)
+            duration = info.duration
+        for segment in segments:  # decoding happens while iterating
+            yield Segment(*segment)
+        record_transcription(duration, time.perf_counter() - start, source)
+
+    # audio is a file path or 16 kHz mono float32 samples from audio_io.decode_audio
+    def transcribe(self, audio: Union[str, np.ndarray], profile: Optional[str] = None) -> str:
+        return " ".join([segment.text for segment in self.segments(audio, profile, "request")])
+
+    def transcribe_stream(self, audio: Union[str, np.ndarray], profile: Optional[str] = None):
+        for segment in self.segments(audio, profile, "stream"):
             yield segment.text + " "
+
+    def shutdown(self):
+        if self.long_audio is not None:
+            self.long_audio.shutdown()
+        if self.batcher is not None:
+            self.batcher.shutdown()
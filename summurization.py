@@ -1,70 +1,370 @@
-import google.generativeai as genai
+import asyncio
+import logging
 import os
-from dotenv import load_dotenv 
+import hashlib
+import re
+from caching import LRUCache, SingleFlight
+from llm_client import llm_client, GEMINI_MODEL
 
 #File workd on by Jorge
 
-# acessing environemnet for the key
-load_dotenv()
+# Set up logging
+logger = logging.getLogger(__name__)
 
-# Retrieve the API key securely from environment variables
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Same model as the rest of the app (GEMINI_MODEL); part of the cache key, so switching models does not reuse old summaries
+SUMMARY_MODEL = GEMINI_MODEL
+# Bump whenever the prompts below change so cached summaries from the old prompts are not reused
+SUMMARY_PROMPT_VERSION = "2"
 
-# Check if the key was loaded successfully
-if not GOOGLE_API_KEY:
-    # Stop if the key isn't found, providing a helpful error message.
-    raise ValueError("API key not found. Ensure the 'GOOGLE_API_KEY' environment variable is set correctly (e.g., in your .env file or system environment).")
-else:
-    genai.configure(api_key=GOOGLE_API_KEY)
-    print("API Key configured successfully.") 
+# Texts above this many (estimated) tokens are summarized chunk by chunk, then reduced
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "6000"))
+# Upper bound on Gemini calls in flight for one long text. The map-reduce of one text takes a
+# single per-user slot (LLM_PER_USER_CONCURRENCY) for all its calls, so this is what limits it
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+# Deadline in seconds for a whole summary, all map-reduce rounds included
+SUMMARY_TIMEOUT = float(os.getenv("SUMMARY_TIMEOUT", "120"))
+# Section size when a transcript is summarized while it is still being transcribed; smaller
+# sections leave less to summarize once the last words are in
+SUMMARY_STREAM_CHUNK_TOKENS = int(os.getenv("SUMMARY_STREAM_CHUNK_TOKENS", "2000"))
 
+# Summaries are cached by text hash; identical concurrent requests share one Gemini call
+summary_cache = LRUCache(
+    int(os.getenv("SUMMARY_CACHE_MB", "32")) * 1024 * 1024,
+    ttl=int(os.getenv("SUMMARY_CACHE_TTL", "86400")),
+)
+summary_flight = SingleFlight()
 
-def summarize_text(text):
+
+def summary_cache_key(text, kind="summary"):
+    material = f"{SUMMARY_MODEL}\n{SUMMARY_PROMPT_VERSION}\n{kind}\n{text}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for English)"""
+    return len(text) // 4 + 1
+
+
+def split_text(text, max_tokens=SUMMARY_CHUNK_TOKENS):
+    """
+    Splits text into chunks of at most max_tokens, breaking on paragraph
+    boundaries first, then sentences, and only as a last resort mid-sentence.
+    """
+    max_chars = max_tokens * 4
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+            while len(sentence) > max_chars:
+                pieces.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            if sentence:
+                pieces.append(sentence)
+
+    # Greedily pack the pieces back together up to the budget
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+SUMMARY_PROMPT = """
+    Provide a concise summary of the following text:
+
+    Text:
+    ```
+    {text}
+    ```
+    
+    Summary:
+    """
+
+CHUNK_PROMPT = """
+    The following text is one section of a longer lecture transcript.
+    Provide a concise summary of this section, keeping every key point,
+    definition and example so it can be merged with the other sections later:
+
+    Section:
+    ```
+    {text}
+    ```
+    
+    Section summary:
+    """
+
+REDUCE_PROMPT = """
+    The following are summaries of consecutive sections of one lecture.
+    Combine them into a single concise summary of the whole lecture,
+    removing repetition but keeping every key point:
+
+    Section summaries:
+    ```
+    {text}
+    ```
+    
+    Summary:
+    """
+
+
+async def _generate(text, prompt_template, kind, user_id=None, deadline=None):
+    """Calls Gemini with one prompt and caches the result; raises on API errors"""
+    key = summary_cache_key(text, kind)
+    cached = summary_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async def call():
+        # Generate the content
+        response = await llm_client.generate(
+            prompt_template.format(text=text), user_id=user_id, deadline=deadline, model=SUMMARY_MODEL
+        )
+        summary = response.strip()
+        summary_cache.set(key, summary)
+        return summary
+
+    return await summary_flight.do(key, call)
+
+
+async def _reduce_to_budget(text, user_id=None, deadline=None):
+    """
+    Summarizes the chunks of a long text concurrently, then merges the
+    partial summaries in rounds until they fit into one final prompt.
+    Latency grows with the number of rounds, not with the text length.
+    """
+    chunks = split_text(text)
+    logger.info(f"Summarizing long text in {len(chunks)} chunks")
+    slots = asyncio.Semaphore(SUMMARY_MAX_CONCURRENCY)
+
+    async def limited(piece, template, kind):
+        async with slots:
+            return await _generate(piece, template, kind, user_id, deadline)
+
+    partials = await asyncio.gather(*(limited(chunk, CHUNK_PROMPT, "chunk") for chunk in chunks))
+    return await _merge_partials(partials, limited)
+
+
+async def _merge_partials(partials, limited):
+    """Merges partial summaries in rounds until they fit into one final prompt"""
+    count, rounds = len(partials), 1
+    while len(partials) > 1 and estimate_tokens("\n\n".join(partials)) > SUMMARY_CHUNK_TOKENS:
+        groups = split_text("\n\n".join(partials))
+        if len(groups) >= len(partials):
+            # partials did not shrink (each one is already over budget), merge pairwise instead
+            groups = ["\n\n".join(partials[i:i + 2]) for i in range(0, len(partials), 2)]
+        partials = await asyncio.gather(*(limited(group, REDUCE_PROMPT, "reduce") for group in groups))
+        rounds += 1
+
+    logger.info(f"Reduced {count} chunk summaries in {rounds} rounds")
+    return list(partials)
+
+
+async def _map_reduce_summary(text, user_id=None, deadline=None):
+    """Map-reduce summary of a long text: the partial summaries plus one final reduce call"""
+    partials = await _reduce_to_budget(text, user_id, deadline)
+    if len(partials) == 1:
+        return partials[0]
+    return await _generate("\n\n".join(partials), REDUCE_PROMPT, "reduce", user_id, deadline)
+
+
+async def _generate_summary(text, user_id=None):
+    """Summarizes text directly, or via map-reduce when it is over the chunk budget"""
+    deadline = asyncio.get_running_loop().time() + SUMMARY_TIMEOUT
+    if estimate_tokens(text) <= SUMMARY_CHUNK_TOKENS:
+        summary = await _generate(text, SUMMARY_PROMPT, "summary", user_id, deadline)
+    else:
+        key = summary_cache_key(text)
+
+        async def run():
+            # One per-user slot for the whole fan-out; the calls inside only count against the global limit
+            async with llm_client.user_slot(user_id):
+                result = await _map_reduce_summary(text, None, deadline)
+            summary_cache.set(key, result)
+            return result
+
+        summary = await summary_flight.do(key, run)
+    logger.debug(f"Generated a summary of {len(summary)} characters")
+    return summary
+
+
+async def summarize_text(text, user_id=None):
     """
     Summarizes the given text using Gemini 1.5 Flash.
 
+    Repeated text is answered from summary_cache, and concurrent requests
+    for the same text wait on a single Gemini call. Errors are not cached.
+    Text longer than SUMMARY_CHUNK_TOKENS is summarized with map-reduce.
+
     Args:
         text (str): The text to process.
+        user_id (int, optional): Caller, for the per-user concurrency limit.
 
     Returns:
         str: A concise summary of the text,
              or a descriptive error string if an issue occurs.
     """
-    print("\nAttempting to generate summary...") # Indicate progress
-    try:
-        # Initialize the generative model
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
+    cached = summary_cache.get(summary_cache_key(text))
+    if cached is not None:
+        logger.debug("Summary served from cache")
+        return cached
 
-        # Define the prompt with clear instructions
-        prompt = f"""
-        Provide a concise summary of the following text:
-
-        Text:
-        ```
-        {text}
-        ```
-        
-        Summary:
-        """
-
-        # Generate the content
-        response = model.generate_content(prompt)
-        summary = response.text.strip()
-        print(f"Generated summary:\n---\n{summary}\n---")
-
-        return summary
+    logger.debug("Attempting to generate summary...")
+    try:
+        return await _generate_summary(text, user_id)
 
     # --- Error Handling ---
     except Exception as e:
         # Log the specific error for debugging purposes
-        print(f"An error occurred during API call or processing: {e}")
+        logger.error(f"An error occurred during API call or processing: {e}")
         # Return a user-friendly error message
         return f"An error occurred processing the text: {type(e).__name__}"
 
 
+async def stream_summary(text, user_id=None):
+    """
+    Yields the summary of text in pieces while Gemini generates it.
+
+    Cached summaries are yielded whole. For long texts the map-reduce
+    rounds run first and only the final reduce call is streamed. The
+    finished summary is stored in summary_cache; errors are raised.
+    """
+    key = summary_cache_key(text)
+    cached = summary_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    deadline = asyncio.get_running_loop().time() + SUMMARY_TIMEOUT
+    if estimate_tokens(text) <= SUMMARY_CHUNK_TOKENS:
+        prompt = SUMMARY_PROMPT.format(text=text)
+    else:
+        async with llm_client.user_slot(user_id):
+            partials = await _reduce_to_budget(text, None, deadline)
+        if len(partials) == 1:
+            summary_cache.set(key, partials[0])
+            yield partials[0]
+            return
+        prompt = REDUCE_PROMPT.format(text="\n\n".join(partials))
+
+    pieces = []
+    async for piece in llm_client.stream(prompt, user_id=user_id, deadline=deadline, model=SUMMARY_MODEL):
+        pieces.append(piece)
+        yield piece
+    summary_cache.set(key, "".join(pieces).strip())
+
+
+class IncrementalSummary:
+    """
+    Summary of a text that arrives in pieces, such as a transcript while it
+    is being transcribed. Every SUMMARY_STREAM_CHUNK_TOKENS of text become a
+    section that is summarized straight away, alongside the arrival of the
+    rest; finish() then only has the last section and the reduce left to do.
+    A text that never fills a section is summarized in one call, as
+    summarize_text would.
+
+    on_section(index, summary) is a coroutine function, awaited as each
+    section summary is ready, so finish() only returns once every section
+    has been handed over. Errors are raised from finish().
+    """
+
+    def __init__(self, user_id=None, chunk_tokens=SUMMARY_STREAM_CHUNK_TOKENS, on_section=None):
+        self.user_id = user_id
+        self.chunk_tokens = chunk_tokens
+        self.on_section = on_section
+        self._pieces = []
+        self._pending = []  # pieces not in a section yet
+        self._sections = []  # one task per section
+        self._slots = asyncio.Semaphore(SUMMARY_MAX_CONCURRENCY)
+
+    @property
+    def text(self):
+        return " ".join(self._pieces)
+
+    @property
+    def sections(self):
+        return len(self._sections)
+
+    def add(self, text):
+        text = text.strip()
+        if not text:
+            return
+        self._pieces.append(text)
+        self._pending.append(text)
+        if estimate_tokens(" ".join(self._pending)) >= self.chunk_tokens:
+            self._close_section()
+
+    def _close_section(self):
+        section = " ".join(self._pending)
+        self._pending = []
+        index = len(self._sections)
+        self._sections.append(asyncio.ensure_future(self._summarize_section(index, section)))
+
+    async def _limited(self, text, template, kind, deadline):
+        async with self._slots:
+            return await _generate(text, template, kind, self.user_id, deadline)
+
+    async def _summarize_section(self, index, section):
+        deadline = asyncio.get_running_loop().time() + SUMMARY_TIMEOUT
+        summary = await self._limited(section, CHUNK_PROMPT, "chunk", deadline)
+        if self.on_section is not None:
+            await self.on_section(index, summary)
+        return summary
+
+    async def finish(self):
+        """Summarize what is left and merge the sections into the summary of the whole text"""
+        text = self.text
+        key = summary_cache_key(text)
+        cached = summary_cache.get(key)
+        if cached is not None:
+            self.cancel()
+            return cached
+
+        deadline = asyncio.get_running_loop().time() + SUMMARY_TIMEOUT
+        if not self._sections:
+            # _generate caches it under key
+            return await _generate(text, SUMMARY_PROMPT, "summary", self.user_id, deadline)
+
+        if self._pending:
+            self._close_section()
+        # Stop at the first failed section: cancel the others and retrieve their errors before raising
+        await asyncio.wait(self._sections, return_when=asyncio.FIRST_EXCEPTION)
+        failed = next((task for task in self._sections
+                       if task.done() and not task.cancelled() and task.exception() is not None), None)
+        if failed is not None:
+            self.cancel()
+            raise failed.exception()
+        partials = [task.result() for task in self._sections]
+        partials = await _merge_partials(
+            partials, lambda piece, template, kind: self._limited(piece, template, kind, deadline)
+        )
+        if len(partials) == 1:
+            summary = partials[0]
+        else:
+            summary = await self._limited("\n\n".join(partials), REDUCE_PROMPT, "reduce", deadline)
+        summary_cache.set(key, summary)
+        return summary
+
+    def cancel(self):
+        """Stop the section summaries still running and retrieve the errors of the ones that failed"""
+        for task in self._sections:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()
+
+
 # For backward compatibility
-def summarize_and_categorize(text):
+async def summarize_and_categorize(text, user_id=None):
     """Legacy function that returns summary and a default category"""
-    summary = summarize_text(text)
+    summary = await summarize_text(text, user_id)
     return summary, "General"
-
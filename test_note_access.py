@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Note Access Check
+
+Runs the FastAPI app in process against a throwaway SQLite database and checks
+that a note and its timed segments can only be read with its owner's token:
+another user's token gets a 403. Collected by pytest.
+"""
+import asyncio
+import tempfile
+
+import httpx
+
+
+def test_notes_are_only_readable_by_their_owner(monkeypatch):
+    with tempfile.TemporaryDirectory() as data_dir:
+        # Read at import time by databases.py and main.py
+        monkeypatch.setenv("USE_SQLITE", "True")
+        monkeypatch.setenv("DATA_DIR", data_dir)
+        monkeypatch.setenv("DATABASE_NAME", "access.db")
+        monkeypatch.setenv("AUTH_REQUIRED", "False")
+        monkeypatch.setenv("LOG_FILE", f"{data_dir}/app.log")
+        import main
+        from models import Note, User
+
+        main.on_startup()
+        with main.engine.begin() as conn:
+            owner, other = (conn.execute(User.__table__.insert(), {
+                "username": name, "password": "x", "email": f"{name}@example.com", "first_name": "A",
+                "last_name": "B", "age": 20, "major": "Biology",
+            }).inserted_primary_key[0] for name in ("owner", "other"))
+            note_id = conn.execute(Note.__table__.insert(), {
+                "user_id": owner, "title": "Mitosis", "transcription": "The cell divides",
+                "summarized_notes": "", "category": "Biology",
+            }).inserted_primary_key[0]
+
+        def bearer(user_id, username):
+            return {"Authorization": f"Bearer {main.token_signer.issue(user_id, username)}"}
+
+        async def run():
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                for path in (f"/notes/{note_id}", f"/notes/{note_id}/segments"):
+                    assert (await client.get(path, headers=bearer(owner, "owner"))).status_code == 200
+                    assert (await client.get(path, headers=bearer(other, "other"))).status_code == 403
+                assert (await client.get("/notes/999999", headers=bearer(other, "other"))).status_code == 404
+            await main.async_engine.dispose()
+
+        asyncio.run(run())
+        main.engine.dispose()
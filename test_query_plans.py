@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Query Plan Check
+
+Builds the schema through migrations.py and asks the database how it would run
+the lookups the API depends on, failing if any of them stops using its index.
+Runs against a throwaway SQLite database by default, or any database given
+with --database-url (e.g. the MySQL instance on Railway). Also collected by pytest.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+from sqlalchemy import create_engine
+from sqlmodel import select
+
+from migrations import run_migrations
+from models import Note, StudyGuide, TranscriptSegment, User
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("query_plan_check")
+
+# (description, statement, index the plan must use)
+CHECKS = [
+    ("user by username", select(User).where(User.username == "someone"), "ix_user_username"),
+    ("user by email", select(User).where(User.email == "someone@example.com"), "ix_user_email"),
+    ("notes by category for a user",
+     select(Note).where(Note.category == "Biology", Note.user_id == 1), "ix_note_user_category_created_at"),
+    ("notes of a user, newest first",
+     select(Note).where(Note.user_id == 1).order_by(Note.created_at.desc(), Note.id.desc()).limit(51),
+     "ix_note_user_created_at_id"),
+    ("study guide for a category",
+     select(StudyGuide).where(StudyGuide.user_id == 1, StudyGuide.category == "Biology"), "ix_studyguide_user_category"),
+    ("transcript segment at a time",
+     select(TranscriptSegment.seq).where(TranscriptSegment.note_id == 1, TranscriptSegment.start_ms <= 60000)
+     .order_by(TranscriptSegment.start_ms.desc()).limit(1), "ix_transcriptsegment_note_start"),
+]
+
+
+def explain(conn, statement) -> list:
+    """Return the plan rows for a statement using the dialect's EXPLAIN"""
+    compiled = statement.compile(dialect=conn.dialect)
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    return [dict(row._mapping) for row in conn.exec_driver_sql(prefix + str(compiled), params)]
+
+
+def uses_index(conn, plan: list, index_name: str) -> bool:
+    if conn.dialect.name == "sqlite":
+        return any(f"INDEX {index_name}" in row["detail"] for row in plan)
+    return any(row.get("key") == index_name for row in plan)
+
+
+def check_query_plans(database_url: str) -> bool:
+    engine = create_engine(database_url)
+    run_migrations(engine)
+    ok = True
+    with engine.connect() as conn:
+        for description, statement, index_name in CHECKS:
+            plan = explain(conn, statement)
+            if uses_index(conn, plan, index_name):
+                logger.info(f"{description}: uses {index_name}")
+            else:
+                logger.error(f"{description}: does not use {index_name}, plan was {plan}")
+                ok = False
+    engine.dispose()
+    return ok
+
+
+def test_query_plans_use_indexes():
+    with tempfile.TemporaryDirectory() as tmp:
+        assert check_query_plans(f"sqlite:///{os.path.join(tmp, 'plans.db')}")
+
+
+def parse_arguments():
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description="Check that API queries use their indexes")
+    parser.add_argument("--database-url", help="SQLAlchemy URL to check (default: a temporary SQLite database)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    if args.database_url:
+        success = check_query_plans(args.database_url)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            success = check_query_plans(f"sqlite:///{os.path.join(tmp, 'plans.db')}")
+    sys.exit(0 if success else 1)
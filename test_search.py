@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Search Snippet Check
+
+Stores a note whose text carries HTML and searches it with the SQLite FTS5
+and in-process backends, checking that snippets escape the note text and only
+the highlight tags are markup. Runs against a throwaway SQLite database built
+through migrations.py. Collected by pytest.
+"""
+import asyncio
+import os
+import tempfile
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlmodel import Session
+
+from migrations import run_migrations
+from models import Note, User
+from search import NoteSearch, make_snippet
+
+BODY = 'The cell <script>alert("x")</script> divides & grows'
+ESCAPED = 'The <mark>cell</mark> &lt;script&gt;alert(&quot;x&quot;)&lt;/script&gt; divides &amp; grows'
+
+
+def test_make_snippet_escapes_note_text():
+    assert make_snippet([BODY], ["cell"]) == ESCAPED
+    assert make_snippet(["<b>no match</b>"], ["cell"]) == "&lt;b&gt;no match&lt;/b&gt;"
+
+
+def search(path: str, backend: str):
+    engine = create_engine(f"sqlite:///{path}")
+    run_migrations(engine)
+    with Session(engine) as session:
+        user = User(username="reader", password="x", email="reader@example.com", first_name="A",
+                    last_name="B", age=20, major="Biology")
+        session.add(user)
+        session.commit()
+        session.add(Note(title="Mitosis", transcription=BODY, summarized_notes="", category="Biology", user_id=user.id))
+        session.commit()
+        user_id = user.id
+
+    note_search = NoteSearch()
+    note_search.configure(engine)
+    if backend == "python":
+        note_search.backend = "python"
+    assert note_search.backend == backend
+    engine.dispose()
+
+    async def run():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        async with AsyncSession(async_engine) as session:
+            hits = await note_search.search(session, user_id, "cell", 0, 10)
+        await async_engine.dispose()
+        return hits
+
+    return asyncio.run(run())
+
+
+def test_search_snippets_escape_note_text():
+    for backend in ("fts5", "python"):
+        with tempfile.TemporaryDirectory() as tmp:
+            hits = search(os.path.join(tmp, "search.db"), backend)
+        assert len(hits) == 1
+        assert "<script>" not in hits[0].snippet
+        assert hits[0].snippet == ESCAPED, backend
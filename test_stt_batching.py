@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Batched Transcription Check
+
+Checks which clips stt_model sends to the micro-batcher (single-window clips
+with options a batch decodes, VAD aside), how decoded timestamp tokens become
+segments, and that the scheduler hands every caller its own result. The last
+test runs decode_batch against a real tiny Whisper model and is skipped when
+faster-whisper or the model is not available. Collected by pytest.
+"""
+import threading
+
+import numpy as np
+import pytest
+
+import stt_batching
+import stt_model
+from audio_io import SAMPLE_RATE
+from stt_batching import BatchScheduler, batchable, decode_batch, timed_segments
+from stt_model import SpeechToTextModel, decode_options
+
+BATCHED = {"beam_size": 5, "temperature": [0.0], "language": "en"}
+
+
+def test_batchable_only_for_options_a_batch_honours():
+    assert batchable(BATCHED)
+    assert batchable({**BATCHED, "temperature": 0, "vad_filter": False, "best_of": 5})
+    # A temperature fallback, VAD or a prompt change the result of WhisperModel.transcribe
+    assert not batchable({"beam_size": 5})
+    assert not batchable({**BATCHED, "temperature": [0.0, 0.2, 0.4]})
+    assert not batchable({**BATCHED, "temperature": [0.4]})
+    assert not batchable({**BATCHED, "vad_filter": True})
+    assert not batchable({**BATCHED, "initial_prompt": "Biology lecture"})
+    # The built-in profiles keep a temperature fallback or VAD
+    for profile in ("fast", "balanced", "accurate"):
+        assert not batchable(decode_options(profile))
+
+
+def test_wants_short_clips_with_batchable_options():
+    scheduler = BatchScheduler(stt_model=None)
+    short = np.zeros(10 * SAMPLE_RATE, dtype=np.float32)
+    long = np.zeros(31 * SAMPLE_RATE, dtype=np.float32)
+    assert scheduler.wants(short, BATCHED)
+    assert not scheduler.wants(long, BATCHED)
+    assert not scheduler.wants("lecture.wav", BATCHED)
+    assert not scheduler.wants(short, decode_options("accurate"))
+    assert not scheduler.wants(short, decode_options("balanced"))
+    # VAD is left out for a single-window clip, so "fast" clips are batched
+    assert scheduler.wants(short, decode_options("fast"))
+    assert not scheduler.wants(long, decode_options("fast"))
+
+
+class FakeWhisperSegment:
+    def __init__(self, start, end, text):
+        self.start, self.end, self.text, self.avg_logprob = start, end, text, -0.1
+
+
+class FakeWhisper:
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, audio, **options):
+        self.calls.append(options)
+        return iter([FakeWhisperSegment(0.0, 1.5, " first"), FakeWhisperSegment(1.5, 3.0, " second")]), \
+            type("Info", (), {"duration": len(audio) / SAMPLE_RATE})()
+
+
+def test_segments_route_by_profile(monkeypatch):
+    model = SpeechToTextModel("tiny", long_audio_workers=0, batch_size=8)
+    whisper = FakeWhisper()
+    model._model = whisper
+    batched = []
+    monkeypatch.setattr(model.batcher, "transcribe",
+                        lambda audio, options: batched.append(options) or [(0.0, 2.0, " batched", 0.9)])
+    monkeypatch.setitem(stt_model.DECODING_PROFILES, "batched", BATCHED)
+    audio = np.zeros(5 * SAMPLE_RATE, dtype=np.float32)
+
+    # The default and built-in profiles keep WhisperModel.transcribe and its timed segments
+    segments = list(model.segments(audio, "accurate"))
+    assert [segment.text for segment in segments] == [" first", " second"]
+    assert segments[0].confidence is not None
+    assert len(whisper.calls) == 1 and not batched
+
+    segments = list(model.segments(audio, "batched"))
+    assert [tuple(segment) for segment in segments] == [(0.0, 2.0, " batched", 0.9)]
+    assert len(whisper.calls) == 1 and batched == [decode_options("batched")]
+    model.shutdown()
+
+
+class FakeTokenizer:
+    timestamp_begin = 1000
+    words = {1: " The", 2: " cell", 3: " divides"}
+
+    def decode(self, tokens):
+        return "".join(self.words[token] for token in tokens)
+
+
+def test_timed_segments_split_at_timestamp_tokens():
+    ts = lambda seconds: FakeTokenizer.timestamp_begin + int(round(seconds / stt_batching.TIME_PRECISION))
+    tokens = [ts(0.0), 1, 2, ts(1.2), ts(1.2), 3, ts(2.5)]
+    assert timed_segments(FakeTokenizer(), tokens, 3.0, 0.8) == [
+        (0.0, 1.2, " The cell", 0.8),
+        (1.2, 2.5, " divides", 0.8),
+    ]
+    # Text without a closing timestamp runs to the end of the clip; times never pass it
+    assert timed_segments(FakeTokenizer(), [ts(0.4), 3], 2.0, None) == [(0.4, 2.0, " divides", None)]
+    assert timed_segments(FakeTokenizer(), [1, ts(5.0)], 2.0, None) == [(0.0, 2.0, " The", None)]
+    assert timed_segments(FakeTokenizer(), [ts(0.0), ts(1.0)], 2.0, None) == []
+
+
+def test_scheduler_batches_by_options_and_returns_each_result(monkeypatch):
+    batches = []
+
+    def fake_decode_batch(whisper, clips, options):
+        batches.append((len(clips), options["beam_size"]))
+        return [[(0.0, 1.0, f" {len(clip)}", None)] for clip in clips]
+
+    monkeypatch.setattr(stt_batching, "decode_batch", fake_decode_batch)
+    scheduler = BatchScheduler(type("Model", (), {"model": None})(), max_batch=4, max_wait=0.2)
+    results = {}
+
+    def submit(i, beam_size):
+        clip = np.zeros(SAMPLE_RATE + i, dtype=np.float32)
+        results[i] = scheduler.transcribe(clip, {**BATCHED, "beam_size": beam_size})
+
+    threads = [threading.Thread(target=submit, args=(i, 1 if i % 2 else 5)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    scheduler.shutdown()
+
+    assert {i: result[0][2] for i, result in results.items()} == {i: f" {SAMPLE_RATE + i}" for i in range(6)}
+    # Clips with different options never share a batch
+    assert sum(size for size, _ in batches) == 6
+    assert all(size <= 4 for size, _ in batches)
+    assert {beam for _, beam in batches} == {1, 5}
+
+
+def test_default_profile_short_clip_goes_through_batch_scheduler(monkeypatch):
+    batches = []
+
+    def fake_decode_batch(whisper, clips, options):
+        batches.append((len(clips), options))
+        return [[(0.0, 1.0, " batched", 0.9)] for _ in clips]
+
+    monkeypatch.setattr(stt_batching, "decode_batch", fake_decode_batch)
+    monkeypatch.setattr(stt_model, "STT_PROFILE", "fast")
+    model = SpeechToTextModel("tiny", long_audio_workers=0, batch_size=8)
+    whisper = FakeWhisper()
+    model._model = whisper
+
+    segments = list(model.segments(np.zeros(5 * SAMPLE_RATE, dtype=np.float32)))
+    assert [tuple(segment) for segment in segments] == [(0.0, 1.0, " batched", 0.9)]
+    assert not whisper.calls
+    assert len(batches) == 1 and batches[0][1]["beam_size"] == 1
+
+    # Past one window the clip keeps WhisperModel.transcribe and its VAD
+    list(model.segments(np.zeros(31 * SAMPLE_RATE, dtype=np.float32)))
+    assert len(batches) == 1 and whisper.calls[0]["vad_filter"]
+    model.shutdown()
+
+
+def test_decode_batch_on_whisper_tiny():
+    pytest.importorskip("faster_whisper")
+    model = SpeechToTextModel("tiny", long_audio_workers=0, batch_size=1)
+    try:
+        model.load()
+    except Exception as e:  # no network to download the weights
+        pytest.skip(f"Whisper tiny unavailable: {e}")
+
+    rng = np.random.default_rng(1)
+    t = np.arange(8 * SAMPLE_RATE) / SAMPLE_RATE
+    tone = (0.3 * np.sin(2 * np.pi * 220 * t) + rng.normal(0, 0.02, len(t))).astype(np.float32)
+    clips = [np.zeros(3 * SAMPLE_RATE, dtype=np.float32), tone]
+
+    decoded = decode_batch(model.model, clips, {**BATCHED, "no_speech_threshold": 0.6, "log_prob_threshold": -1.0})
+    assert len(decoded) == len(clips)
+    for audio, segments in zip(clips, decoded):
+        duration = len(audio) / SAMPLE_RATE
+        for segment_start, segment_end, text, confidence in segments:
+            assert 0 <= segment_start <= segment_end <= duration
+            assert text.strip()
+            assert 0 < confidence <= 1
+        assert [segment[0] for segment in segments] == sorted(segment[0] for segment in segments)
@@ -0,0 +1,123 @@
+#Timed transcript segments stored per note, and ranged reads over them
+import logging
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel, validator
+from sqlalchemy import delete, insert
+from sqlmodel import select
+
+from models import TranscriptSegment
+from stt_model import Segment
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+SEGMENT_INSERT_BATCH_SIZE = 1000
+
+
+class TranscriptSegmentIn(BaseModel):
+    start: float  # seconds from the start of the recording
+    end: float
+    text: str
+    confidence: Optional[float] = None
+
+    @validator("end")
+    def end_after_start(cls, value, values):
+        if value < 0 or ("start" in values and value < values["start"]):
+            raise ValueError("end must not be before start")
+        return value
+
+    @validator("start")
+    def start_not_negative(cls, value):
+        if value < 0:
+            raise ValueError("start must not be negative")
+        return value
+
+
+class TranscriptSegmentOut(BaseModel):
+    seq: int
+    start: float
+    end: float
+    text: str
+    confidence: Optional[float] = None
+
+
+def segment_to_dict(segment: Segment) -> dict:
+    """JSON form of a freshly transcribed segment, as /transcribe returns it and TranscriptSegmentIn accepts it"""
+    confidence = None if segment.confidence is None else round(segment.confidence, 3)
+    return {"start": round(segment.start, 2), "end": round(segment.end, 2), "text": segment.text, "confidence": confidence}
+
+
+def segments_text(segments) -> str:
+    """Plain transcript of segments, joined the way SpeechToTextModel.transcribe joins them"""
+    return " ".join(segment["text"] if isinstance(segment, dict) else segment.text for segment in segments)
+
+
+def _rows(note_id: int, segments: List[TranscriptSegmentIn]) -> List[dict]:
+    ordered = sorted(segments, key=lambda segment: (segment.start, segment.end))
+    return [{
+        "note_id": note_id,
+        "seq": seq,
+        "start_ms": round(segment.start * 1000),
+        "end_ms": round(segment.end * 1000),
+        "text": segment.text,
+        "confidence": segment.confidence,
+    } for seq, segment in enumerate(ordered)]
+
+
+async def replace_segments(session, note_id: int, segments: List[TranscriptSegmentIn]) -> int:
+    """Replace the note's segments, numbering them in time order; the caller commits"""
+    await session.execute(delete(TranscriptSegment).where(TranscriptSegment.note_id == note_id))
+    rows = _rows(note_id, segments)
+    for offset in range(0, len(rows), SEGMENT_INSERT_BATCH_SIZE):
+        await session.execute(insert(TranscriptSegment.__table__), rows[offset:offset + SEGMENT_INSERT_BATCH_SIZE])
+    return len(rows)
+
+
+async def _seq_bound(session, note_id: int, condition, descending: bool) -> Optional[int]:
+    """seq of the first or last segment (by start time) matching condition: one seek on ix_transcriptsegment_note_start"""
+    order = TranscriptSegment.start_ms.desc() if descending else TranscriptSegment.start_ms
+    return (await session.exec(
+        select(TranscriptSegment.seq)
+        .where(TranscriptSegment.note_id == note_id, condition)
+        .order_by(order, TranscriptSegment.seq.desc() if descending else TranscriptSegment.seq)
+        .limit(1)
+    )).first()
+
+
+async def read_segments(session, note_id: int, start: Optional[float] = None, end: Optional[float] = None,
+                        first: Optional[int] = None, last: Optional[int] = None,
+                        after_seq: Optional[int] = None, limit: int = 100) -> Tuple[List[TranscriptSegment], bool]:
+    """
+    Segments of a note overlapping [start, end) seconds and within seq
+    [first, last], after after_seq, in order. Returns (segments, has_more).
+
+    The time range is turned into a seq range with two index seeks, so the
+    main query is a range scan of the primary key that reads at most
+    limit + 1 rows however long the transcript is.
+    """
+    low = max(first or 0, after_seq + 1 if after_seq is not None else 0)
+    high = last
+    conditions = [TranscriptSegment.note_id == note_id]
+
+    if start is not None:
+        start_ms = round(start * 1000)
+        # The segment in progress at start, or failing that the first one after it
+        containing = await _seq_bound(session, note_id, TranscriptSegment.start_ms <= start_ms, descending=True)
+        if containing is not None:
+            low = max(low, containing)
+        conditions.append(TranscriptSegment.end_ms > start_ms)
+    if end is not None:
+        end_ms = round(end * 1000)
+        final = await _seq_bound(session, note_id, TranscriptSegment.start_ms < end_ms, descending=True)
+        if final is None:
+            return [], False
+        high = final if high is None else min(high, final)
+
+    conditions.append(TranscriptSegment.seq >= low)
+    if high is not None:
+        conditions.append(TranscriptSegment.seq <= high)
+    rows = (await session.exec(
+        select(TranscriptSegment).where(*conditions).order_by(TranscriptSegment.seq).limit(limit + 1)
+    )).all()
+    return rows[:limit], len(rows) > limit
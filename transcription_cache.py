@@ -0,0 +1,37 @@
+#Content-addressed cache of finished transcripts
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+from caching import DiskCache, LRUCache, TieredCache
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Cache settings, overridable with environment variables (set a size to 0 to disable a tier)
+TRANSCRIPT_CACHE_MEMORY_MB = int(os.environ.get("TRANSCRIPT_CACHE_MEMORY_MB", "64"))
+TRANSCRIPT_CACHE_DISK_MB = int(os.environ.get("TRANSCRIPT_CACHE_DISK_MB", "1024"))
+TRANSCRIPT_CACHE_DIR = Path(os.environ.get("TRANSCRIPT_CACHE_DIR", "./transcript_cache"))
+
+
+def build_transcript_cache() -> TieredCache:
+    """Build the memory + disk cache tiers from the environment settings"""
+    memory = LRUCache(TRANSCRIPT_CACHE_MEMORY_MB * 1024 * 1024) if TRANSCRIPT_CACHE_MEMORY_MB > 0 else None
+    disk = DiskCache(TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_DISK_MB * 1024 * 1024) if TRANSCRIPT_CACHE_DISK_MB > 0 else None
+    logger.info(f"Transcript cache: memory={TRANSCRIPT_CACHE_MEMORY_MB}MB, disk={TRANSCRIPT_CACHE_DISK_MB}MB at {TRANSCRIPT_CACHE_DIR}")
+    return TieredCache(memory, disk)
+
+
+def audio_digest(audio: np.ndarray) -> str:
+    """sha256 of decoded PCM, so the same audio re-tagged or in another container shares an entry"""
+    return "pcm:" + hashlib.sha256(np.ascontiguousarray(audio).data).hexdigest()
+
+
+def cache_key(content_digest: str, model_size: str, decode_options: dict) -> str:
+    """Key a transcript by its content plus everything that changes the decoder output"""
+    material = json.dumps({"model": model_size, "options": decode_options, "content": content_digest}, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
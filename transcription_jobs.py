@@ -0,0 +1,221 @@
+#Background transcription jobs served by a pool of Whisper worker processes
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional
+
+from metrics import TRANSCRIPTION_JOBS, record_transcription
+from stt_model import STT_MODEL_SIZE
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Pool settings, overridable with environment variables
+TRANSCRIBE_WORKERS = int(os.environ.get("TRANSCRIBE_WORKERS", "2"))
+TRANSCRIBE_QUEUE_SIZE = int(os.environ.get("TRANSCRIBE_QUEUE_SIZE", "16"))
+TRANSCRIBE_JOB_TTL = int(os.environ.get("TRANSCRIBE_JOB_TTL", "3600"))  # seconds to keep finished jobs
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when the transcription queue cannot accept more jobs"""
+
+
+# Each worker process loads its own WhisperModel once, in the pool initializer
+_worker_model = None
+
+
+def _init_worker(model_size: str):
+    global _worker_model
+    from stt_model import SpeechToTextModel
+    # Jobs already run side by side, so a long one is not split over a second pool,
+    # and a worker only ever has one clip at a time to batch
+    _worker_model = SpeechToTextModel(model_size, long_audio_workers=0, batch_size=1)
+    _worker_model.load()
+
+
+def _run_transcription(file_path: str, profile: Optional[str] = None):
+    """Returns (text, audio seconds, transcription seconds); metrics are recorded by the parent process"""
+    from audio_io import SAMPLE_RATE, decode_audio
+    audio = decode_audio(Path(file_path))
+    start = time.perf_counter()
+    text = _worker_model.transcribe(audio, profile)
+    return text, len(audio) / SAMPLE_RATE, time.perf_counter() - start
+
+
+@dataclass
+class TranscriptionJob:
+    id: str
+    file_path: Path
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[str] = None
+    error: Optional[str] = None
+    cache_key: Optional[str] = None
+    profile: Optional[str] = None  # decoding profile, None for the server default
+
+    @property
+    def done(self) -> bool:
+        return self.status in (COMPLETED, FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "transcription": self.result,
+            "error": self.error,
+            "profile": self.profile,
+        }
+
+
+class TranscriptionJobQueue:
+    """Bounded job queue drained by one dispatcher thread per worker process"""
+
+    def __init__(self, workers: int = TRANSCRIBE_WORKERS, max_queued: int = TRANSCRIBE_QUEUE_SIZE,
+                 model_size: str = STT_MODEL_SIZE, job_ttl: int = TRANSCRIBE_JOB_TTL, cache=None):
+        self.cache = cache
+        self.workers = max(1, workers)
+        self.model_size = model_size
+        self.job_ttl = job_ttl
+        self._pending: "queue.Queue[Optional[TranscriptionJob]]" = queue.Queue(maxsize=max_queued)
+        self._jobs: Dict[str, TranscriptionJob] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._dispatchers = []
+
+    def _start(self):
+        """Start the worker processes and dispatcher threads on first use"""
+        with self._lock:
+            if self._executor is not None:
+                return
+            logger.info(f"Starting {self.workers} transcription workers with model '{self.model_size}'")
+            self._executor = self._new_executor()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._dispatch, name=f"transcribe-dispatch-{i}", daemon=True)
+                thread.start()
+                self._dispatchers.append(thread)
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn keeps the workers clean of the server's threads and sockets
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_size,),
+        )
+
+    def _replace_broken_executor(self, broken: ProcessPoolExecutor):
+        """A worker died (most likely out of memory) and took the pool with it; start a fresh one for later jobs"""
+        with self._lock:
+            if self._executor is not broken:
+                return  # another dispatcher already replaced it, or the queue is shut down
+            logger.warning("Transcription worker pool broke, starting a new one")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._new_executor()
+
+    def _dispatch(self):
+        while True:
+            job = self._pending.get()
+            if job is None:
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+            executor = self._executor
+            try:
+                if executor is None:
+                    raise RuntimeError("Transcription queue is shut down")
+                job.result, audio_seconds, processing_seconds = executor.submit(
+                    _run_transcription, str(job.file_path), job.profile
+                ).result()
+                job.status = COMPLETED
+                record_transcription(audio_seconds, processing_seconds, "job")
+                TRANSCRIPTION_JOBS.inc(COMPLETED)
+                if self.cache is not None and job.cache_key:
+                    self.cache.set(job.cache_key, job.result)
+                logger.info(f"Transcription job {job.id} completed in {time.time() - job.started_at:.1f}s")
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    self._replace_broken_executor(executor)
+                job.error = str(e)
+                job.status = FAILED
+                TRANSCRIPTION_JOBS.inc(FAILED)
+                logger.error(f"Transcription job {job.id} failed: {str(e)}")
+            finally:
+                job.finished_at = time.time()
+                job.file_path.unlink(missing_ok=True)
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.job_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.done and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def submit(self, file_path: Path, cache_key: Optional[str] = None, profile: Optional[str] = None) -> TranscriptionJob:
+        """Queue an audio file for transcription; the file is deleted once the job finishes.
+
+        When cache_key is already in the transcript cache the job completes
+        immediately without touching the worker pool.
+        """
+        self._purge_expired()
+        job = TranscriptionJob(id=uuid.uuid4().hex, file_path=file_path, cache_key=cache_key, profile=profile)
+        cached = self.cache.get(cache_key) if self.cache is not None and cache_key else None
+        if cached is not None:
+            file_path.unlink(missing_ok=True)
+            job.result = cached
+            job.status = COMPLETED
+            job.started_at = job.finished_at = time.time()
+            TRANSCRIPTION_JOBS.inc("cached")
+            with self._lock:
+                self._jobs[job.id] = job
+            logger.info(f"Transcription job {job.id} served from cache")
+            return job
+
+        self._start()
+        try:
+            self._pending.put_nowait(job)
+        except queue.Full:
+            TRANSCRIPTION_JOBS.inc("rejected")
+            raise QueueFullError("Transcription queue is full")
+        with self._lock:
+            self._jobs[job.id] = job
+        logger.info(f"Queued transcription job {job.id} ({self._pending.qsize()} waiting)")
+        return job
+
+    def queued(self) -> int:
+        return self._pending.qsize()
+
+    def get(self, job_id: str) -> Optional[TranscriptionJob]:
+        # Purged here too, so an idle server does not keep finished jobs forever
+        self._purge_expired()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self):
+        if self._executor is None:
+            return
+        for _ in self._dispatchers:
+            try:
+                self._pending.put(None, timeout=1)
+            except queue.Full:
+                break
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._dispatchers = []